@@ -2,59 +2,175 @@ import logging
 import traceback
 
 import regex
-import requests
-import urllib3
 
-from services import SettingsService
-from services.ImageService import RecordImage
+from element_finder import ImageFetcher
+from services import SettingsService, CompiledRuleService
 
 settings_service = SettingsService.service
+CompiledRuleService = CompiledRuleService.service
 
+trailing_comma_regex = regex.compile(',(?=\\d{1,2}\\b)')
+delimiter_regex = regex.compile('[,\\.](?=\\d{3})')
+non_number_regex = regex.compile('[^\\d\\.]')
 
-def parse_attribute(attribute, values, driver=None, default_images=None):
+date_separator_regex = regex.compile(r'[\s,/\\]')
+year_regex = regex.compile('\\d{4}$|^\\d{4}')
+month_regex = regex.compile('\\d{1,2}\\.y$|^y\\.\\d{1,2}')
+year_placeholder_regex = regex.compile('.?y.?')
+day_regex = regex.compile(r'^\d{1,2}')
+
+
+# Types that never read conversions and constraints, rules of any other type are compiled for get_numeric_value
+NON_NUMERIC_TYPES = {'text', 'link', 'date', 'image_link'}
+
+
+class ParsingRule:
+    """
+    Attribute rule compiled once for parsing: conversions are precompiled, translations are lowercased
+    when the rule ignores case and constraints are read, so parse only applies the parser of the rule type.
+    """
+    __slots__ = ('rule', 'type', 'translations', 'ignore_case', 'conversions', 'has_constraints',
+                 'discard_smaller_than', 'discard_percent', 'prioritize_nth_biggest', 'parse')
+
+    def __init__(self, rule):
+        self.rule = rule
+        self.type = rule.get('type')
+        tags = rule.get('tags')
+
+        self.translations = None
+        self.ignore_case = False
+        if tags is not None and 'translated' in tags:
+            self.translations = rule.get('translations') or {}
+            self.ignore_case = 'ignore_case' in tags
+            if self.ignore_case:
+                self.translations = {k.lower(): v for k, v in self.translations.items()}
+
+        self.conversions = []
+        self.has_constraints = False
+        self.discard_smaller_than = None
+        self.discard_percent = False
+        self.prioritize_nth_biggest = None
+
+        if self.type not in NON_NUMERIC_TYPES:
+            self.compile_numeric(tags or [])
+
+        parsers = {
+            'text': self.parse_text if self.translations is None else self.parse_translated,
+            'float': self.get_numeric_value,
+            'int': self.parse_int,
+            'link': parse_first,
+            'date': parse_date,
+            'image_link': get_image
+        }
+        self.parse = parsers.get(self.type, parse_none)
+
+    def compile_numeric(self, tags):
+        # Conversions are case-insensitive when the attribute is, the same as its value regex
+        ignore_case = 'ignore_case' in tags
+        for conversion in self.rule.get('conversions') or []:
+            conversion_regex = conversion.get('regex')
+            if conversion_regex is not None:
+                conversion_regex = CompiledRuleService.get_regex(conversion_regex, ignore_case)
+            self.conversions.append((conversion_regex, conversion.get('multiplier')))
+
+        constraints = self.rule.get('constraints')
+        if constraints is None:
+            return
+        self.has_constraints = True
+
+        if 'discard_smaller_than' in constraints:
+            discard_smaller_than = constraints['discard_smaller_than']
+
+            if discard_smaller_than.endswith('%'):
+                self.discard_percent = True
+                self.discard_smaller_than = float(discard_smaller_than[:-1]) / 100
+            else:
+                self.discard_smaller_than = float(discard_smaller_than)
+
+        if 'prioritize_nth_biggest' in constraints:
+            self.prioritize_nth_biggest = constraints['prioritize_nth_biggest']
+
+    def parse_text(self, values, driver=None, default_images=None, image_fetcher=None):
+        return values[0]
+
+    def parse_translated(self, values, driver=None, default_images=None, image_fetcher=None):
+        value = values[0]
+        if self.ignore_case:
+            value = value.lower()
+
+        return self.translations.get(value, value)
+
+    def get_numeric_value(self, values, driver=None, default_images=None, image_fetcher=None):
+        return self.apply_constraints(self.convert_values(values))
+
+    def parse_int(self, values, driver=None, default_images=None, image_fetcher=None):
+        return int(self.get_numeric_value(values))
+
+    def convert_values(self, values):
+        """
+        Convert all candidate values of a block to floats and apply the conversions of the rule
+        """
+        conversions = self.conversions
+        return [get_float(value) * get_multiplier(conversions, value) for value in values]
+
+    def apply_constraints(self, values):
+        if not self.has_constraints:
+            return values[0]
+
+        final_value = values[0]
+        sorted_values = sorted(values, reverse=True)
+
+        if self.discard_smaller_than is not None:
+            discard_smaller_than = self.discard_smaller_than
+            if self.discard_percent:
+                discard_smaller_than = sorted_values[0] * discard_smaller_than
+
+            sorted_values = [value for value in sorted_values if value >= discard_smaller_than]
+            final_value = sorted_values[0]
+
+        if self.prioritize_nth_biggest is not None and len(sorted_values) >= self.prioritize_nth_biggest:
+            final_value = sorted_values[self.prioritize_nth_biggest - 1]
+
+        return final_value
+
+
+def get_rule(attribute):
+    """
+    :return: The parsing rule of the attribute rule, built once per compiled rule of the current settings version
+    """
+    compiled_rule = CompiledRuleService.get_rule(attribute)
+    if compiled_rule.parsing_rule is None:
+        compiled_rule.parsing_rule = ParsingRule(attribute)
+
+    return compiled_rule.parsing_rule
+
+
+def parse_attribute(attribute, values, driver=None, default_images=None, image_fetcher=None):
     """
     Given potential values, parse the best value for the attribute.
     :param attribute: Attribute rule
     :param values: List of potential values
     :param driver: Selenium driver
-    :param default_images: List of default images
+    :param default_images: Set of default image hashes
+    :param image_fetcher: ImageFetcher of the page, a new one is created from the driver if None
     :return: The best value for the given attribute
     """
-
-    attribute_type = attribute.get('type')
-
     if values is None or len(values) == 0:
         return None
 
-    if attribute_type == 'text':
-        value = values[0]
+    return get_rule(attribute).parse(values, driver, default_images, image_fetcher)
 
-        if attribute.get('tags') is None:
-            return value
 
-        if 'translated' in attribute.get('tags'):
-            translations = attribute.get('translations') or {}
+def parse_first(values, driver=None, default_images=None, image_fetcher=None):
+    return values[0]
 
-            if 'ignore_case' in attribute.get('tags'):
-                value = value.lower()
-                translations = {k.lower(): v for k, v in translations.items()}
 
-            if value in translations:
-                return translations[value]
+def parse_date(values, driver=None, default_images=None, image_fetcher=None):
+    return get_date(values[0])
 
-        return value
-    elif attribute_type == 'float':
-        return get_numeric_value(attribute, values)
-    elif attribute_type == 'int':
-        return int(get_numeric_value(attribute, values))
-    elif attribute_type == 'link':
-        return values[0]
-    elif attribute_type == 'date':
-        return get_date(values[0])
-    elif attribute_type == 'image_link':
-        return get_image(values, driver, default_images)
-    else:
-        return None
+
+def parse_none(values, driver=None, default_images=None, image_fetcher=None):
+    return None
 
 
 def get_numeric_value(attribute, values):
@@ -62,11 +178,7 @@ def get_numeric_value(attribute, values):
     :return: The best value for the given attribute, depending on the attribute's constraints.
              If no constraints are set, the first value is returned.
     """
-
-    converted_values = convert_values(attribute, values)
-    final_value = apply_constraints(converted_values, attribute)
-
-    return final_value
+    return get_rule(attribute).get_numeric_value(values)
 
 
 def convert_values(attribute, values):
@@ -76,77 +188,40 @@ def convert_values(attribute, values):
     :param values: List of values to convert
     :return: The converted values
     """
-    tags = attribute.get('tags')
-
-    case_sensitive = True
-    if tags is not None:
-        case_sensitive = 'ignore_case' not in tags
-
-    conversions = attribute.get('conversions')
-    converted_values = []
-
-    for value in values:
-        converted_values.append(convert_value(conversions, value, case_sensitive))
-
-    return converted_values
+    return get_rule(attribute).convert_values(values)
 
 
 def convert_value(conversions, value, case_sensitive=True):
-    found_multiplier = 1
+    compiled_conversions = []
 
     if conversions is not None:
         for conversion in conversions:
-            conversion_regex = conversion.get('regex')
-            if case_sensitive is False:
-                conversion_regex = regex.compile(conversion_regex, regex.IGNORECASE)
-
-            conversion_multiplier = conversion.get('multiplier')
+            conversion_regex = CompiledRuleService.get_regex(conversion.get('regex'), case_sensitive is False)
+            compiled_conversions.append((conversion_regex, conversion.get('multiplier')))
 
-            found_value = regex.search(conversion_regex, value)
-            if found_value is not None:
-                found_multiplier = conversion_multiplier
-                break
+    return get_float(value) * get_multiplier(compiled_conversions, value)
 
-    return get_float(value) * found_multiplier
 
+def get_multiplier(compiled_conversions, value):
+    """
+    :param compiled_conversions: List of (compiled regex, multiplier)
+    :return: Multiplier of the first matching conversion, or 1
+    """
+    for conversion_regex, conversion_multiplier in compiled_conversions:
+        if conversion_regex.search(value) is not None:
+            return conversion_multiplier
 
-def apply_constraints(values, attribute):
-    constraints = attribute.get('constraints')
-
-    final_value = values[0]
-
-    if constraints is None:
-        return final_value
-
-    sorted_values = sorted(values, reverse=True)
-
-    if 'discard_smaller_than' in constraints:
-        discard_smaller_than = constraints['discard_smaller_than']
-
-        if discard_smaller_than.endswith('%'):
-            percent_value = float(discard_smaller_than[:-1])
-            discard_smaller_than = sorted_values[0] * (percent_value / 100)
-        else:
-            discard_smaller_than = float(discard_smaller_than)
-
-        for value in sorted_values.copy():
-            if value < discard_smaller_than:
-                sorted_values.remove(value)
-
-        final_value = sorted_values[0]
+    return 1
 
-    if 'prioritize_nth_biggest' in constraints:
-        prioritize_nth_biggest = constraints['prioritize_nth_biggest']
-        if len(sorted_values) >= prioritize_nth_biggest:
-            final_value = sorted_values[prioritize_nth_biggest - 1]
 
-    return final_value
+def apply_constraints(values, attribute):
+    return get_rule(attribute).apply_constraints(values)
 
 
 def get_float(string):
-    replaced_trailing_comma = regex.sub(',(?=\\d{1,2}\\b)', '.', string)
-    replaced_delimiter = regex.sub('[,\\.](?=\\d{3})', '', replaced_trailing_comma)
-    replaced_non_numbers = regex.sub('[^\\d\\.]', '', replaced_delimiter)
+    replaced_trailing_comma = trailing_comma_regex.sub('.', string)
+    replaced_delimiter = delimiter_regex.sub('', replaced_trailing_comma)
+    replaced_non_numbers = non_number_regex.sub('', replaced_delimiter)
 
     return float(replaced_non_numbers)
 
@@ -155,9 +230,8 @@ def get_date(string):
     if string is None:
         return None
 
-    string = regex.sub(r'[\s,/\\]', '.', string)
+    string = date_separator_regex.sub('.', string)
 
-    year_regex = regex.compile('\\d{4}$|^\\d{4}')
     year = regex.search(year_regex, string)
     if year is None:
         return None
@@ -166,18 +240,17 @@ def get_date(string):
 
     day_month = regex.sub(year_regex, 'y', string)
 
-    month_regex = regex.compile('\\d{1,2}\\.y$|^y\\.\\d{1,2}')
     month = regex.search(month_regex, day_month)
 
     if month is None:
         return f'{final_date}-01-01'
 
-    final_month = regex.sub('.?y.?', '', month.group(0))
+    final_month = year_placeholder_regex.sub('', month.group(0))
 
     final_date = f"{final_date}-{final_month}"
 
     day = regex.sub(regex.escape(month.group(0)), '', day_month)
-    day = regex.search(r'^\d{1,2}', day)
+    day = regex.search(day_regex, day)
 
     if day is None:
         return f'{final_date}-01'
@@ -185,20 +258,29 @@ def get_date(string):
     return f"{final_date}-{day.group(0)}"
 
 
-def get_image(links, driver, default_images):
+def get_image(links, driver, default_images, image_fetcher=None):
     """
     Get the record image from the given links
     :return: First record image found
     """
 
-    if driver is None:
-        return None
+    if image_fetcher is None:
+        if driver is None:
+            return None
+
+        try:
+            image_fetcher = ImageFetcher.ImageFetcher(driver)
+        except SystemExit or KeyboardInterrupt:
+            exit(-1)
+        except:
+            logging.error(f"Failed to read the user agent and cookies of the page!\n{traceback.format_exc()}")
+            return None
 
     for image_link in links:
         if image_link is None:
             continue
 
-        record_image = get_record_image(image_link, driver)
+        record_image = get_record_image(image_link, image_fetcher, default_images)
 
         if record_image is None:
             continue
@@ -211,54 +293,16 @@ def get_image(links, driver, default_images):
     return None
 
 
-def get_record_image(image_link, driver):
+def get_record_image(image_link, image_fetcher, default_images=None):
     """
     Download the record image if possible
     :param image_link: The image link
-    :param driver: The driver to use
+    :param image_fetcher: ImageFetcher of the page
+    :param default_images: Set of default image hashes
     :return: The formatted image
     """
     try:
-        with requests.Session() as session:
-            urllib3.disable_warnings()
-            session.verify = False
-
-            selenium_user_agent = driver.execute_script("return navigator.userAgent;")
-            session.headers.update({"user-agent": selenium_user_agent})
-
-            for cookie in driver.get_cookies():
-                session.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'])
-
-            if not image_link.startswith('http'):
-                return None
-
-            try:
-                response = session.request("GET", image_link, stream=True)
-            except SystemExit or KeyboardInterrupt:
-                exit(-1)
-            except:
-                logging.warning(f"Failed to download image: {image_link}!\n{traceback.format_exc()}")
-                return None
-
-            if not response.ok:
-                return None
-
-            try:
-                image_extension = response.headers['Content-Type'].split('/')[1]
-            except SystemExit or KeyboardInterrupt:
-                exit(-1)
-            except:
-                image_extension = image_link.split('.')[-1]
-
-            try:
-                return RecordImage(image_link,
-                                    image_extension,
-                                    response.content)
-            except SystemExit or KeyboardInterrupt:
-                exit(-1)
-            except:
-                logging.error(f"Failed to create record image: {image_link}!\n{traceback.format_exc()}")
-                return None
+        return image_fetcher.download(image_link, default_images)
     except SystemExit or KeyboardInterrupt:
         exit(-1)
     except:
@@ -0,0 +1,127 @@
+import numpy as np
+
+from element_finder import TagPaths
+
+
+class BlockFeatures:
+    """
+    Feature matrix of the candidate blocks of a page, so decisions about all blocks are made with array operations:
+    depth, xpath steps as ids padded with -1, the label counts, text length, sibling index and scraper-index
+    of each block. Each column is only computed when it is first needed, label counts only for the labels given.
+    """
+    def __init__(self, tags, annotations=None, labels=None, tag_paths=None):
+        self.tags = tags
+        self.annotations = annotations
+        self.labels = labels or []
+        self.tag_paths = tag_paths
+
+        self.depths = None
+        self.paths = None
+        self.label_counts = None
+        self.scraper_indexes = None
+
+    def get_paths(self):
+        """
+        :return: Matrix of the xpath step ids of the blocks, rows are padded with -1 after the depth of the block
+        """
+        if self.paths is not None:
+            return self.paths
+
+        if self.tag_paths is None:
+            self.tag_paths = TagPaths.TagPaths()
+
+        step_ids = {}
+        block_paths = []
+        for tag in self.tags:
+            block_paths.append([step_ids.setdefault(step, len(step_ids)) for step in self.tag_paths.get_path(tag)])
+
+        self.depths = np.array([len(path) for path in block_paths], dtype=np.int64)
+        self.paths = np.full((len(block_paths), max(self.depths, default=0)), -1, dtype=np.int64)
+        for block_index, path in enumerate(block_paths):
+            self.paths[block_index, :len(path)] = path
+
+        return self.paths
+
+    def get_distances(self, block_index):
+        """
+        :return: Distances from the block to every block, the same as TagPaths.get_path_distance
+        """
+        paths = self.get_paths()
+        depths = self.depths
+        depth = depths[block_index]
+
+        # Length of the common prefix, padding only matches past the end of both paths
+        common_length = np.cumprod(paths == paths[block_index], axis=1).sum(axis=1)
+        min_depths = np.minimum(depths, depth)
+        common_length = np.minimum(common_length, min_depths)
+
+        distances = depths + depth - 2 * common_length - 1
+        contained = common_length == min_depths
+        distances[contained] = np.abs(depths[contained] - depth) + 1
+        distances[contained & (depths == depth)] = 0
+
+        return distances
+
+    def get_groups(self, max_distance):
+        """
+        Group the blocks the same way as comparing each ungrouped block with all blocks in order:
+        every block within max_distance joins the group, and moves to it if it was in an earlier group
+        :return: List of arrays of the block indexes of each group, array of the last group id of each block
+        """
+        groups = []
+        group_ids = np.full(len(self.tags), -1, dtype=np.int64)
+
+        ungrouped = np.ones(len(self.tags), dtype=bool)
+        while ungrouped.any():
+            block_index = int(np.argmax(ungrouped))
+
+            members = np.flatnonzero(self.get_distances(block_index) <= max_distance)
+            group_ids[members] = len(groups)
+            ungrouped[members] = False
+            ungrouped[block_index] = False
+
+            groups.append(members)
+
+        return groups, group_ids
+
+    def get_label_counts(self):
+        """
+        :return: Matrix of the number of values of each label in each block and its descendants
+        """
+        if self.label_counts is not None:
+            return self.label_counts
+
+        self.label_counts = np.zeros((len(self.tags), len(self.labels)), dtype=np.int64)
+        for block_index, tag in enumerate(self.tags):
+            tag_counts = self.annotations.get_counts(tag)
+            for label_index, label in enumerate(self.labels):
+                self.label_counts[block_index, label_index] = tag_counts.get(label, 0)
+
+        return self.label_counts
+
+    def has_any_label(self):
+        """
+        :return: Boolean array of the blocks with values of any of the labels
+        """
+        if len(self.labels) == 0:
+            return np.zeros(len(self.tags), dtype=bool)
+        return (self.get_label_counts() > 0).any(axis=1)
+
+    def get_scraper_indexes(self):
+        """
+        :return: Array of the scraper-index of each block, -1 for tags without one
+        """
+        if self.scraper_indexes is None:
+            self.scraper_indexes = np.array([int(tag.attrs.get('scraper-index', -1)) for tag in self.tags],
+                                            dtype=np.int64)
+        return self.scraper_indexes
+
+    def is_repeated(self):
+        """
+        :return: Boolean array of the blocks whose tag is an earlier block too, e.g. after moving up to the same parent
+        """
+        scraper_indexes = self.get_scraper_indexes()
+        repeated = np.ones(len(self.tags), dtype=bool)
+        repeated[np.unique(scraper_indexes, return_index=True)[1]] = False
+        repeated[scraper_indexes < 0] = False
+        return repeated
@@ -1,13 +1,15 @@
-import json
 import logging
 import timeit
+from collections import deque
 
-from bs4 import NavigableString
+import numpy as np
 
-from element_finder import AttributeParser
-from services import SettingsService
+from element_finder import AttributeParser, TagPaths, NodeSummaries, BlockFeatures, ImageFetcher
+from preprocessing import AnnotationStore
+from services import SettingsService, CompiledRuleService
 
 settings_service = SettingsService.service
+CompiledRuleService = CompiledRuleService.service
 
 
 def find_new_blocks(soup, driver, scraper_settings, records_with_images=None, default_images=None, records=None):
@@ -26,30 +28,80 @@ def find_new_blocks(soup, driver, scraper_settings, records_with_images=None, de
 def find_blocks(soup, driver, scraper_settings, records_with_images=None,
                 default_images=None, record_alias=None, prioritize_first=False):
     if records_with_images is None:
-        records_with_images = []
+        records_with_images = set()
     if default_images is None:
-        default_images = []
+        default_images = set()
 
     required_attributes = get_required_attributes(scraper_settings)
+    annotations = AnnotationStore.get_store(soup)
 
-    remove_untagged(soup)
-    blocks = soup_to_blocks(soup, required_attributes)
-    moved_blocks = move_up_blocks(blocks, required_attributes)
+    remove_untagged(soup, annotations)
+    node_summaries = NodeSummaries.NodeSummaries(soup, required_attributes, annotations)
+    blocks = soup_to_blocks(soup, node_summaries)
+    moved_blocks = move_up_blocks(blocks, node_summaries)
 
     if prioritize_first is True and len(moved_blocks) > 0:
-        moved_blocks = add_all_non_block_children(moved_blocks[0], moved_blocks)
+        moved_blocks = add_all_non_block_children(moved_blocks[0], moved_blocks, annotations)
 
-    culled_blocks = cull_blocks(moved_blocks, scraper_settings)
+    culled_blocks = cull_blocks(moved_blocks, scraper_settings, annotations)
     parsed_blocks = parse_blocks(culled_blocks, driver, scraper_settings, records_with_images, default_images,
                                  record_alias)
 
     return parsed_blocks
 
 
-def remove_untagged(soup):
+def find_template_blocks(container, record_template, driver, scraper_settings, records_with_images=None,
+                         default_images=None, records=None):
+    """
+    Find the blocks of a page through the record template of the locale, without discovering and grouping them
+    :param container: Tagged copy of the container of the template
+    :return: New blocks, or None if the cards don't match the template and the full pipeline has to run
+    """
+    start = timeit.default_timer()
+
+    if records_with_images is None:
+        records_with_images = set()
+    if default_images is None:
+        default_images = set()
+    if records is None:
+        records = {}
+
+    required_attributes = get_required_attributes(scraper_settings)
+    annotations = AnnotationStore.get_store(container)
+
+    # Cards without the required attributes wouldn't be found as blocks either
+    cards = [card for card in record_template.find_cards(container)
+             if NodeSummaries.has_required_attributes(card, required_attributes, annotations)]
+
+    for card in cards:
+        if not record_template.has_fields(card, annotations):
+            logging.info(f"BlockFinder > Card {card.attrs.get('scraper-index')} doesn't match the record template")
+            return None
+
+    culled_blocks = cull_blocks(cards, scraper_settings, annotations)
+    parsed_blocks = parse_blocks(culled_blocks, driver, scraper_settings, records_with_images, default_images, None)
+    unique_blocks = merge_duplicates(parsed_blocks)
+
+    min_record_count = record_template.get_min_record_count(scraper_settings)
+    if len(unique_blocks) < min_record_count:
+        logging.info(f"BlockFinder > Found {len(unique_blocks)} records through the record template, "
+                     f"expected at least {min_record_count}")
+        return None
+
+    for block in unique_blocks:
+        block['parent'] = container.attrs['scraper-index']
+
+    new_blocks = get_new_blocks(unique_blocks, records)
+
+    logging.log(19, f"BlockFinder > Find template blocks {timeit.default_timer() - start:.3f}s")
+
+    return new_blocks
+
+
+def remove_untagged(soup, annotations):
     start = timeit.default_timer()
     for tag in soup.find_all():
-        if 'scraper-counts' not in tag.attrs and 'scraper-fallback-counts' not in tag.attrs:
+        if not annotations.has_counts(tag):
             tag.extract()
 
     logging.log(19, f"BlockFinder > Remove untagged {timeit.default_timer() - start:.3f}s")
@@ -57,18 +109,18 @@ def remove_untagged(soup):
     return soup
 
 
-def soup_to_blocks(soup, required_attributes):
+def soup_to_blocks(soup, node_summaries):
     start = timeit.default_timer()
 
     blocks = []
-    tags = [soup]
+    tags = deque([soup])
 
     while len(tags) > 0:
-        tag = tags.pop(0)
+        tag = tags.popleft()
 
         is_block = True
         for child in tag.children:
-            if has_required_attributes(child, required_attributes):
+            if node_summaries.has_required_attributes(child):
                 tags.append(child)
                 is_block = False
 
@@ -80,44 +132,15 @@ def soup_to_blocks(soup, required_attributes):
     return blocks
 
 
-def has_required_attributes(tag, required_attributes):
-    if isinstance(tag, NavigableString):
-        return False
-
-    tag_counts = json.loads(tag.attrs.get('scraper-counts', '{}'))
-    tag_counts.update(json.loads(tag.attrs.get('scraper-fallback-counts', '{}')))
-
-    for required_attribute in required_attributes:
-        if required_attribute in tag_counts:
-            continue
-
-        return False
-
-    return True
-
-
-def has_anti_attributes(tag, anti_attributes):
-    if isinstance(tag, NavigableString):
-        return False
-
-    tag_counts = json.loads(tag.attrs.get('scraper-counts', '{}'))
-
-    for anti_attribute in anti_attributes:
-        if anti_attribute in tag_counts:
-            return True
-
-    return False
-
-
 def get_required_attributes(scraper_settings):
     start = timeit.default_timer()
 
-    attribute_rules = settings_service.get_attribute_rules(scraper_settings.scraper_type)
+    compiled_rules = CompiledRuleService.get_rules(scraper_settings.scraper_type)
     required_attributes = []
 
-    for rule in attribute_rules:
-        if rule.get('required') is True:
-            required_attributes.append(rule['name'])
+    for compiled_rule in compiled_rules:
+        if compiled_rule.required:
+            required_attributes.append(compiled_rule.name)
 
     logging.log(19, f"BlockFinder > Get required attributes {timeit.default_timer() - start:.3f}s")
 
@@ -127,19 +150,19 @@ def get_required_attributes(scraper_settings):
 def get_anti_attributes(scraper_settings):
     start = timeit.default_timer()
 
-    attribute_rules = settings_service.get_attribute_rules(scraper_settings.scraper_type)
+    compiled_rules = CompiledRuleService.get_rules(scraper_settings.scraper_type)
     anti_attributes = []
 
-    for rule in attribute_rules:
-        if 'anti_attribute' in rule['tags']:
-            anti_attributes.append(rule['name'])
+    for compiled_rule in compiled_rules:
+        if compiled_rule.anti_attribute:
+            anti_attributes.append(compiled_rule.name)
 
     logging.log(19, f"BlockFinder > Get anti-attributes {timeit.default_timer() - start:.3f}s")
 
     return anti_attributes
 
 
-def move_up_blocks(blocks, required_attributes):
+def move_up_blocks(blocks, node_summaries):
     start = timeit.default_timer()
 
     if len(blocks) == 1:
@@ -148,7 +171,7 @@ def move_up_blocks(blocks, required_attributes):
     moved_blocks = []
 
     for block in blocks:
-        moved_block = move_up_block(block, required_attributes)
+        moved_block = move_up_block(block, node_summaries)
         moved_blocks.append(moved_block)
 
     logging.log(19, f"BlockFinder > Move up blocks {timeit.default_timer() - start:.3f}s")
@@ -156,40 +179,29 @@ def move_up_blocks(blocks, required_attributes):
     return moved_blocks
 
 
-def move_up_block(block, required_attributes):
+def move_up_block(block, node_summaries):
     while block.parent is not None:
         if block.name == 'body':
             return block
-        if len(list(block.parent.children)) == 1:
+        if len(block.parent.contents) == 1:
             block = block.parent
             continue
-        for child in block.parent.children:
-            if child == block:
-                continue
-            if not has_required_attributes(child, required_attributes):
-                continue
-            if get_alias(child) is not None and get_alias(child) != get_alias(block):
-                return block
+        if node_summaries.has_other_alias(block):
+            return block
 
         block = block.parent
     return block
 
 
-def get_alias(tag):
-    aliases = find_attribute_values(tag, 'alias')
-    if len(aliases) == 0:
-        return None
-    return aliases[0]
-
-
-def cull_blocks(blocks, scraper_settings):
+def cull_blocks(blocks, scraper_settings, annotations):
     start = timeit.default_timer()
     anti_attributes = get_anti_attributes(scraper_settings)
 
-    culled_blocks = []
-    for block in blocks:
-        if not has_anti_attributes(block, anti_attributes):
-            culled_blocks.append(block)
+    block_features = BlockFeatures.BlockFeatures(blocks, annotations, anti_attributes)
+    # Blocks that moved up to the same tag would only be parsed again and merged as duplicates
+    culled = block_features.has_any_label() | block_features.is_repeated()
+
+    culled_blocks = [block for block, is_culled in zip(blocks, culled) if not is_culled]
 
     logging.log(19, f"BlockFinder > Cull blocks {timeit.default_timer() - start:.3f}s")
 
@@ -200,12 +212,30 @@ def parse_blocks(blocks, driver, scraper_settings, records_with_images, default_
     start = timeit.default_timer()
 
     parsed_blocks = []
+    if len(blocks) == 0:
+        return parsed_blocks
+
+    annotations = AnnotationStore.get_store(blocks[0])
+
+    # Record images are downloaded together after all blocks are parsed
+    pending_images = None
+    image_fetcher = None
+    if settings_service.get_scraper_setting('hash_record_images', scraper_settings.scraper_type) is True:
+        image_fetcher = ImageFetcher.get_fetcher(driver, scraper_settings)
+        if image_fetcher is not None:
+            pending_images = []
 
     for block in blocks:
-        parsed_block = parse_block(block, driver, scraper_settings, records_with_images, default_images, record_alias)
+        parsed_block = parse_block(block, driver, scraper_settings, records_with_images, default_images, record_alias,
+                                   annotations, pending_images, image_fetcher)
         if parsed_block is not None:
             parsed_blocks.append(parsed_block)
 
+    if pending_images is not None and len(pending_images) > 0:
+        record_images = image_fetcher.fetch_images([links for parsed_block, links in pending_images], default_images)
+        for (parsed_block, links), record_image in zip(pending_images, record_images):
+            parsed_block['record_image'] = record_image
+
     logging.log(19, f"BlockFinder > Parse blocks {timeit.default_timer() - start:.3f}s")
 
     return parsed_blocks
@@ -243,15 +273,25 @@ def get_new_blocks(parsed_blocks, records):
     return new_blocks
 
 
-def parse_block(block, driver, scraper_settings, records_with_images, default_images, record_alias):
-    attribute_rules = settings_service.get_attribute_rules(scraper_settings.scraper_type)
+def parse_block(block, driver, scraper_settings, records_with_images, default_images, record_alias, annotations,
+                pending_images=None, image_fetcher=None):
+    """
+    :param pending_images: List to add the parsed block and its image links to, to download the image later.
+                           If None, the image is downloaded while parsing.
+    :param image_fetcher: ImageFetcher of the page, used to download images while parsing
+    """
+    compiled_rules = CompiledRuleService.get_rules(scraper_settings.scraper_type)
     hash_record_images = settings_service.get_scraper_setting('hash_record_images', scraper_settings.scraper_type)
 
+    block_values, fallback_values = collect_values(block, annotations)
+
     parsed_block = {}
 
-    for attribute in attribute_rules:
-        name = attribute.get('name')
-        values = find_attribute_values(block, name)
+    for compiled_rule in compiled_rules:
+        attribute = compiled_rule.rule
+        name = compiled_rule.name
+
+        values = block_values.get(name) or fallback_values.get(name)
 
         if values is None or len(values) == 0:
             parsed_block[name] = attribute.get('default')
@@ -260,7 +300,12 @@ def parse_block(block, driver, scraper_settings, records_with_images, default_im
         if name == 'record_image':
             record_alias = record_alias or parsed_block['alias']
             if hash_record_images is True and record_alias not in records_with_images:
-                parsed_value = AttributeParser.parse_attribute(attribute, values, driver, default_images)
+                if pending_images is not None and attribute.get('type') == 'image_link':
+                    parsed_block[name] = None
+                    pending_images.append((parsed_block, values))
+                    continue
+
+                parsed_value = AttributeParser.parse_attribute(attribute, values, driver, default_images, image_fetcher)
                 parsed_block[name] = parsed_value
             continue
 
@@ -273,28 +318,25 @@ def parse_block(block, driver, scraper_settings, records_with_images, default_im
     return parsed_block
 
 
-def find_attribute_values(tag, name):
-    tags = [tag]
-    tags.extend(tag.find_all())
-
-    found_values = find_values(tags, name, 'scraper-data')
-
-    if len(found_values) > 0:
-        return found_values
-
-    return find_values(tags, name, 'scraper-fallback')
-
-
-def find_values(tags, name, data_attribute):
-    found_values = []
+def collect_values(block, annotations):
+    """
+    Collect the values of all labels in the block and its descendants with a single walk over the block
+    :return: Dicts of label: values in document order for the data and the fallback values
+    """
+    block_values = {}
+    fallback_values = {}
 
+    tags = [block]
+    tags.extend(block.find_all())
     for tag in tags:
-        if tag.attrs is not None and data_attribute in tag.attrs:
-            data = json.loads(tag.attrs[data_attribute])
-            if name in data:
-                found_values.extend(data[name])
+        tag_data = annotations.get_data(tag)
+        fallback_data = annotations.get_data(tag, AnnotationStore.FALLBACK)
+        for label, values in tag_data.items():
+            block_values.setdefault(label, []).extend(values)
+        for label, values in fallback_data.items():
+            fallback_values.setdefault(label, []).extend(values)
 
-    return found_values
+    return block_values, fallback_values
 
 
 def get_xpath(tag):
@@ -327,28 +369,21 @@ def get_largest_group(blocks, scraper_settings):
     start = timeit.default_timer()
 
     max_tag_distance = settings_service.get_scraper_setting('max_tag_distance', scraper_settings.scraper_type)
-    groups = []
 
-    for block in blocks:
-        if 'group_id' in block:
-            continue
-
-        group = []
+    # Distances from each ungrouped block to all blocks are computed at once on the path matrix of the blocks
+    tag_paths = TagPaths.TagPaths()
+    block_features = BlockFeatures.BlockFeatures([block['tag'] for block in blocks], tag_paths=tag_paths)
+    groups, group_ids = block_features.get_groups(max_tag_distance)
 
-        for other_block in blocks:
-            distance = get_distance(block['tag'], other_block['tag'])
-            if distance <= max_tag_distance:
-                other_block['group_id'] = len(groups)
-                group.append(other_block)
+    for block, group_id in zip(blocks, group_ids):
+        if group_id >= 0:
+            block['group_id'] = int(group_id)
 
-        groups.append(group)
+    # The first of the largest groups, with its blocks in page order
+    group_sizes = [len(group) for group in groups]
+    longest_group = [blocks[block_index] for block_index in groups[int(np.argmax(group_sizes))]]
 
-    longest_group = []
-    for group in groups:
-        if len(group) > len(longest_group):
-            longest_group = group
-
-    block_parent = find_parent_block(longest_group)
+    block_parent = find_parent_block(longest_group, tag_paths)
     for block in longest_group:
         block['parent'] = block_parent.attrs['scraper-index']
 
@@ -358,45 +393,45 @@ def get_largest_group(blocks, scraper_settings):
 
 
 def get_distance(tag, other_tag):
-    block_xpath = get_xpath(tag)[1:].split('/')
-    other_block_xpath = get_xpath(other_tag)[1:].split('/')
+    return TagPaths.TagPaths().get_distance(tag, other_tag)
 
-    block_length = len(block_xpath)
-    other_block_length = len(other_block_xpath)
 
-    tag_index = 0
-    for tag_index in range(min(block_length, other_block_length)):
-        if block_xpath[tag_index] != other_block_xpath[tag_index]:
-            break
+def find_parent_block(blocks, tag_paths=None):
+    """
+    :return: Closest ancestor of the first block that is an ancestor of all blocks
+    """
+    if tag_paths is None:
+        tag_paths = TagPaths.TagPaths()
 
-    block_distance = block_length - tag_index - 1
-    other_block_distance = other_block_length - tag_index - 1
-
-    distance = block_distance + other_block_distance + 1
-
-    if distance == 1 and block_xpath[tag_index] == other_block_xpath[tag_index]:
-        distance = 0  # same tag
+    ancestors = []
+    ancestor_depths = {}
+    parent_block = blocks[0]['tag'].parent
+    while parent_block is not None:
+        ancestor_depths[id(parent_block)] = len(ancestors)
+        ancestors.append(parent_block)
+        parent_block = parent_block.parent
 
-    return distance
+    # Lowest common ancestor of all blocks, ancestors from there up contain every block
+    common_depth = 0
+    for block in blocks:
+        parent_block = block['tag'].parent
+        while parent_block is not None and id(parent_block) not in ancestor_depths:
+            parent_block = parent_block.parent
+        if parent_block is None:
+            common_depth = len(ancestors)
+            break
+        common_depth = max(common_depth, ancestor_depths[id(parent_block)])
 
+    # Closer ancestors can still contain a block through an equal ancestor of it
+    for depth in range(common_depth):
+        if all(tag_paths.has_equal_ancestor(block['tag'], ancestors[depth]) for block in blocks):
+            return ancestors[depth]
 
-def find_parent_block(blocks):
-    parent_block = blocks[0]['tag'].parent
-    found_parent = False
-    while found_parent is False and parent_block is not None:
-        found_parent = True
-        for block in blocks:
-            tag = block['tag']
-            if not is_parent(tag, parent_block):
-                parent_block = parent_block.parent
-                found_parent = False
-                break
-
-    if parent_block is None:
+    if common_depth == len(ancestors):
         logging.warning(f"Could not find parent block!")
         return blocks[0]['tag']
 
-    return parent_block
+    return ancestors[common_depth]
 
 
 def is_parent(tag, parent):
@@ -407,7 +442,7 @@ def is_parent(tag, parent):
     return False
 
 
-def add_all_non_block_children(block, record_blocks):
+def add_all_non_block_children(block, record_blocks, annotations):
     parent = block.parent
     if parent is None:
         return record_blocks
@@ -421,27 +456,6 @@ def add_all_non_block_children(block, record_blocks):
 
     for tag in non_block_tags:
         block.append(tag)
-
-        tag_scraper_counts = json.loads(tag.attrs.get('scraper-counts', '{}'))
-        block_scraper_counts = json.loads(block.attrs.get('scraper-counts', '{}'))
-
-        for scraper_count in tag_scraper_counts:
-            if scraper_count not in block_scraper_counts:
-                block_scraper_counts[scraper_count] = tag_scraper_counts[scraper_count]
-            else:
-                block_scraper_counts[scraper_count] += tag_scraper_counts[scraper_count]
-
-        block.attrs['scraper-counts'] = json.dumps(block_scraper_counts)
-
-        tag_scraper_fallback_counts = json.loads(tag.attrs.get('scraper-fallback-counts', '{}'))
-        block_scraper_fallback_counts = json.loads(block.attrs.get('scraper-fallback-counts', '{}'))
-
-        for scraper_fallback_count in tag_scraper_fallback_counts:
-            if scraper_fallback_count not in block_scraper_fallback_counts:
-                block_scraper_fallback_counts[scraper_fallback_count] = tag_scraper_fallback_counts[scraper_fallback_count]
-            else:
-                block_scraper_fallback_counts[scraper_fallback_count] += tag_scraper_fallback_counts[scraper_fallback_count]
-
-        block.attrs['scraper-fallback-counts'] = json.dumps(block_scraper_fallback_counts)
+        annotations.merge_counts(tag, block)
 
     return record_blocks
@@ -0,0 +1,252 @@
+import hashlib
+import http.cookiejar
+import logging
+import threading
+import timeit
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+from scrapers.ScraperSettings import ScraperSettings
+from services import SettingsService, ImageCacheService
+from services.ImageService import RecordImage
+
+settings_service = SettingsService.service
+
+MAX_SESSIONS = 32
+CHUNK_SIZE = 64 * 1024
+
+sessions = {}
+sessions_lock = threading.Lock()
+
+
+class ImageFetcher:
+    """
+    Downloads the record images of a page. The user agent and cookies of the driver are read once per page,
+    and images are downloaded concurrently on keep-alive sessions shared by all pages of the same host and proxy.
+    With an image cache, images downloaded in earlier runs are only revalidated instead of downloaded again.
+    Images that are kept for uploading need their bytes, so then only cached default images are reused.
+    """
+    def __init__(self, driver, proxy=None, thread_count=8, timeout=10, keep_images=True, image_cache=None):
+        self.user_agent = driver.execute_script("return navigator.userAgent;")
+        self.cookies = requests.cookies.RequestsCookieJar()
+        for cookie in driver.get_cookies():
+            self.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'])
+
+        self.proxy = proxy
+        self.thread_count = thread_count
+        self.timeout = timeout
+        self.keep_images = keep_images
+        self.image_cache = image_cache
+
+        # Images of the page by link, pages often use the same image for many records
+        self.images = {}
+
+    def download(self, image_link, default_images=None):
+        """
+        Download the record image if possible. The image is hashed while it is streamed, and its bytes are only kept
+        if keep_images is set. Images in the image cache are reused or revalidated with a conditional request.
+        :param default_images: Set of default image hashes, cached default images are reused even if keep_images is set
+        :return: The record image, or None if it couldn't be downloaded
+        """
+        if not image_link.startswith('http'):
+            return None
+
+        cached_image = None
+        headers = {"user-agent": self.user_agent}
+        if self.image_cache is not None:
+            cached_image = self.image_cache.get(image_link)
+            if cached_image is not None and self.keep_images and cached_image['hash'] not in (default_images or ()):
+                cached_image = None
+
+            if cached_image is not None:
+                if self.image_cache.is_fresh(cached_image):
+                    self.image_cache.count_hit()
+                    return RecordImage(image_link, cached_image['extension'], None, cached_image['hash'])
+                headers.update(self.image_cache.get_headers(cached_image))
+
+        session = get_session(urlsplit(image_link).netloc, self.proxy, self.thread_count)
+
+        try:
+            response = session.request("GET", image_link, headers=headers,
+                                       cookies=self.cookies, stream=True, timeout=self.timeout)
+        except SystemExit or KeyboardInterrupt:
+            exit(-1)
+        except:
+            logging.warning(f"Failed to download image: {image_link}!\n{traceback.format_exc()}")
+            return None
+
+        with response:
+            if cached_image is not None and is_unchanged(response, cached_image):
+                self.image_cache.count_revalidated()
+                self.image_cache.put(image_link, cached_image['hash'], cached_image['extension'],
+                                     etag=cached_image.get('etag'), last_modified=cached_image.get('last_modified'),
+                                     content_length=cached_image.get('content_length'))
+                return RecordImage(image_link, cached_image['extension'], None, cached_image['hash'])
+
+            if not response.ok:
+                return None
+
+            try:
+                image_extension = response.headers['Content-Type'].split('/')[1]
+            except SystemExit or KeyboardInterrupt:
+                exit(-1)
+            except:
+                image_extension = image_link.split('.')[-1]
+
+            try:
+                image, image_hash = self.read_image(response)
+            except SystemExit or KeyboardInterrupt:
+                exit(-1)
+            except:
+                logging.error(f"Failed to create record image: {image_link}!\n{traceback.format_exc()}")
+                return None
+
+        if self.image_cache is not None:
+            self.image_cache.count_miss()
+            self.image_cache.put(image_link, image_hash, image_extension,
+                                 etag=response.headers.get('ETag'), last_modified=response.headers.get('Last-Modified'),
+                                 content_length=response.headers.get('Content-Length'))
+
+        return RecordImage(image_link, image_extension, image, image_hash)
+
+    def read_image(self, response):
+        """
+        Hash the image while it is streamed, so only images that are kept are held in memory
+        :return: The image, or None if keep_images isn't set, and the hash of the image
+        """
+        image_hash = hashlib.sha256()
+        chunks = [] if self.keep_images else None
+        size = 0
+
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            image_hash.update(chunk)
+            size += len(chunk)
+            if chunks is not None:
+                chunks.append(chunk)
+
+        # Empty images have no hash, the same as RecordImage.get_hash
+        if size == 0:
+            return (b'' if chunks is not None else None), None
+        return (b''.join(chunks) if chunks is not None else None), image_hash.hexdigest()
+
+    def fetch_images(self, block_links, default_images):
+        """
+        Download the images of all blocks concurrently. Like AttributeParser.get_image, the image of a block
+        is the first of its links that can be downloaded, and None if that is a default image.
+        :param block_links: List of the image links of each block
+        :return: List of the record image of each block
+        """
+        start = timeit.default_timer()
+
+        block_images = [None] * len(block_links)
+        link_positions = [0] * len(block_links)
+        pending_blocks = list(range(len(block_links)))
+
+        with ThreadPoolExecutor(max_workers=self.thread_count) as executor:
+            while len(pending_blocks) > 0:
+                # Download the next link of every block that has no image yet, each link only once
+                futures = {}
+                waiting_blocks = []
+                for block_index in pending_blocks:
+                    links = block_links[block_index]
+                    while link_positions[block_index] < len(links) and links[link_positions[block_index]] is None:
+                        link_positions[block_index] += 1
+                    if link_positions[block_index] >= len(links):
+                        continue
+
+                    image_link = links[link_positions[block_index]]
+                    if image_link not in self.images and image_link not in futures:
+                        futures[image_link] = executor.submit(self.download, image_link, default_images)
+                    waiting_blocks.append(block_index)
+
+                for image_link, future in futures.items():
+                    self.images[image_link] = future.result()
+
+                pending_blocks = []
+                for block_index in waiting_blocks:
+                    record_image = self.images[block_links[block_index][link_positions[block_index]]]
+                    link_positions[block_index] += 1
+
+                    if record_image is None:
+                        pending_blocks.append(block_index)
+                    elif record_image.hash not in default_images:
+                        block_images[block_index] = record_image
+
+        if self.image_cache is not None:
+            self.image_cache.save()
+
+        logging.log(19, f"ImageFetcher > Fetched {len(self.images)} images for {len(block_links)} blocks "
+                        f"{timeit.default_timer() - start:.3f}s")
+
+        return block_images
+
+
+def is_unchanged(response, cached_image):
+    """
+    :return: True if the server confirmed the cached image, or ignored the conditional request
+    but sent the same ETag and Content-Length
+    """
+    if response.status_code == 304:
+        return True
+
+    etag = response.headers.get('ETag')
+    return (response.ok and etag is not None and etag == cached_image.get('etag')
+            and response.headers.get('Content-Length') == cached_image.get('content_length'))
+
+
+def get_session(host, proxy=None, pool_size=8):
+    """
+    :return: Keep-alive session for the host and proxy, shared between threads and pages
+    """
+    key = (host, str(proxy) if proxy is not None else None)
+
+    with sessions_lock:
+        session = sessions.get(key)
+        if session is not None:
+            return session
+
+        if len(sessions) >= MAX_SESSIONS:
+            sessions.pop(next(iter(sessions))).close()
+
+        urllib3.disable_warnings()
+        session = requests.Session()
+        session.verify = False
+        # Cookies are sent per page, cookies of image responses shouldn't leak into the pages of other locales
+        session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        if proxy is not None:
+            session.proxies = {'http': str(proxy), 'https': str(proxy)}
+
+        sessions[key] = session
+        return session
+
+
+def get_fetcher(driver, scraper_settings: ScraperSettings):
+    """
+    :return: Image fetcher for the current page of the driver, or None if the driver can't be read
+    """
+    if driver is None:
+        return None
+
+    thread_count = settings_service.get_scraper_setting('image_fetch_threads', scraper_settings.scraper_type,
+                                                        default=8, optional=True)
+    timeout = settings_service.get_scraper_setting('image_fetch_timeout', scraper_settings.scraper_type,
+                                                   default=10, optional=True)
+    # Only images that are uploaded are needed after hashing, RecordImage.save uploads unless this is False
+    keep_images = settings_service.get_scraper_setting('upload_record_images', scraper_settings.scraper_type,
+                                                       optional=True) is not False
+
+    try:
+        return ImageFetcher(driver, scraper_settings.proxy, thread_count, timeout, keep_images,
+                            ImageCacheService.get_cache(scraper_settings))
+    except SystemExit or KeyboardInterrupt:
+        exit(-1)
+    except:
+        logging.warning(f"Failed to read the user agent and cookies of the page\n{traceback.format_exc()}")
+        return None
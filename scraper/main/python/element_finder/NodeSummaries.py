@@ -0,0 +1,105 @@
+from bs4 import NavigableString
+
+from preprocessing import AnnotationStore
+
+ALIAS = 'alias'
+
+
+class NodeSummaries:
+    """
+    Summaries of the tags of a page used to find blocks: whether the tag has all required attributes
+    and its alias, the first alias value in its subtree. Summaries are computed once, bottom-up,
+    so finding and moving up blocks doesn't search the subtrees again. The tree must not change after.
+    """
+    def __init__(self, root, required_attributes, annotations):
+        self.required = set()
+        self.data_aliases = {}
+        self.fallback_aliases = {}
+        self.child_aliases = {}
+
+        tags = [root]
+        tags.extend(root.find_all())
+
+        # Descendants come after their ancestors in document order, so in reverse every child is done first
+        for tag in reversed(tags):
+            if has_required_attributes(tag, required_attributes, annotations):
+                self.required.add(id(tag))
+
+            add_first_alias(tag, annotations.get_values(tag, ALIAS), self.data_aliases)
+            add_first_alias(tag, annotations.get_values(tag, ALIAS, AnnotationStore.FALLBACK),
+                            self.fallback_aliases)
+
+    def has_required_attributes(self, tag):
+        if isinstance(tag, NavigableString):
+            return False
+        return id(tag) in self.required
+
+    def get_alias(self, tag):
+        """
+        :return: First alias in the tag and its descendants, or the first fallback alias if there is none
+        """
+        if id(tag) in self.data_aliases:
+            return self.data_aliases[id(tag)]
+        return self.fallback_aliases.get(id(tag))
+
+    def get_child_aliases(self, parent):
+        """
+        :return: Dict of alias: children of the parent with the required attributes and that alias
+        """
+        child_aliases = self.child_aliases.get(id(parent))
+        if child_aliases is not None:
+            return child_aliases
+
+        child_aliases = {}
+        for child in parent.children:
+            if not self.has_required_attributes(child):
+                continue
+            alias = self.get_alias(child)
+            if alias is not None:
+                child_aliases.setdefault(alias, []).append(child)
+
+        self.child_aliases[id(parent)] = child_aliases
+        return child_aliases
+
+    def has_other_alias(self, block):
+        """
+        :return: True if a sibling of the block with the required attributes has a different alias
+        """
+        alias = self.get_alias(block)
+
+        for child_alias, children in self.get_child_aliases(block.parent).items():
+            if child_alias == alias:
+                continue
+            for child in children:
+                # Siblings equal to the block are skipped
+                if child != block:
+                    return True
+
+        return False
+
+
+def has_required_attributes(tag, required_attributes, annotations):
+    tag_counts = annotations.get_counts(tag)
+    fallback_counts = annotations.get_counts(tag, AnnotationStore.FALLBACK)
+
+    for required_attribute in required_attributes:
+        if required_attribute in tag_counts or required_attribute in fallback_counts:
+            continue
+
+        return False
+
+    return True
+
+
+def add_first_alias(tag, values, aliases):
+    """
+    Add the first alias of the tag's subtree in document order, its own values come before its children's
+    """
+    if len(values) > 0:
+        aliases[id(tag)] = values[0]
+        return
+
+    for child in tag.children:
+        if not isinstance(child, NavigableString) and id(child) in aliases:
+            aliases[id(tag)] = aliases[id(child)]
+            return
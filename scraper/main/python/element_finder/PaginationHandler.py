@@ -1,5 +1,6 @@
 import logging
 import time
+import timeit
 import traceback
 from enum import Enum
 
@@ -8,18 +9,89 @@ from selenium.common import ElementNotInteractableException
 from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver import Keys, ActionChains
 from selenium.webdriver.common.by import By
-from num2words import num2words
 
-from element_finder import BlockFinder
+from element_finder import TagPaths
+from element_finder.PaginationIndex import PaginationIndex
+from preprocessing import TreeState
+from preprocessing.SelectorIndex import SelectorIndex
 from scrapers import WebScraper
-from scrapers.WebScraper import count_tags
 from services import SettingsService
 
 settings_service = SettingsService.service
 
-
-def next_page(driver, soup, blocks, current_page, handler, interaction_buttons, failed_handlers, scraper_settings):
+# Scrolls to the bottom until the page stops growing, within the page. A scroll grows the page if the element count
+# increases before the quiet time ends, the same as count_tags it counts same-origin iframes only if they are inlined.
+# Returns the number of scrolls that grew the page.
+INFINITE_SCROLL_SCRIPT = """
+    const [scrollOffset, quietTime, maxSteps, countIframes, done] = arguments;
+
+    const countElements = () => {
+        let count = document.getElementsByTagName('*').length;
+        if (!countIframes) {
+            return count;
+        }
+        for (const iframe of document.getElementsByTagName('iframe')) {
+            try {
+                count += iframe.contentDocument.getElementsByTagName('*').length;
+            } catch (e) {}
+        }
+        return count;
+    };
+
+    const waitForGrowth = (oldCount) => new Promise(resolve => {
+        let finished = false;
+        let observer = null;
+        let poll = null;
+        let timeout = null;
+
+        const finish = (grown) => {
+            if (finished) {
+                return;
+            }
+            finished = true;
+            observer.disconnect();
+            clearInterval(poll);
+            clearTimeout(timeout);
+            resolve(grown);
+        };
+        const check = () => {
+            if (countElements() > oldCount) {
+                finish(true);
+            }
+        };
+
+        // Mutations of the page are noticed right away, polling notices changes within iframes
+        observer = new MutationObserver(check);
+        observer.observe(document.documentElement, {childList: true, subtree: true});
+        poll = setInterval(check, 250);
+        timeout = setTimeout(() => finish(countElements() > oldCount), quietTime);
+    });
+
+    (async () => {
+        let growthSteps = 0;
+        while (growthSteps < maxSteps) {
+            const oldCount = countElements();
+            window.scrollBy(0, 100000);
+            window.scrollBy(0, -scrollOffset);
+
+            if (!(await waitForGrowth(oldCount))) {
+                break;
+            }
+            growthSteps++;
+        }
+        done(growthSteps);
+    })().catch(() => done(0));
+"""
+
+nth_of_type_regex = regex.compile(r':nth-of-type\(\d+\)')
+domain_regex = regex.compile("(?<=(www\\.|https?:\\/\\/))[^/]+(?=\\.)")
+
+
+def next_page(driver, soup, blocks, current_page, handler, interaction_buttons, failed_handlers, scraper_settings,
+              pagination_strategy=None):
     """
+    :param pagination_strategy: Strategy of the locale, its known button is tried before discovering the button,
+                                and the handler and button that worked are remembered in it
     :return: HandlerType used to navigate to the next page. If no handler was used, returns None.
     """
     start_time = time.time()
@@ -37,21 +109,34 @@ def next_page(driver, soup, blocks, current_page, handler, interaction_buttons,
     block_parent = get_block_parent(soup, blocks)
 
     soup = remove_blocks(soup, blocks)
+    pagination_index = None
+    if handler is not HandlerType.INFINITE_SCROLL:
+        pagination_index = get_pagination_index(soup, current_page, max_page)
     new_handler = None
+    if pagination_strategy is not None:
+        pagination_strategy.known_button_missed = False
 
-    if try_infinite_scroll(driver, current_page, max_page, handler, failed_handlers, scraper_settings):
+    if try_infinite_scroll(driver, current_page, max_page, handler, failed_handlers):
         new_handler = HandlerType.INFINITE_SCROLL
-    elif try_click_paginator(driver, soup, current_page, blocks, block_parent,
-                             interaction_buttons, handler, failed_handlers):
+        if pagination_strategy is not None:
+            pagination_strategy.remember(new_handler.name)
+    elif try_click_paginator(driver, pagination_index, current_page, blocks, block_parent,
+                             interaction_buttons, handler, failed_handlers, pagination_strategy):
         new_handler = HandlerType.PAGINATOR
-    elif try_click_view_more(driver, soup, blocks, block_parent, handler, interaction_buttons, failed_handlers):
+    elif try_click_view_more(driver, pagination_index, blocks, block_parent, handler, interaction_buttons,
+                             failed_handlers, pagination_strategy):
         new_handler = HandlerType.VIEW_MORE
     else:
         logging.info(f"No more pages to navigate to. Current page: {current_page}")
 
+    is_discovery = handler is None or (pagination_strategy is not None and pagination_strategy.known_button_missed)
+    duration = time.time() - start_time
+    if is_discovery and pagination_strategy is not None:
+        pagination_strategy.discovery_time += duration
+
     logging.info(f"PaginationHandler > Next page "
                  f"{'(initial discovery)' if handler is None else ''} "
-                 f"{time.time() - start_time:.3f}s")
+                 f"{duration:.3f}s")
 
     return new_handler
 
@@ -79,28 +164,58 @@ def remove_blocks(soup, blocks):
     return soup
 
 
-def try_click_paginator(driver, soup, current_page, blocks, block_parent, interaction_buttons, handler, failed_handlers):
+def get_pagination_index(soup, current_page, max_page):
+    """
+    :return: Index of the candidate paginator and view more buttons of the page
+    """
+    start = timeit.default_timer()
+
+    pagination_index = PaginationIndex(soup, get_page_numbers(current_page, max_page),
+                                       settings_service.get_catalog_setting('view_more_aliases'),
+                                       settings_service.get_catalog_setting('pagination_tags'))
+
+    logging.log(19, f"PaginationHandler > Index pagination candidates {timeit.default_timer() - start:.3f}s")
+
+    return pagination_index
+
+
+def try_click_paginator(driver, pagination_index, current_page, blocks, block_parent, interaction_buttons, handler,
+                        failed_handlers, pagination_strategy=None):
     if can_handle(handler, HandlerType.PAGINATOR, failed_handlers) is False:
         return False
 
     paginator_delay = settings_service.get_catalog_setting('paginator_delay')
 
-    potential_buttons = find_potential_buttons(soup, current_page, blocks)
+    potential_buttons = find_potential_buttons(pagination_index, current_page, blocks)
 
     if sum(len(buttons) for buttons in potential_buttons.values()) == 0:
         return False
 
     paginator_attempts = settings_service.get_catalog_setting('paginator_attempts')
 
-    closest_button = get_paginator_button(potential_buttons, current_page, block_parent)
+    # The button that worked in earlier runs is clicked without searching for the paginator
+    known_button = find_known_button(potential_buttons.get(current_page + 1, []), HandlerType.PAGINATOR,
+                                     pagination_strategy, current_page + 1)
+    if known_button is not None and click_button(driver, known_button, interaction_buttons, paginator_attempts):
+        clicked_button = known_button
+    else:
+        if pagination_strategy is not None and pagination_strategy.handler == HandlerType.PAGINATOR.name:
+            pagination_strategy.known_button_missed = True
 
-    if closest_button is None:
-        return False
+        closest_button = get_paginator_button(potential_buttons, current_page, block_parent)
 
-    result = click_button(driver, closest_button, interaction_buttons, paginator_attempts)
+        if closest_button is None or closest_button is known_button:
+            return False
 
-    if result is False:
-        return False
+        result = click_button(driver, closest_button, interaction_buttons, paginator_attempts)
+
+        if result is False:
+            return False
+        clicked_button = closest_button
+
+    if pagination_strategy is not None:
+        pagination_strategy.remember(HandlerType.PAGINATOR.name, get_button_selector(clicked_button),
+                                     get_href(clicked_button), current_page + 1)
 
     logging.info(f"[HandlerType=PAGINATOR] Clicked paginator on page {current_page}")
 
@@ -108,30 +223,42 @@ def try_click_paginator(driver, soup, current_page, blocks, block_parent, intera
     return True
 
 
-def try_infinite_scroll(driver, current_page, max_page, handler, failed_handlers, scraper_settings):
+def try_infinite_scroll(driver, current_page, max_page, handler, failed_handlers):
     if can_handle(handler, HandlerType.INFINITE_SCROLL, failed_handlers) is False:
         return False
 
     scroll_time = settings_service.get_catalog_setting('scroll_delay')
     scroll_offset = settings_service.get_catalog_setting('scroll_offset')
 
-    old_count = 0
-    new_count = count_tags(driver, scraper_settings)
-    height_changes = 0
+    # Every scroll is a page, the same as navigating with a paginator
+    max_steps = max_page - current_page + 1
+    if max_steps <= 0:
+        return False
+
+    count_iframes = settings_service.get_webscraper_setting('inline_iframes') is True
 
-    while old_count != new_count and current_page + height_changes <= max_page:
-        height_changes += 1
-        old_count = new_count
+    start = timeit.default_timer()
+    previous_timeout = None
+    try:
+        # The script timeout is shared by the whole driver, it is only raised while scrolling
+        previous_timeout = driver.timeouts.script
+        driver.set_script_timeout(max_steps * (scroll_time + 1) + 30)
+        growth_steps = driver.execute_async_script(INFINITE_SCROLL_SCRIPT, scroll_offset, scroll_time * 1000,
+                                                   max_steps, count_iframes)
+    except SystemExit or KeyboardInterrupt:
+        exit(-1)
+    except:
+        logging.warning(f"Failed to scroll the page\n{traceback.format_exc()}")
+        return False
+    finally:
+        if previous_timeout is not None:
+            driver.set_script_timeout(previous_timeout)
 
-        actions = ActionChains(driver)
-        actions.scroll_by_amount(0, 100000).perform()
-        actions.scroll_by_amount(0, -scroll_offset).perform()
+    logging.log(19, f"PaginationHandler > Infinite scroll {growth_steps} growth steps "
+                    f"{timeit.default_timer() - start:.3f}s")
 
-        for _ in range(scroll_time * 2):
-            new_count = count_tags(driver, scraper_settings)
-            if old_count != new_count:
-                break
-            time.sleep(0.5)
+    # Scrolls that didn't load anything are counted too, unless scrolling stopped at the page cap
+    height_changes = growth_steps if growth_steps >= max_steps else growth_steps + 1
 
     if height_changes <= 2:
         return False
@@ -140,40 +267,35 @@ def try_infinite_scroll(driver, current_page, max_page, handler, failed_handlers
     return True
 
 
-def find_potential_buttons(soup, current_page, blocks):
-    max_page = settings_service.get_catalog_setting('max_page_count')
-
-    potential_numbers = []
+def get_page_numbers(current_page, max_page):
+    """
+    :return: Numbers of the pages around the current page that may have paginator buttons
+    """
+    page_numbers = []
 
     if current_page > 2:
-        potential_numbers.append(current_page - 2)
+        page_numbers.append(current_page - 2)
     if current_page > 1:
-        potential_numbers.append(current_page - 1)
+        page_numbers.append(current_page - 1)
 
-    potential_numbers.append(current_page)
+    page_numbers.append(current_page)
 
     if current_page < max_page:
-        potential_numbers.append(current_page + 1)
+        page_numbers.append(current_page + 1)
     if current_page < max_page - 1:
-        potential_numbers.append(current_page + 2)
+        page_numbers.append(current_page + 2)
+
+    return page_numbers
+
+
+def find_potential_buttons(pagination_index, current_page, blocks):
+    max_page = settings_service.get_catalog_setting('max_page_count')
 
     potential_buttons = {}
-    for number in potential_numbers:
-        potential_buttons[number] = []
-
-    for potential_number in potential_numbers:
-        number_regex = regex.compile(f"(?<=^\\s*){potential_number}(?=\\s*$)")
-        potential_strings = soup.find_all(string=number_regex)
-
-        # Google Translate sometimes translates numbers to words in the paginator
-        potential_number_words = num2words(potential_number)
-        escaped_number_words = (regex.escape(potential_number_words)
-                                .replace('\\-', '[\\-\\s]?'))
-        word_regex = regex.compile(f"(?<=^\\s*){escaped_number_words}(?=\\s*$)")
-        potential_strings.extend(soup.find_all(string=word_regex))
-
-        for potential_string in potential_strings:
-            potential_button = find_parent_button(potential_string.parent)
+    for potential_number in get_page_numbers(current_page, max_page):
+        potential_buttons[potential_number] = []
+
+        for potential_button in pagination_index.get_page_buttons(potential_number):
             if potential_button.name == 'script':
                 continue
             if is_after_blocks(potential_button, blocks):
@@ -198,11 +320,14 @@ def get_paginator_button(potential_buttons, current_page, block_parent):
     kept_buttons = {}
     current_buttons = potential_buttons[current_page]
 
+    # Paths of the buttons are computed once and reused for every pair and for finding the closest button
+    tag_paths = TagPaths.TagPaths()
+
     #  Find buttons that are close to the current page's buttons
     for current_button in current_buttons:
         for page, other_buttons in potential_buttons.items():
             for other_button in other_buttons:
-                if BlockFinder.get_distance(current_button, other_button) <= max_pagination_distance:
+                if tag_paths.get_distance(current_button, other_button) <= max_pagination_distance:
                     if current_button not in kept_buttons:
                         kept_buttons[current_button] = {current_page: [current_button]}
                     if page not in kept_buttons[current_button]:
@@ -217,9 +342,9 @@ def get_paginator_button(potential_buttons, current_page, block_parent):
 
     labeled_paginator_buttons = check_for_paginator_class(buttons)
     if len(labeled_paginator_buttons) > 0:
-        return find_closest(labeled_paginator_buttons, block_parent)
+        return find_closest(labeled_paginator_buttons, block_parent, tag_paths)
 
-    closest_button = find_closest(buttons, block_parent)
+    closest_button = find_closest(buttons, block_parent, tag_paths)
 
     return closest_button
 
@@ -229,12 +354,21 @@ def check_for_paginator_class(buttons):
     paginator_levels = settings_service.get_catalog_setting('paginator_levels')
 
     found_buttons = []
+    if len(buttons) == 0:
+        return found_buttons
+
+    selector_index = SelectorIndex(TreeState.get_root(buttons[0]))
     selector_regex = regex.compile(f"([^>]+>?){{{paginator_levels}}}$")
+
+    # Only the last levels of the selector are compared, the same levels the regex keeps of the full selector
+    button_selectors = []
+    for button in buttons:
+        css_selector = get_css_selector(button, selector_index, paginator_levels)
+        button_selectors.append(regex.search(selector_regex, css_selector).group(0))
+
     for paginator_class in paginator_classes:
         class_regex = regex.compile(f"\\b{paginator_class}\\b", regex.IGNORECASE)
-        for button in buttons:
-            css_selector = get_css_selector(button)
-            button_selector = regex.search(selector_regex, css_selector).group(0)
+        for button, button_selector in zip(buttons, button_selectors):
 
             if button_selector is None:
                 continue
@@ -343,9 +477,16 @@ def try_interaction_buttons(driver, interaction_buttons):
     return False
 
 
-def get_css_selector(tag):
+def get_css_selector(tag, selector_index=None, max_levels=None):
+    """
+    :param selector_index: Index of the tree of the tag, shared by callers that build many selectors.
+                           If None, the parent of each level is searched directly.
+    :param max_levels: Maximum number of levels of the selector, counted from the tag. If None, the full selector.
+    """
     css_selector = ''
-    while tag.parent is not None:
+    levels = 0
+    while tag.parent is not None and (max_levels is None or levels < max_levels):
+        levels += 1
         tag_number = 1
         tag_count = 0
         found_id = tag.attrs.get('id')
@@ -368,7 +509,11 @@ def get_css_selector(tag):
 
         tag_index_string = ''
         try:
-            similar_tags = tag.parent.select(f"{tag.name}{class_list}")
+            # Indexing the whole tree only pays off for callers that build selectors of many tags
+            if selector_index is None:
+                similar_tags = tag.parent.select(f"{tag.name}{class_list}")
+            else:
+                similar_tags = selector_index.select(f"{tag.name}{class_list}", tag.parent)
         except SystemExit or KeyboardInterrupt:
             exit(-1)
         except NotImplementedError:
@@ -404,35 +549,41 @@ def format_class_list(tag):
     return formatted_class_list
 
 
-def try_click_view_more(driver, soup, blocks, block_parent, handler, interaction_buttons, failed_handlers):
+def try_click_view_more(driver, pagination_index, blocks, block_parent, handler, interaction_buttons, failed_handlers,
+                        pagination_strategy=None):
     if can_handle(handler, HandlerType.VIEW_MORE, failed_handlers) is False:
         return False
 
-    view_more_aliases = settings_service.get_catalog_setting('view_more_aliases')
     view_more_attempts = settings_service.get_catalog_setting('view_more_attempts')
     view_more_load_delay = settings_service.get_catalog_setting('view_more_load_delay')
 
     view_more_buttons = []
 
-    for alias in view_more_aliases:
-        alias_regex = regex.compile(f"\\b{alias}\\b", regex.IGNORECASE)
-        strings = soup.find_all(string=alias_regex)
+    for button in pagination_index.get_view_more_buttons():
+        if is_after_blocks(button, blocks) and is_valid_link(button, driver):
+            view_more_buttons.append(button)
 
-        for string in strings:
-            tag = string.parent
-            button = find_parent_button(tag)
-            if is_after_blocks(button, blocks) and is_valid_link(button, driver):
-                view_more_buttons.append(button)
+    # The button that worked in earlier runs is clicked without searching for the closest button
+    known_button = find_known_button(view_more_buttons, HandlerType.VIEW_MORE, pagination_strategy)
+    if known_button is not None and click_button(driver, known_button, interaction_buttons, view_more_attempts):
+        clicked_button = known_button
+    else:
+        if pagination_strategy is not None and pagination_strategy.handler == HandlerType.VIEW_MORE.name:
+            pagination_strategy.known_button_missed = True
 
-    closest_button = find_closest(view_more_buttons, block_parent)
+        closest_button = find_closest(view_more_buttons, block_parent)
 
-    if closest_button is None:
-        return False
+        if closest_button is None or closest_button is known_button:
+            return False
 
-    result = click_button(driver, closest_button, interaction_buttons, view_more_attempts)
+        result = click_button(driver, closest_button, interaction_buttons, view_more_attempts)
 
-    if result is False:
-        return False
+        if result is False:
+            return False
+        clicked_button = closest_button
+
+    if pagination_strategy is not None:
+        pagination_strategy.remember(HandlerType.VIEW_MORE.name, get_button_selector(clicked_button))
 
     logging.info(f"[HandlerType=VIEW_MORE] Clicked view more")
 
@@ -440,23 +591,6 @@ def try_click_view_more(driver, soup, blocks, block_parent, handler, interaction
     return True
 
 
-def find_parent_button(tag):
-    pagination_tags = settings_service.get_catalog_setting('pagination_tags')
-
-    if tag.name in pagination_tags:
-        return tag
-
-    parent = tag.parent
-    for _ in range(5):
-        if parent.name in pagination_tags:
-            return parent
-        parent = parent.parent
-        if parent is None:
-            break
-
-    return tag
-
-
 def is_valid_link(button, driver):
     if button.name != 'a' or button.attrs is None:
         return True
@@ -467,7 +601,6 @@ def is_valid_link(button, driver):
 
     current_url = driver.current_url
 
-    domain_regex = regex.compile("(?<=(www\\.|https?:\\/\\/))[^/]+(?=\\.)")
     current_domain = regex.search(domain_regex, current_url)
     href_domain = regex.search(domain_regex, href)
 
@@ -478,14 +611,47 @@ def is_valid_link(button, driver):
     return True
 
 
-def find_closest(buttons, block_parent):
+def find_known_button(buttons, handler_type, pagination_strategy, page=None):
+    """
+    :return: First of the buttons that was clicked with the handler in earlier runs, or None
+    """
+    if pagination_strategy is None or pagination_strategy.handler != handler_type.name or len(buttons) == 0:
+        return None
+
+    selector_index = SelectorIndex(TreeState.get_root(buttons[0]))
+    for button in buttons:
+        if pagination_strategy.is_known_button(handler_type.name, get_button_selector(button, selector_index),
+                                               get_href(button), page):
+            return button
+
+    return None
+
+
+def get_button_selector(button, selector_index=None):
+    """
+    :return: CSS selector of the button without the positions among its siblings,
+             which differ between the buttons of a paginator and between pages
+    """
+    return nth_of_type_regex.sub('', get_css_selector(button, selector_index))
+
+
+def get_href(button):
+    if button.name != 'a':
+        return None
+    return button.attrs.get('href')
+
+
+def find_closest(buttons, block_parent, tag_paths=None):
     if block_parent is None and len(buttons) > 0:
         return buttons[0]
 
+    if tag_paths is None:
+        tag_paths = TagPaths.TagPaths()
+
     closest_button = None
     closest_distance = 999
     for button in buttons:
-        distance = BlockFinder.get_distance(button, block_parent)
+        distance = tag_paths.get_distance(button, block_parent)
         if distance < closest_distance:
             closest_button = button
             closest_distance = distance
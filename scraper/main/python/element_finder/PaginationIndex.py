@@ -0,0 +1,89 @@
+import regex
+from num2words import num2words
+
+
+class PaginationIndex:
+    """
+    Candidate pagination buttons of a page, found with a single pass over its strings. Each string is classified
+    as a page number, a page number in words or a view more alias with precompiled tables,
+    and kept with its button, the nearest pagination tag among its ancestors.
+    """
+    def __init__(self, soup, page_numbers, view_more_aliases, pagination_tags):
+        self.pagination_tags = set(pagination_tags)
+
+        self.number_buttons = {number: [] for number in page_numbers}
+        self.word_buttons = {number: [] for number in page_numbers}
+        self.view_more_buttons = [[] for _ in view_more_aliases]
+
+        self.page_regex = get_page_regex(page_numbers)
+        self.alias_regexes = [regex.compile(f"\\b{alias}\\b", regex.IGNORECASE) for alias in view_more_aliases]
+        self.view_more_regex = None
+        if len(view_more_aliases) > 0:
+            alternatives = '|'.join(f"(?:{alias})" for alias in view_more_aliases)
+            self.view_more_regex = regex.compile(f"\\b(?:{alternatives})\\b", regex.IGNORECASE)
+
+        for string in soup.find_all(string=True):
+            self.add_string(string)
+
+    def add_string(self, string):
+        if self.page_regex is not None:
+            page_match = self.page_regex.fullmatch(string)
+            if page_match is not None:
+                kind, number = page_match.lastgroup.split('_')
+                buttons = self.number_buttons if kind == 'number' else self.word_buttons
+                buttons[int(number)].append(self.get_button(string))
+
+        if self.view_more_regex is not None and self.view_more_regex.search(string) is not None:
+            # Strings can contain several aliases, each alias keeps its own buttons the same as searching them in turn
+            for alias_index, alias_regex in enumerate(self.alias_regexes):
+                if alias_regex.search(string) is not None:
+                    self.view_more_buttons[alias_index].append(self.get_button(string))
+
+    def get_button(self, string):
+        return find_parent_button(string.parent, self.pagination_tags)
+
+    def get_page_buttons(self, number):
+        """
+        :return: Buttons of the page number in document order, followed by the buttons of the number in words
+        """
+        return self.number_buttons.get(number, []) + self.word_buttons.get(number, [])
+
+    def get_view_more_buttons(self):
+        """
+        :return: Buttons of each view more alias in document order, in the order of the aliases
+        """
+        return [button for buttons in self.view_more_buttons for button in buttons]
+
+
+def get_page_regex(page_numbers):
+    """
+    :return: Regex matching a string that is only one of the page numbers, as digits or in words,
+             with the kind and number of the page as the name of the matching group
+    """
+    if len(page_numbers) == 0:
+        return None
+
+    alternatives = []
+    for number in page_numbers:
+        alternatives.append(f"(?P<number_{number}>{number})")
+
+        # Google Translate sometimes translates numbers to words in the paginator
+        escaped_number_words = regex.escape(num2words(number)).replace('\\-', '[\\-\\s]?')
+        alternatives.append(f"(?P<word_{number}>{escaped_number_words})")
+
+    return regex.compile(f"\\s*(?:{'|'.join(alternatives)})\\s*")
+
+
+def find_parent_button(tag, pagination_tags):
+    if tag.name in pagination_tags:
+        return tag
+
+    parent = tag.parent
+    for _ in range(5):
+        if parent.name in pagination_tags:
+            return parent
+        parent = parent.parent
+        if parent is None:
+            break
+
+    return tag
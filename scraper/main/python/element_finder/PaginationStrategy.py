@@ -0,0 +1,97 @@
+import logging
+
+import regex
+
+from scrapers.ScraperSettings import ScraperSettings
+from services import SettingsService, PersistentCacheService
+
+settings_service = SettingsService.service
+
+CACHE_NAME = 'pagination_strategies'
+PAGE_PLACEHOLDER = '{page}'
+
+
+class PaginationStrategy:
+    """
+    How the catalog pages of a locale were navigated in earlier runs: the name of the handler that worked,
+    the css selector of its button without sibling positions, and for paginator links the url pattern of the pages.
+    Also measures the time spent discovering the strategy in the current run.
+    """
+    def __init__(self, key, strategy, persisted=True):
+        self.key = key
+        self.handler = strategy.get('handler')
+        self.button_selector = strategy.get('button_selector')
+        self.url_pattern = strategy.get('url_pattern')
+        self.persisted = persisted
+
+        self.discovery_time = 0
+        self.known_button_missed = False
+        self.changed = False
+
+    def is_known_button(self, handler, button_selector, href=None, page=None):
+        """
+        :return: True if the button is the one that was clicked with the handler before
+        """
+        if handler != self.handler:
+            return False
+
+        if self.url_pattern is not None and href is not None and page is not None:
+            return href == self.url_pattern.replace(PAGE_PLACEHOLDER, str(page))
+
+        return self.button_selector is not None and button_selector == self.button_selector
+
+    def remember(self, handler, button_selector=None, href=None, page=None):
+        url_pattern = None
+        if href is not None and page is not None:
+            # The page number is the last occurrence of the number that isn't part of a longer number
+            page_matches = list(regex.finditer(f"(?<!\\d){page}(?!\\d)", href))
+            if len(page_matches) > 0:
+                page_match = page_matches[-1]
+                url_pattern = f"{href[:page_match.start()]}{PAGE_PLACEHOLDER}{href[page_match.end():]}"
+
+        if (handler, button_selector, url_pattern) == (self.handler, self.button_selector, self.url_pattern):
+            return
+
+        self.handler = handler
+        self.button_selector = button_selector
+        self.url_pattern = url_pattern
+        self.changed = True
+
+    def forget(self, handler):
+        """
+        Forget the strategy if it used the handler, e.g. because the handler found no pages
+        """
+        if self.handler == handler:
+            self.remember(None)
+
+    def to_dict(self):
+        return {
+            'handler': self.handler,
+            'button_selector': self.button_selector,
+            'url_pattern': self.url_pattern
+        }
+
+    def save(self):
+        logging.info(f"Pagination discovery: {self.discovery_time:.3f}s, strategy: {self.handler}")
+
+        if self.persisted and self.changed:
+            PersistentCacheService.save(CACHE_NAME, self.key, self.to_dict())
+            self.changed = False
+
+
+def get_key(scraper_settings: ScraperSettings):
+    return f"{scraper_settings.scraper_type.value}_{scraper_settings.domain}_{scraper_settings.locale}"
+
+
+def get_strategy(scraper_settings: ScraperSettings):
+    """
+    :return: The pagination strategy of the locale. If pagination_strategies isn't set, the strategy
+             starts empty and isn't saved, but still measures the discovery time of the run.
+    """
+    key = get_key(scraper_settings)
+
+    if not settings_service.get_scraper_setting('pagination_strategies', scraper_settings.scraper_type,
+                                                default=False, optional=True):
+        return PaginationStrategy(key, {}, persisted=False)
+
+    return PaginationStrategy(key, PersistentCacheService.load(CACHE_NAME, key, default={}))
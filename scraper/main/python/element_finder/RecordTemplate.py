@@ -0,0 +1,250 @@
+import hashlib
+import logging
+import math
+
+from bs4 import NavigableString
+
+from preprocessing import AnnotationStore
+from scrapers.ScraperSettings import ScraperSettings
+from services import SettingsService, PersistentCacheService, CompiledRuleService
+
+settings_service = SettingsService.service
+CompiledRuleService = CompiledRuleService.service
+
+CACHE_NAME = 'record_templates'
+
+# Changes when the learning of templates does, so templates learned by older code aren't reused
+TEMPLATE_VERSION = 1
+
+
+class RecordTemplate:
+    """
+    Where the records of a locale's catalog pages are: the path of the container of the record cards,
+    the tag name and classes of the cards, and the path of each field within a card.
+    Paths are lists of [tag name, index among the siblings with that name]. The container path is from the body
+    of the page before cleaning, so the container can be found without cleaning the whole page,
+    card and field paths are from the cleaned container or card.
+    """
+    def __init__(self, key, template):
+        self.key = key
+        self.version = template.get('version')
+        self.container_path = template.get('container_path')
+        self.card_name = template.get('card_name')
+        self.card_classes = template.get('card_classes', [])
+        self.fields = template.get('fields', {})
+        self.record_count = template.get('record_count', 0)
+
+    def find_container(self, soup):
+        """
+        :param soup: Body of the page from HtmlCleaner.make_inlined_soup
+        """
+        if self.container_path is None:
+            return None
+        return resolve_path(soup, self.container_path)
+
+    def is_card(self, tag):
+        if isinstance(tag, NavigableString) or tag.name != self.card_name:
+            return False
+
+        classes = tag.attrs.get('class', [])
+        return all(card_class in classes for card_class in self.card_classes)
+
+    def find_cards(self, container):
+        return [child for child in container.children if self.is_card(child)]
+
+    def has_fields(self, card, annotations):
+        """
+        :return: True if every field of the template has values at its path in the card
+        """
+        for label, field_path in self.fields.items():
+            tag = resolve_path(card, field_path)
+            if tag is None:
+                return False
+            if len(annotations.get_values(tag, label)) == 0 and \
+                    len(annotations.get_values(tag, label, AnnotationStore.FALLBACK)) == 0:
+                return False
+
+        return True
+
+    def get_min_record_count(self, scraper_settings: ScraperSettings):
+        min_ratio = settings_service.get_scraper_setting('record_template_min_ratio', scraper_settings.scraper_type,
+                                                         default=0.8, optional=True)
+        return max(1, math.ceil(self.record_count * min_ratio))
+
+    def to_dict(self):
+        return {
+            'version': self.version,
+            'container_path': self.container_path,
+            'card_name': self.card_name,
+            'card_classes': self.card_classes,
+            'fields': self.fields,
+            'record_count': self.record_count
+        }
+
+    def save(self):
+        PersistentCacheService.save(CACHE_NAME, self.key, self.to_dict())
+
+
+def get_key(scraper_settings: ScraperSettings):
+    return f"{scraper_settings.scraper_type.value}_{scraper_settings.domain}_{scraper_settings.locale}"
+
+
+def is_enabled(scraper_settings: ScraperSettings):
+    return settings_service.get_scraper_setting('record_templates', scraper_settings.scraper_type,
+                                                default=False, optional=True)
+
+
+def get_version(scraper_settings: ScraperSettings):
+    """
+    :return: Hash of the attribute rules, which changes whenever a rule does
+    """
+    compiled_rules = CompiledRuleService.get_rules(scraper_settings.scraper_type)
+    statistics_keys = '|'.join(compiled_rule.statistics_key for compiled_rule in compiled_rules)
+
+    return hashlib.sha1(f"{TEMPLATE_VERSION}|{statistics_keys}".encode('utf-8')).hexdigest()[:16]
+
+
+def get_template(scraper_settings: ScraperSettings):
+    """
+    :return: The record template of the locale, or None if there is none or the rules changed since it was learned
+    """
+    if not is_enabled(scraper_settings):
+        return None
+
+    key = get_key(scraper_settings)
+    template = PersistentCacheService.load(CACHE_NAME, key)
+    if template is None:
+        return None
+
+    if template.get('version') != get_version(scraper_settings):
+        logging.info(f"RecordTemplate > Rules changed, dropping the template of {key}")
+        return None
+
+    return RecordTemplate(key, template)
+
+
+def learn_template(source_soup, soup, blocks, scraper_settings: ScraperSettings):
+    """
+    Learn the template of the locale from the blocks found by the full pipeline and save it
+    :param source_soup: Body of the page from HtmlCleaner.make_inlined_soup, the container path is learned in it
+    :param soup: Cleaned soup the blocks were found in, before tagging removed any tags
+    :param blocks: Parsed blocks of the largest group, their tags are in the tagged copy of soup
+    :return: The new template, or None if the blocks don't fit a template
+    """
+    if not is_enabled(scraper_settings) or len(blocks) == 0:
+        return None
+
+    # Cards must be the children of the container found by grouping
+    parent_index = str(blocks[0]['parent'])
+    for block in blocks:
+        if block['tag'].parent is None or str(block['tag'].parent.attrs.get('scraper-index')) != parent_index:
+            return None
+
+    tags_by_index = {str(tag.attrs.get('scraper-index')): tag for tag in soup.find_all()}
+    container = tags_by_index.get(parent_index)
+    if container is None:
+        return None
+
+    source_container = source_soup.find(attrs={'scraper-index': parent_index})
+    if source_container is None:
+        return None
+
+    cards = [tags_by_index.get(str(block['index'])) for block in blocks]
+    if any(card is None or card.parent is not container for card in cards):
+        return None
+
+    card_name = cards[0].name
+    card_classes = list(cards[0].attrs.get('class', []))
+    for card in cards:
+        if card.name != card_name:
+            return None
+        card_classes = [card_class for card_class in card_classes if card_class in card.attrs.get('class', [])]
+
+    template = RecordTemplate(get_key(scraper_settings), {
+        'version': get_version(scraper_settings),
+        'container_path': get_path(source_container, source_soup),
+        'card_name': card_name,
+        'card_classes': card_classes,
+        'fields': get_fields(blocks, cards, tags_by_index),
+        'record_count': len(blocks)
+    })
+
+    template.save()
+    logging.info(f"RecordTemplate > Learned the template of {template.key}: {len(cards)} {card_name} cards "
+                 f"with {len(template.fields)} fields")
+
+    return template
+
+
+def get_fields(blocks, cards, tags_by_index):
+    """
+    :return: Dict of label: path of the first tag with values of the label, for labels at the same path in every card
+    """
+    fields = None
+
+    for block, card in zip(blocks, cards):
+        annotations = AnnotationStore.get_store(block['tag'])
+        card_fields = {}
+
+        tags = [block['tag']]
+        tags.extend(block['tag'].find_all())
+        for tag in tags:
+            labels = list(annotations.get_data(tag))
+            labels.extend(annotations.get_data(tag, AnnotationStore.FALLBACK))
+
+            for label in labels:
+                if label in card_fields:
+                    continue
+                cleaned_tag = tags_by_index.get(str(tag.attrs.get('scraper-index')))
+                if cleaned_tag is not None:
+                    card_fields[label] = get_path(cleaned_tag, card)
+
+        if fields is None:
+            fields = card_fields
+        else:
+            fields = {label: path for label, path in fields.items() if card_fields.get(label) == path}
+
+    return fields or {}
+
+
+def get_path(tag, root):
+    """
+    :return: List of [tag name, index among the siblings with that name] from root to the tag
+    """
+    path = []
+    while tag is not root and tag.parent is not None:
+        tag_number = 0
+        for sibling in tag.parent.children:
+            if sibling is tag:
+                break
+            if sibling.name == tag.name:
+                tag_number += 1
+
+        path.append([tag.name, tag_number])
+        tag = tag.parent
+
+    path.reverse()
+    return path
+
+
+def resolve_path(root, path):
+    """
+    :return: Tag at the path from root, or None if the tree doesn't have it
+    """
+    tag = root
+    for name, tag_number in path:
+        found = None
+        for child in tag.children:
+            if child.name != name:
+                continue
+            if tag_number == 0:
+                found = child
+                break
+            tag_number -= 1
+
+        if found is None:
+            return None
+        tag = found
+
+    return tag
+
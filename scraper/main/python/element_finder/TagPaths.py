@@ -0,0 +1,154 @@
+from bs4 import NavigableString
+
+# Path of a tag without a parent, the same as splitting its empty xpath
+ROOT_PATH = ('',)
+
+
+class TagPaths:
+    """
+    XPath steps of tags, e.g. ('html', 'body', 'div[2]'), computed once per tag instead of once per comparison.
+    The steps of all children of a parent are computed together, so siblings are only scanned once.
+    Like get_xpath, the index of a tag is the index of its last sibling that is equal to it.
+    """
+    def __init__(self):
+        self.paths = {}
+        self.steps = {}
+        self.structure_hashes = {}
+
+    def get_path(self, tag):
+        """
+        :return: Tuple of the xpath steps from the root to the tag
+        """
+        path = self.get_steps(tag)
+        if len(path) == 0:
+            return ROOT_PATH
+        return path
+
+    def get_steps(self, tag):
+        cached = self.paths.get(id(tag))
+        if cached is not None and cached[0] is tag:
+            return cached[1]
+
+        # Walk up to the closest ancestor with known steps, then build the paths back down
+        ancestors = []
+        path = ()
+        while tag.parent is not None:
+            cached = self.paths.get(id(tag))
+            if cached is not None and cached[0] is tag:
+                path = cached[1]
+                break
+            ancestors.append(tag)
+            tag = tag.parent
+
+        for ancestor in reversed(ancestors):
+            path = path + (self.get_step(ancestor),)
+            self.paths[id(ancestor)] = (ancestor, path)
+
+        return path
+
+    def get_step(self, tag):
+        cached = self.steps.get(id(tag))
+        if cached is None or cached[0] is not tag:
+            self.add_child_steps(tag.parent)
+            cached = self.steps[id(tag)]
+        return cached[1]
+
+    def add_child_steps(self, parent):
+        named_children = {}
+        for child in parent.children:
+            if child.name is not None:
+                named_children.setdefault(child.name, []).append(child)
+
+        for name, children in named_children.items():
+            if len(children) == 1:
+                self.steps[id(children[0])] = (children[0], name)
+                continue
+
+            # Equal siblings share the index of the last of them, compare only siblings with the same structure
+            last_equal = {}
+            for child_index, child in enumerate(children):
+                structure_hash = self.get_structure_hash(child)
+                last_equal.setdefault(structure_hash, []).append(child_index)
+
+            for child_index, child in enumerate(children):
+                tag_number = child_index + 1
+                for other_index in reversed(last_equal[self.get_structure_hash(child)]):
+                    if other_index <= child_index:
+                        break
+                    if children[other_index] == child:
+                        tag_number = other_index + 1
+                        break
+
+                self.steps[id(child)] = (child, f"{name}[{tag_number}]")
+
+    def get_structure_hash(self, tag):
+        """
+        :return: Hash of the name, attributes and contents of the tag, equal tags have equal hashes
+        """
+        cached = self.structure_hashes.get(id(tag))
+        if cached is not None and cached[0] is tag:
+            return cached[1]
+
+        # Post-order without recursion, trees can be deeper than the recursion limit
+        stack = [(tag, False)]
+        while len(stack) > 0:
+            node, children_done = stack.pop()
+            if not children_done:
+                stack.append((node, True))
+                for child in node.contents:
+                    if not isinstance(child, NavigableString):
+                        cached = self.structure_hashes.get(id(child))
+                        if cached is None or cached[0] is not child:
+                            stack.append((child, False))
+                continue
+
+            child_hashes = []
+            for child in node.contents:
+                if isinstance(child, NavigableString):
+                    child_hashes.append(hash(str(child)))
+                else:
+                    child_hashes.append(self.structure_hashes[id(child)][1])
+
+            attributes = tuple(sorted((attr, tuple(value) if isinstance(value, list) else value)
+                                      for attr, value in node.attrs.items()))
+            self.structure_hashes[id(node)] = (node, hash((node.name, attributes, tuple(child_hashes))))
+
+        return self.structure_hashes[id(tag)][1]
+
+    def get_distance(self, tag, other_tag):
+        return get_path_distance(self.get_path(tag), self.get_path(other_tag))
+
+    def has_equal_ancestor(self, tag, parent):
+        """
+        :return: True if an ancestor of the tag is equal to parent, the same as comparing every ancestor with ==
+        """
+        parent_hash = self.get_structure_hash(parent)
+        while tag.parent is not None:
+            tag = tag.parent
+            if tag is parent:
+                return True
+            if self.get_structure_hash(tag) == parent_hash and tag == parent:
+                return True
+        return False
+
+
+def get_path_distance(path, other_path):
+    """
+    :return: Number of steps between the tags of the paths through their lowest common ancestor,
+             0 for the same path and the difference in depth + 1 if one path contains the other
+    """
+    length = len(path)
+    other_length = len(other_path)
+    min_length = min(length, other_length)
+
+    common_length = 0
+    while common_length < min_length and path[common_length] == other_path[common_length]:
+        common_length += 1
+
+    if common_length == min_length:
+        if length == other_length:
+            return 0
+        return abs(length - other_length) + 1
+
+    return length + other_length - 2 * common_length - 1
+
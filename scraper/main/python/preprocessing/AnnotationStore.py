@@ -0,0 +1,164 @@
+import json
+
+from bs4 import NavigableString
+
+from preprocessing import TreeState
+
+DATA = 'scraper-data'
+FALLBACK = 'scraper-fallback'
+
+COUNT_ATTRIBUTES = {
+    DATA: 'scraper-counts',
+    FALLBACK: 'scraper-fallback-counts'
+}
+
+
+class AnnotationStore:
+    """
+    Values found by the ValueTagger, kept in a side table keyed by tag identity instead of JSON attributes.
+    Label counts of each tag's subtree are aggregated bottom-up once, the first time they are read.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.tags = {}
+        self.data = {DATA: {}, FALLBACK: {}}
+        self.counts = {DATA: {}, FALLBACK: {}}
+        self.counts_dirty = False
+        self.value_count = 0
+
+    def add_data(self, tag, label, value, data_attribute=DATA):
+        self.tags[id(tag)] = tag
+
+        tag_data = self.data[data_attribute].setdefault(id(tag), {})
+        if label not in tag_data:
+            tag_data[label] = [value]
+        else:
+            tag_data[label].append(value)
+
+        self.value_count += 1
+        self.counts_dirty = True
+
+    def get_data(self, tag, data_attribute=DATA):
+        """
+        :return: Dict of label: list of values found directly in the tag
+        """
+        return self.data[data_attribute].get(id(tag), {})
+
+    def get_values(self, tag, label, data_attribute=DATA):
+        return self.get_data(tag, data_attribute).get(label, [])
+
+    def get_counts(self, tag, data_attribute=DATA):
+        """
+        :return: Dict of label: number of values found in the tag and its descendants
+        """
+        if self.counts_dirty:
+            self.aggregate_counts()
+        return self.counts[data_attribute].get(id(tag), {})
+
+    def has_counts(self, tag):
+        return len(self.get_counts(tag)) > 0 or len(self.get_counts(tag, FALLBACK)) > 0
+
+    def aggregate_counts(self):
+        """
+        Count the values of every tag's subtree in a single bottom-up pass over the tree
+        """
+        self.counts = {DATA: {}, FALLBACK: {}}
+
+        # Descendants come after their ancestors in document order, so in reverse every child is done first
+        tags = [self.root]
+        tags.extend(self.root.find_all())
+
+        for data_attribute in [DATA, FALLBACK]:
+            data = self.data[data_attribute]
+            counts = self.counts[data_attribute]
+
+            for tag in reversed(tags):
+                tag_counts = counts.get(id(tag))
+
+                tag_data = data.get(id(tag))
+                if tag_data is not None:
+                    if tag_counts is None:
+                        tag_counts = counts[id(tag)] = {}
+                    for label, values in tag_data.items():
+                        tag_counts[label] = tag_counts.get(label, 0) + len(values)
+
+                if tag_counts is None or tag is self.root or tag.parent is None:
+                    continue
+
+                self.tags[id(tag.parent)] = tag.parent
+                parent_counts = counts.setdefault(id(tag.parent), {})
+                for label, count in tag_counts.items():
+                    parent_counts[label] = parent_counts.get(label, 0) + count
+
+        self.counts_dirty = False
+
+    def merge_counts(self, tag, target):
+        """
+        Add the counts of tag to target, used when tag is moved into target
+        """
+        if self.counts_dirty:
+            self.aggregate_counts()
+
+        self.tags[id(target)] = target
+        for data_attribute in [DATA, FALLBACK]:
+            tag_counts = self.counts[data_attribute].get(id(tag), {})
+            target_counts = self.counts[data_attribute].setdefault(id(target), {})
+
+            for label, count in tag_counts.items():
+                target_counts[label] = target_counts.get(label, 0) + count
+
+    def write_attributes(self):
+        """
+        Write the annotations to the tags as JSON attributes, only used for debug output
+        """
+        if self.counts_dirty:
+            self.aggregate_counts()
+
+        for data_attribute in [DATA, FALLBACK]:
+            count_attribute = COUNT_ATTRIBUTES[data_attribute]
+
+            for tag_id, tag_data in self.data[data_attribute].items():
+                self.tags[tag_id].attrs[data_attribute] = json.dumps(tag_data)
+            for tag_id, tag_counts in self.counts[data_attribute].items():
+                self.tags[tag_id].attrs[count_attribute] = json.dumps(tag_counts)
+
+
+def get_store(tag, create=False):
+    """
+    :return: The annotation store of the tree, attached to its root tag
+    :param create: Create an empty store if the tree has none, otherwise it is read from the JSON attributes
+    """
+    if isinstance(tag, NavigableString):
+        tag = tag.parent
+
+    return TreeState.get_state(tag, 'scraper_annotations', AnnotationStore if create else from_attributes, keep=True)
+
+
+def serialize_annotations(tag):
+    """
+    Write the annotations of the tree to its tags as JSON attributes, if it has any
+    """
+    store = TreeState.get_state(tag, 'scraper_annotations')
+    if store is not None:
+        store.write_attributes()
+
+
+def from_attributes(root):
+    """
+    Read the annotations of a tree whose values were written as JSON attributes, e.g. a saved tree
+    """
+    store = AnnotationStore(root)
+
+    tags = [root]
+    tags.extend(root.find_all())
+
+    for tag in tags:
+        for data_attribute, count_attribute in COUNT_ATTRIBUTES.items():
+            if data_attribute in tag.attrs:
+                store.tags[id(tag)] = tag
+                store.data[data_attribute][id(tag)] = json.loads(tag.attrs[data_attribute])
+            if count_attribute in tag.attrs:
+                store.tags[id(tag)] = tag
+                store.counts[data_attribute][id(tag)] = json.loads(tag.attrs[count_attribute])
+
+    return store
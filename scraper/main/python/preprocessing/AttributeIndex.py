@@ -0,0 +1,58 @@
+import logging
+import timeit
+
+from preprocessing import TreeState
+
+
+class AttributeIndex:
+    """
+    All attributes of a tree as (tag, attribute name) entries in document order, with the entries of each
+    attribute name, so that attribute rules only visit the attributes their attribute_regex matches
+    instead of every attribute of every tag. Values are read from the tags, so replaced values are seen.
+    """
+    def __init__(self, root):
+        start = timeit.default_timer()
+
+        self.root = root
+        self.entries = []
+        self.entries_by_name = {}
+        self.entries_by_regex = {}
+
+        for tag in root.find_all():
+            for attr in tag.attrs:
+                self.entries_by_name.setdefault(attr, []).append(len(self.entries))
+                self.entries.append((tag, attr))
+
+        logging.log(19, f"AttributeIndex > Index {len(self.entries)} attributes of {len(self.entries_by_name)} "
+                        f"names {timeit.default_timer() - start:.3f}s")
+
+    def get_entries(self, attribute_regex):
+        """
+        :return: List of (tag, attribute name) in document order, for the attribute names matching attribute_regex
+        """
+        entries = self.entries_by_regex.get(attribute_regex)
+        if entries is None:
+            entry_indexes = []
+            for attr, name_entries in self.entries_by_name.items():
+                if attribute_regex.search(attr):
+                    entry_indexes.extend(name_entries)
+
+            entries = [self.entries[entry_index] for entry_index in sorted(entry_indexes)]
+            self.entries_by_regex[attribute_regex] = entries
+
+        return entries
+
+
+def get_index(tag, create=True):
+    """
+    :return: The attribute index attached to the root of the tree
+    :param create: Build an index that isn't kept if the tree has none, otherwise None is returned
+    """
+    return TreeState.get_state(tag, 'scraper_attribute_index', AttributeIndex if create else None)
+
+
+def attach_index(root):
+    """
+    Keep an attribute index on the root of the tree, only valid while no tags or attributes are added or removed
+    """
+    return TreeState.attach_state(root, 'scraper_attribute_index', AttributeIndex(root))
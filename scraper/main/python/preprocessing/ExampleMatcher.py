@@ -0,0 +1,127 @@
+from collections import deque
+
+
+class ExampleMatcher:
+    """
+    Aho-Corasick automaton over the examples of an example_driven rule. A single scan of a text
+    returns the indexes of all examples that occur in it, so only those examples have to be
+    checked with their word boundary regex.
+    Matching is a superset of the example regexes: word boundaries are left to the regexes,
+    and with ignore_case both the examples and the text are case-folded.
+    """
+    def __init__(self, examples, ignore_case=False):
+        self.ignore_case = ignore_case
+        self.transitions = [{}]
+        self.fail = [0]
+        self.outputs = [[]]
+        self.lengths = []
+        # Empty examples can match anywhere, so they are always candidates
+        self.always = []
+
+        for index, example in enumerate(examples):
+            pattern = self.normalize(str(example))
+            self.lengths.append(len(pattern))
+            if len(pattern) == 0:
+                self.always.append(index)
+                continue
+            self.add_pattern(pattern, index)
+
+        self.build_fail_links()
+
+    def normalize(self, text):
+        if self.ignore_case:
+            return text.casefold()
+        return text
+
+    def add_pattern(self, pattern, index):
+        state = 0
+        for char in pattern:
+            next_state = self.transitions[state].get(char)
+            if next_state is None:
+                next_state = len(self.transitions)
+                self.transitions.append({})
+                self.fail.append(0)
+                self.outputs.append([])
+                self.transitions[state][char] = next_state
+            state = next_state
+        self.outputs[state].append(index)
+
+    def build_fail_links(self):
+        queue = deque(self.transitions[0].values())
+
+        while len(queue) > 0:
+            state = queue.popleft()
+            for char, next_state in self.transitions[state].items():
+                queue.append(next_state)
+
+                fail_state = self.fail[state]
+                while fail_state != 0 and char not in self.transitions[fail_state]:
+                    fail_state = self.fail[fail_state]
+                fail_state = self.transitions[fail_state].get(char, 0)
+
+                self.fail[next_state] = fail_state
+                self.outputs[next_state] = self.outputs[next_state] + self.outputs[fail_state]
+
+    def get_state(self):
+        """
+        :return: The built automaton as plain lists and dicts, e.g. to store it in the table snapshot
+        """
+        return self.ignore_case, self.transitions, self.fail, self.outputs, self.lengths, self.always
+
+    def find(self, text):
+        """
+        :return: Set of indexes of the examples that occur in the text
+        """
+        found_examples = set(self.always)
+
+        for end, example_indexes in self.find_ends(self.normalize(str(text))):
+            found_examples.update(example_indexes)
+
+        return found_examples
+
+    def find_ends(self, text):
+        """
+        Scan an already normalized text
+        :return: Generator of (offset of the last character, indexes of the examples ending there)
+        """
+        transitions = self.transitions
+        fail = self.fail
+        outputs = self.outputs
+
+        state = 0
+        for offset, char in enumerate(text):
+            while state != 0 and char not in transitions[state]:
+                state = fail[state]
+            state = transitions[state].get(char, 0)
+
+            if len(outputs[state]) > 0:
+                yield offset, outputs[state]
+
+
+def from_state(state):
+    """
+    Restore a matcher from get_state without building the automaton again
+    """
+    matcher = ExampleMatcher([], state[0])
+    matcher.transitions, matcher.fail, matcher.outputs, matcher.lengths, matcher.always = state[1:]
+    return matcher
+
+
+matcher_cache = {}
+MATCHER_CACHE_SIZE = 64
+
+
+def get_matcher(examples, ignore_case=False):
+    """
+    :return: A cached ExampleMatcher for the examples, table sourced examples are the same for every page
+    """
+    key = (ignore_case, tuple(str(example) for example in examples))
+
+    matcher = matcher_cache.get(key)
+    if matcher is None:
+        if len(matcher_cache) >= MATCHER_CACHE_SIZE:
+            matcher_cache.pop(next(iter(matcher_cache)))
+        matcher = ExampleMatcher(examples, ignore_case)
+        matcher_cache[key] = matcher
+
+    return matcher
@@ -9,8 +9,10 @@ from bs4 import NavigableString
 import css_inline
 from premailer import Premailer
 
+from preprocessing import StreamingCleaner
+from preprocessing.SelectorIndex import SelectorIndex
 from scrapers.ScraperSettings import ScraperSettings
-from services import SettingsService
+from services import SettingsService, CleaningStatisticsService
 
 settings_service = SettingsService.service
 
@@ -18,36 +20,91 @@ settings_service = SettingsService.service
 def clean_data(soup, scraper_settings: ScraperSettings):
     inlined_source = inline_css(str(soup), scraper_settings)
 
-    soup = make_soup(inlined_source)
-
-    inline_images(soup, scraper_settings)
+    streaming_cleaning = settings_service.get_scraper_setting('streaming_cleaning', scraper_settings.scraper_type,
+                                                              default=False, optional=True)
+    if streaming_cleaning is True:
+        soup, streamed_steps = StreamingCleaner.make_clean_soup(inlined_source, scraper_settings)
+    else:
+        soup, streamed_steps = make_soup(inlined_source), []
 
-    remove_comments(soup, scraper_settings)
-    remove_invisible_tags(soup, scraper_settings)
-    remove_excluded_tags(soup, scraper_settings)
-    remove_non_whitelisted_attributes(soup, scraper_settings)
+    cleaning_profile = CleaningStatisticsService.get_profile(scraper_settings)
 
-    flatten_text(soup, scraper_settings)
-    flatten_special_strings(soup, scraper_settings)
+    for cleaning_step in get_cleaning_steps():
+        if cleaning_step.__name__ not in streamed_steps:
+            run_cleaning_step(cleaning_step, soup, scraper_settings, cleaning_profile)
 
-    remove_redundant_punctuation(soup, scraper_settings)
-    remove_punctuation_whitespace(soup, scraper_settings)
-    remove_duplicate_whitespace(soup, scraper_settings)
-    remove_empty_tags(soup, scraper_settings)
+    cleaning_profile.save()
 
     return soup
 
 
+def make_inlined_soup(soup, scraper_settings: ScraperSettings):
+    """
+    :return: Body of the page with its css inlined, before any cleaning step ran
+    """
+    return make_soup(inline_css(str(soup), scraper_settings))
+
+
+def clean_container(container, scraper_settings: ScraperSettings):
+    """
+    Cheap pass for a part of a page from make_inlined_soup, e.g. the container of a record template.
+    Steps skipped for the domain are skipped here too, but the changes in a single container aren't recorded
+    in its cleaning statistics. Most steps only change the tags they run on, so the container is cleaned the same
+    as by clean_data without running the steps over the rest of the page. flatten_special_strings flattens
+    the parent of each special string's tag and remove_empty_tags removes emptied parents, so they can flatten
+    or remove the container itself, e.g. when it directly holds a special string.
+    :return: The cleaned container, or None if cleaning removed it from the page
+    """
+    cleaning_profile = CleaningStatisticsService.get_profile(scraper_settings)
+
+    for cleaning_step in get_cleaning_steps():
+        if not cleaning_profile.should_skip(cleaning_step.__name__):
+            cleaning_step(container, scraper_settings)
+
+        if container.parent is None:
+            return None
+
+    return container
+
+
+def get_cleaning_steps():
+    return [inline_images, remove_comments, remove_invisible_tags, remove_excluded_tags,
+            remove_non_whitelisted_attributes,
+            flatten_text, flatten_special_strings,
+            remove_redundant_punctuation, remove_punctuation_whitespace,
+            remove_duplicate_whitespace, remove_empty_tags]
+
+
+def run_cleaning_step(cleaning_step, soup, scraper_settings, cleaning_profile):
+    """
+    Run a cleaning step and record how many nodes it changed, unless it is a no-op for this domain.
+    """
+    step_name = cleaning_step.__name__
+    if cleaning_profile.should_skip(step_name):
+        cleaning_profile.skip(step_name)
+        return
+
+    start = timeit.default_timer()
+    changed = cleaning_step(soup, scraper_settings)
+
+    # Ignored steps return None
+    if changed is not None:
+        cleaning_profile.record(step_name, changed, timeit.default_timer() - start)
+
+
 def remove_comments(soup, scraper_settings):
     start = timeit.default_timer()
 
     if 'remove_comments' in scraper_settings.configuration.ignored_cleaning_steps:
         return
-    for comment in soup.find_all(text=lambda text: isinstance(text, Comment)):
+    comments = soup.find_all(text=lambda text: isinstance(text, Comment))
+    for comment in comments:
         comment.extract()
 
     logging.log(19, f"HtmlCleaner > Remove comments {timeit.default_timer() - start:.3f}s")
 
+    return len(comments)
+
 
 def inline_css(page_source, scraper_settings):
     start = timeit.default_timer()
@@ -116,29 +173,53 @@ def remove_excluded_tags(soup, scraper_settings):
         return
 
     excluded_tags = settings_service.get_scraper_setting('excluded_tags', scraper_settings.scraper_type)
+    selector_index = SelectorIndex(soup)
+    found_tags = selector_index.select_all(excluded_tags)
+    removed_count = 0
+
     for excluded_tag in excluded_tags:
-        for tag in soup.select(excluded_tag):
-            tag.replace_with('\n')
+        for tag in get_found_tags(soup, found_tags, excluded_tag):
+            # Skip tags that were removed together with an excluded parent
+            if selector_index.is_attached(tag):
+                tag.replace_with('\n')
+                removed_count += 1
 
     logging.log(19, f"HtmlCleaner > Remove excluded tags {timeit.default_timer() - start:.3f}s")
 
+    return removed_count
+
+
+def get_found_tags(soup, found_tags, selector):
+    """
+    :return: Tags of the selector from the selector index, or from soupsieve on the tree as it is now
+    """
+    if selector in found_tags:
+        return found_tags[selector]
+    return soup.select(selector)
+
 
 def remove_invisible_tags(soup, scraper_settings):
     start = timeit.default_timer()
 
     if 'remove_invisible_tags' in scraper_settings.configuration.ignored_cleaning_steps:
         return
+    removed_count = 0
     for invisible_tag in settings_service.get_scraper_setting('invisible_tag_regex', scraper_settings.scraper_type):
-        remove_tags_by_criteria(soup, style=regex.compile(invisible_tag))
-    remove_tags_by_criteria(soup, hidden=True)
+        removed_count += remove_tags_by_criteria(soup, style=regex.compile(invisible_tag))
+    removed_count += remove_tags_by_criteria(soup, hidden=True)
 
     logging.log(19, f"HtmlCleaner > Remove invisible tags {timeit.default_timer() - start:.3f}s")
 
+    return removed_count
+
 
 def remove_tags_by_criteria(soup, **kwargs):
-    for hidden_tag in soup.find_all(**kwargs):
+    hidden_tags = soup.find_all(**kwargs)
+    for hidden_tag in hidden_tags:
         hidden_tag.extract()
 
+    return len(hidden_tags)
+
 
 def remove_non_whitelisted_attributes(soup, scraper_settings):
     start = timeit.default_timer()
@@ -147,6 +228,7 @@ def remove_non_whitelisted_attributes(soup, scraper_settings):
         return
     whitelisted_attributes = settings_service.get_scraper_setting('whitelisted_attributes', scraper_settings.scraper_type)
     whitelisted_attributes.append('scraper-index')
+    changed_count = 0
 
     for tag in soup.find_all():
         try:
@@ -154,12 +236,16 @@ def remove_non_whitelisted_attributes(soup, scraper_settings):
             for attr in tag.attrs:
                 if attr in whitelisted_attributes:
                     remaining_attrs[attr] = tag.attrs[attr]
+            if len(remaining_attrs) != len(tag.attrs):
+                changed_count += 1
             tag.attrs = remaining_attrs
         except AttributeError:
             pass
 
     logging.log(19, f"HtmlCleaner > Remove non-whitelisted attributes {timeit.default_timer() - start:.3f}s")
 
+    return changed_count
+
 
 def flatten_text(soup, scraper_settings):
     start = timeit.default_timer()
@@ -167,10 +253,17 @@ def flatten_text(soup, scraper_settings):
     if 'flatten_text' in scraper_settings.configuration.ignored_cleaning_steps:
         return
     flattened_tags = settings_service.get_scraper_setting('flattened_tags', scraper_settings.scraper_type)
+    selector_index = SelectorIndex(soup)
+    found_tags = selector_index.select_all(flattened_tags)
+    flattened_count = 0
+
     for flattened_tag in flattened_tags:
-        for tag in soup.select(flattened_tag):
+        for tag in get_found_tags(soup, found_tags, flattened_tag):
+            if not selector_index.is_attached(tag):
+                continue
             if isinstance(tag, NavigableString):
                 clean_extract(tag)
+                flattened_count += 1
             else:
                 all_flattenable_children = True
                 for child in tag.find_all():
@@ -180,9 +273,12 @@ def flatten_text(soup, scraper_settings):
 
                 if all_flattenable_children:
                     clean_extract(tag)
+                    flattened_count += 1
 
     logging.log(19, f"HtmlCleaner > Flatten text {timeit.default_timer() - start:.3f}s")
 
+    return flattened_count
+
 
 def flatten_special_strings(soup, scraper_settings):
     start = timeit.default_timer()
@@ -190,14 +286,18 @@ def flatten_special_strings(soup, scraper_settings):
     if 'flatten_special_strings' in scraper_settings.configuration.ignored_cleaning_steps:
         return
     flattened_special_strings = settings_service.get_scraper_setting('flattened_special_strings', scraper_settings.scraper_type)
+    flattened_count = 0
     for flattened_special_string in flattened_special_strings:
         for string in soup.find_all(string=flattened_special_string):
             tag = string.parent
             for child in list(tag.parent.children).copy():
                 clean_extract(child)
+                flattened_count += 1
 
     logging.log(19, f"HtmlCleaner > Flatten special strings {timeit.default_timer() - start:.3f}s")
 
+    return flattened_count
+
 
 def inline_images(soup, scraper_settings):
     start = timeit.default_timer()
@@ -205,21 +305,41 @@ def inline_images(soup, scraper_settings):
     if 'inline_images' in scraper_settings.configuration.ignored_cleaning_steps:
         return
 
-    url_regex = regex.compile('(?<=url\\(["\'])(.*?)(?=["\']\\))')
-    for tag in soup.find_all(style=regex.compile('background(-image)?')):
-        style = tag.attrs['style']
-        image_url = regex.search(url_regex, style)
+    inlined_count = 0
+    for tag in soup.find_all(style=background_regex):
+        image_url = get_background_image(tag)
 
         if image_url is None:
             continue
 
-        temp_soup = BeautifulSoup(f'<img src="{image_url.group()}"/>', 'lxml')
-        new_tag = temp_soup.html.body.contents[0]
-
-        tag.append(new_tag)
+        tag.append(make_image_tag(image_url))
+        inlined_count += 1
 
     logging.log(19, f"HtmlCleaner > Inline images {timeit.default_timer() - start:.3f}s")
 
+    return inlined_count
+
+
+background_regex = regex.compile('background(-image)?')
+url_regex = regex.compile('(?<=url\\(["\'])(.*?)(?=["\']\\))')
+
+
+def get_background_image(tag):
+    style = tag.attrs.get('style')
+    if style is None or regex.search(background_regex, style) is None:
+        return None
+
+    image_url = regex.search(url_regex, style)
+    if image_url is None:
+        return None
+
+    return image_url.group()
+
+
+def make_image_tag(image_url):
+    temp_soup = BeautifulSoup(f'<img src="{image_url}"/>', 'lxml')
+    return temp_soup.html.body.contents[0]
+
 
 def remove_empty_tags(soup, scraper_settings):
     start = timeit.default_timer()
@@ -228,6 +348,7 @@ def remove_empty_tags(soup, scraper_settings):
         return
     empty_tags = settings_service.get_scraper_setting('empty_tags', scraper_settings.scraper_type)
 
+    removed_count = 0
     tags = soup.find_all()
     for tag in tags:
         if tag is None:
@@ -235,9 +356,12 @@ def remove_empty_tags(soup, scraper_settings):
         if count_contents(tag) == 0 and tag.name not in empty_tags:
             tags.append(tag.parent)
             clean_extract(tag)
+            removed_count += 1
 
     logging.log(19, f"HtmlCleaner > Remove empty tags {timeit.default_timer() - start:.3f}s")
 
+    return removed_count
+
 
 def count_contents(tag):
     count = 0
@@ -302,12 +426,17 @@ def remove_duplicate_whitespace(soup, scraper_settings):
     whitespace_regex = regex.compile(r'[\s\n\r\t\v\f\0]+')
     found_tags = soup.find_all(string=whitespace_regex)
 
+    changed_count = 0
     for tag in found_tags:
         rez_text = whitespace_regex.sub(' ', tag)
+        if rez_text != tag:
+            changed_count += 1
         tag.replace_with(rez_text)
 
     logging.log(19, f"HtmlCleaner > Remove duplicate whitespace {timeit.default_timer() - start:.3f}s")
 
+    return changed_count
+
 
 def remove_punctuation_whitespace(soup, scraper_settings):
     start = timeit.default_timer()
@@ -316,6 +445,7 @@ def remove_punctuation_whitespace(soup, scraper_settings):
         return
 
     punctuation_marks = settings_service.get_scraper_setting('punctuation_marks', scraper_settings.scraper_type)
+    changed_count = 0
     for punctuation_mark in punctuation_marks:
         punctuation_regex = regex.compile(f'\\s+{regex.escape(punctuation_mark)}')
         found_tags = soup.find_all(string=punctuation_regex)
@@ -323,9 +453,12 @@ def remove_punctuation_whitespace(soup, scraper_settings):
         for tag in found_tags:
             rez_text = punctuation_regex.sub(punctuation_mark, tag)
             tag.replace_with(rez_text)
+            changed_count += 1
 
     logging.log(19, f"HtmlCleaner > Remove punctuation whitespace {timeit.default_timer() - start:.3f}s")
 
+    return changed_count
+
 
 def remove_redundant_punctuation(soup, scraper_settings):
     start = timeit.default_timer()
@@ -334,6 +467,7 @@ def remove_redundant_punctuation(soup, scraper_settings):
         return
 
     redundant_punctuation_marks = settings_service.get_scraper_setting('redundant_punctuation_marks', scraper_settings.scraper_type)
+    changed_count = 0
     for punctuation_mark in redundant_punctuation_marks:
         punctuation_regex = regex.compile(f'\\s*{regex.escape(punctuation_mark)}\\s*')
         found_tags = soup.find_all(string=punctuation_regex)
@@ -341,5 +475,8 @@ def remove_redundant_punctuation(soup, scraper_settings):
         for tag in found_tags:
             rez_text = punctuation_regex.sub(' ', tag)
             tag.replace_with(rez_text)
+            changed_count += 1
+
+    logging.log(19, f"HtmlCleaner > Remove redundant punctuation {timeit.default_timer() - start:.3f}s")
 
-    logging.log(19, f"HtmlCleaner > Remove redundant punctuation {timeit.default_timer() - start:.3f}s")
\ No newline at end of file
+    return changed_count
\ No newline at end of file
@@ -0,0 +1,96 @@
+import logging
+
+from preprocessing import TreeState
+from scrapers.ScraperSettings import ScraperSettings
+from services import SettingsService
+
+settings_service = SettingsService.service
+
+MAX_DOMAIN_MEMOS = 4
+DEFAULT_MEMO_SIZE = 100000
+
+domain_memos = {}
+
+
+class MatchMemo:
+    """
+    Regex matches of texts that were already searched, catalog pages repeat the same strings on every card,
+    e.g. fuel types, units and currencies. Keys are the exact text, as match spans are only valid for it.
+    The least recently used matches are dropped when max_size is reached.
+    """
+    def __init__(self, key, max_size):
+        self.key = key
+        self.max_size = max_size
+        self.matches = {}
+
+        self.hit_count = 0
+        self.miss_count = 0
+
+    def search(self, compiled_regex, text):
+        """
+        Equivalent to compiled_regex.search(text)
+        """
+        key = (compiled_regex, text)
+
+        # Plain strings don't keep the tree of a NavigableString alive in a domain memo
+        if key in self.matches:
+            self.hit_count += 1
+            # Move the match to the end, so the oldest match is the least recently used one
+            match = self.matches.pop(key)
+            self.matches[(compiled_regex, str(text))] = match
+            return match
+
+        self.miss_count += 1
+
+        text = str(text)
+        match = compiled_regex.search(text)
+        self.add(compiled_regex, text, match)
+
+        return match
+
+    def contains(self, compiled_regex, text):
+        return (compiled_regex, text) in self.matches
+
+    def add(self, compiled_regex, text, match):
+        """
+        Keep the match of a text, e.g. one searched on a thread pool
+        """
+        if self.max_size > 0:
+            if len(self.matches) >= self.max_size:
+                self.matches.pop(next(iter(self.matches)))
+            self.matches[(compiled_regex, str(text))] = match
+
+    def log_statistics(self):
+        searches = self.hit_count + self.miss_count
+        hit_rate = self.hit_count / max(1, searches)
+        logging.log(19, f"MatchMemo > {self.key}: {self.hit_count}/{searches} cached matches ({hit_rate:.0%}), "
+                        f"{len(self.matches)} kept")
+
+
+def get_memo(tag):
+    """
+    :return: The match memo attached to the root of the tree, or a new memo that isn't kept if it has none
+    """
+    return TreeState.get_state(tag, 'scraper_match_memo', lambda root: MatchMemo('page', DEFAULT_MEMO_SIZE))
+
+
+def attach_memo(root, scraper_settings: ScraperSettings):
+    """
+    Keep a match memo on the root of the tree, shared by the pages of a domain if domain_match_memo is set
+    """
+    max_size = settings_service.get_scraper_setting('match_memo_size', scraper_settings.scraper_type,
+                                                    default=DEFAULT_MEMO_SIZE, optional=True)
+
+    if settings_service.get_scraper_setting('domain_match_memo', scraper_settings.scraper_type,
+                                            default=False, optional=True):
+        key = f"{scraper_settings.scraper_type.value}_{scraper_settings.domain}"
+        match_memo = domain_memos.get(key)
+        if match_memo is None:
+            if len(domain_memos) >= MAX_DOMAIN_MEMOS:
+                domain_memos.pop(next(iter(domain_memos)))
+            match_memo = MatchMemo(key, max_size)
+            domain_memos[key] = match_memo
+    else:
+        match_memo = MatchMemo('page', max_size)
+
+    return TreeState.attach_state(root, 'scraper_match_memo', match_memo)
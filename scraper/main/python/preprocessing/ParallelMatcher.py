@@ -0,0 +1,132 @@
+import logging
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+
+from preprocessing import TextBuffer, MatchMemo
+
+
+class MatchPrefetch:
+    """
+    Results of the regex_driven rules' searches over a snapshot of the tree, computed on a thread pool
+    with the GIL released. The ValueTagger still applies the rules one after another, and only uses
+    a prefetched result while the string or attribute value is the one it was computed for,
+    so the tagged tree is the same as when tagging serially.
+    Strings are those of the tree's TextBuffer, each distinct text is searched once per rule
+    and texts the MatchMemo already has a match for aren't searched again.
+    """
+    def __init__(self, soup, match_memo=None):
+        self.text_buffer = TextBuffer.get_buffer(soup)
+        self.texts = list(dict.fromkeys(self.text_buffer.texts))
+        self.match_memo = match_memo if match_memo is not None else MatchMemo.get_memo(soup)
+
+        self.tags = soup.find_all()
+        self.tag_positions = {id(tag): position for position, tag in enumerate(self.tags)}
+
+        self.text_matches = {}
+        self.attribute_matches = {}
+        self.hit_count = 0
+        self.miss_count = 0
+
+    def prefetch(self, compiled_rules, thread_count):
+        start = timeit.default_timer()
+
+        with ThreadPoolExecutor(max_workers=thread_count) as executor:
+            text_futures = {}
+            attribute_futures = {}
+
+            for compiled_rule in compiled_rules:
+                tags = compiled_rule.tags
+                if 'regex_driven' not in tags or compiled_rule.value_regex is None:
+                    continue
+
+                value_regex = compiled_rule.value_regex
+                if 'text' in tags and value_regex not in text_futures:
+                    texts = [text for text in self.texts if not self.match_memo.contains(value_regex, text)]
+                    text_futures[value_regex] = (texts, executor.submit(search_texts, value_regex, texts))
+
+                if 'attribute' in tags and compiled_rule.attribute_regex is not None:
+                    key = (compiled_rule.attribute_regex, compiled_rule.value_regex)
+                    if key not in attribute_futures:
+                        attribute_futures[key] = executor.submit(
+                            search_attributes, compiled_rule.attribute_regex, compiled_rule.value_regex, self.tags)
+
+            # Merged on this thread in rule order, so the memo is the same after every run
+            for value_regex, (texts, future) in text_futures.items():
+                matches = dict(zip(texts, future.result()))
+                for text, match in matches.items():
+                    self.match_memo.add(value_regex, text, match)
+                self.text_matches[value_regex] = matches
+            for key, future in attribute_futures.items():
+                self.attribute_matches[key] = future.result()
+
+        logging.log(19, f"ParallelMatcher > Prefetch {len(self.text_matches)} text and "
+                        f"{len(self.attribute_matches)} attribute rules {timeit.default_timer() - start:.3f}s")
+
+    def find_matches(self, value_regex):
+        """
+        Equivalent to soup.find_all(string=value_regex)
+        :return: List of (string, match of value_regex in the string) in document order
+        """
+        matches = self.text_matches.get(value_regex)
+        if matches is None:
+            return self.text_buffer.find_matches(value_regex, self.match_memo)
+
+        found_matches = []
+        for string, text in zip(self.text_buffer.strings, self.text_buffer.texts):
+            # Matches are only valid for the exact text, texts of strings replaced by earlier rules
+            # and texts the memo already had weren't prefetched
+            if text in matches:
+                self.hit_count += 1
+                found = matches[text]
+            else:
+                self.miss_count += 1
+                found = self.match_memo.search(value_regex, string)
+
+            if found is not None:
+                found_matches.append((string, found))
+
+        return found_matches
+
+    def search_attribute(self, tag, attr, attribute_regex, target_regex):
+        """
+        Equivalent to regex.search(target_regex, tag.attrs[attr]) for attributes matching attribute_regex
+        """
+        attr_value = tag.attrs[attr]
+
+        matches = self.attribute_matches.get((attribute_regex, target_regex))
+        position = self.tag_positions.get(id(tag))
+        if matches is not None and position is not None and self.tags[position] is tag:
+            prefetched = matches[position].get(attr)
+            # Only valid while the value hasn't been replaced by an earlier rule
+            if prefetched is not None and prefetched[0] is attr_value:
+                self.hit_count += 1
+                return prefetched[1]
+
+        self.miss_count += 1
+        return target_regex.search(attr_value)
+
+    def log_statistics(self):
+        logging.log(19, f"ParallelMatcher > {self.hit_count} prefetched results used, {self.miss_count} recomputed")
+
+
+def search_texts(value_regex, texts):
+    return [value_regex.search(text, concurrent=True) for text in texts]
+
+
+def search_attributes(attribute_regex, value_regex, tags):
+    tag_matches = []
+
+    for tag in tags:
+        matches = {}
+        for attr, attr_value in tag.attrs.items():
+            if isinstance(attr_value, str) and attribute_regex.search(attr, concurrent=True):
+                matches[attr] = (attr_value, value_regex.search(attr_value, concurrent=True))
+        tag_matches.append(matches)
+
+    return tag_matches
+
+
+def prefetch_matches(soup, compiled_rules, thread_count, match_memo=None):
+    match_prefetch = MatchPrefetch(soup, match_memo)
+    match_prefetch.prefetch(compiled_rules, thread_count)
+    return match_prefetch
@@ -0,0 +1,103 @@
+import logging
+import timeit
+from bisect import bisect_left, insort
+
+from bs4 import NavigableString
+
+from preprocessing import TreeState
+
+
+class PositionIndex:
+    """
+    Pre-order positions of all tags and strings of a tree, with the last position of each subtree
+    and sorted positions of the strings containing each label, so that label proximity checks
+    are bisect queries instead of subtree walks.
+    Strings replaced by the ValueTagger keep the position of the string they replace.
+    """
+    def __init__(self, root):
+        start = timeit.default_timer()
+
+        self.root = root
+        self.nodes = [root]
+        self.positions = {id(root): 0}
+        self.ends = [0]
+        self.label_positions = {}
+
+        open_positions = [0]
+        for position, node in enumerate(root.descendants, start=1):
+            while self.nodes[open_positions[-1]] is not node.parent:
+                self.ends[open_positions.pop()] = position - 1
+            if not isinstance(node, NavigableString):
+                open_positions.append(position)
+
+            self.nodes.append(node)
+            self.positions[id(node)] = position
+            self.ends.append(position)
+
+        for open_position in open_positions:
+            self.ends[open_position] = len(self.nodes) - 1
+
+        logging.log(19, f"PositionIndex > Index {len(self.nodes)} nodes {timeit.default_timer() - start:.3f}s")
+
+    def get_position(self, node):
+        """
+        :return: Position of the node, or None if it isn't part of the indexed tree
+        """
+        position = self.positions.get(id(node))
+        if position is None or self.nodes[position] is not node:
+            return None
+        return position
+
+    def get_end(self, position):
+        return self.ends[position]
+
+    def get_label_positions(self, label):
+        """
+        :return: Sorted positions of the strings containing the label
+        """
+        label_positions = self.label_positions.get(label)
+        if label_positions is None:
+            label_positions = [position for position, node in enumerate(self.nodes)
+                               if isinstance(node, NavigableString) and label in node]
+            self.label_positions[label] = label_positions
+        return label_positions
+
+    def has_label_between(self, label, first, last):
+        """
+        :return: True if a string containing the label is at a position in [first, last)
+        """
+        label_positions = self.get_label_positions(label)
+        label_index = bisect_left(label_positions, first)
+        return label_index < len(label_positions) and label_positions[label_index] < last
+
+    def replace(self, node, new_node):
+        """
+        Give new_node the position of node, which it replaced in the tree
+        """
+        position = self.get_position(node)
+        if position is None:
+            return
+
+        self.nodes[position] = new_node
+        del self.positions[id(node)]
+        self.positions[id(new_node)] = position
+
+        for label, label_positions in self.label_positions.items():
+            had_label = label in node
+            has_label = label in new_node
+            if had_label and not has_label:
+                label_positions.remove(position)
+            elif has_label and not had_label:
+                insort(label_positions, position)
+
+
+def get_index(tag, create=False):
+    """
+    :return: The position index of the tree, attached to its root tag
+    :param create: Build the index if the tree has none, otherwise None is returned
+    """
+    return TreeState.get_state(tag, 'scraper_positions', PositionIndex if create else None, keep=True)
+
+
+def rebuild_index(root):
+    return TreeState.attach_state(root, 'scraper_positions', PositionIndex(root))
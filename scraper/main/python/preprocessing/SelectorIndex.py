@@ -0,0 +1,361 @@
+import logging
+import timeit
+from bisect import bisect_left, bisect_right
+
+import regex
+from bs4 import NavigableString
+
+IDENTIFIER = r'-?(?:[_a-zA-Z]|[^\x00-\x7f]|\\[0-9a-fA-F]{1,6}\s?|\\[^\n0-9a-fA-F])' \
+             r'(?:[_a-zA-Z0-9\-]|[^\x00-\x7f]|\\[0-9a-fA-F]{1,6}\s?|\\[^\n0-9a-fA-F])*'
+QUOTED_VALUE = r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\''
+
+type_regex = regex.compile(f'(?:{IDENTIFIER}|\\*)')
+id_regex = regex.compile(f'#({IDENTIFIER})')
+class_regex = regex.compile(f'\\.({IDENTIFIER})')
+attribute_regex = regex.compile(f'\\[\\s*({IDENTIFIER})\\s*(?:=\\s*({IDENTIFIER}|{QUOTED_VALUE})\\s*)?\\]')
+combinator_regex = regex.compile(r'\s*>\s*|\s+')
+separator_regex = regex.compile(r'\s*,\s*')
+escape_regex = regex.compile(r'\\([0-9a-fA-F]{1,6})\s?|\\(.)')
+
+
+class UnsupportedSelector(Exception):
+    pass
+
+
+class CompoundSelector:
+    """
+    A single compound selector, e.g. 'a.paginator#next[href]'
+    """
+    def __init__(self, name=None, element_id=None, classes=None, attributes=None):
+        self.name = name
+        self.element_id = element_id
+        self.classes = classes or []
+        self.attributes = attributes or []
+
+    def matches(self, name, attrs):
+        if self.name is not None and self.name != name:
+            return False
+        if self.element_id is not None and attrs.get('id') != self.element_id:
+            return False
+
+        if len(self.classes) > 0:
+            class_list = attrs.get('class')
+            if class_list is None:
+                return False
+            if isinstance(class_list, str):
+                class_list = class_list.split()
+            for class_name in self.classes:
+                if class_name not in class_list:
+                    return False
+
+        for attribute, value in self.attributes:
+            if attribute not in attrs:
+                return False
+            if value is None:
+                continue
+
+            attr_value = attrs[attribute]
+            if isinstance(attr_value, list):
+                attr_value = ' '.join(attr_value)
+            if attribute == 'type':
+                # Soupsieve compares the type attribute case-insensitively in HTML documents
+                if attr_value.lower() != value.lower():
+                    return False
+            elif attr_value != value:
+                return False
+
+        return True
+
+
+class CompiledSelector:
+    """
+    A complex selector stored right-to-left, e.g. 'div.card > a span' is stored as
+    [(span, None), (a, ' '), (div.card, '>')]
+    """
+    def __init__(self, selector, parts):
+        self.selector = selector
+        self.parts = parts
+
+    def matches(self, tag):
+        return self.matches_element(tag.name, tag.attrs, tag.parent)
+
+    def matches_element(self, name, attrs, parent):
+        """
+        Match an element that is not necessarily part of the tree yet, but whose ancestors are.
+        """
+        if not self.parts[0][0].matches(name, attrs):
+            return False
+
+        return self.matches_ancestors(1, parent)
+
+    def matches_ancestors(self, part_index, parent):
+        if part_index == len(self.parts):
+            return True
+
+        compound, combinator = self.parts[part_index]
+
+        if combinator == '>':
+            if not is_element(parent) or not compound.matches(parent.name, parent.attrs):
+                return False
+            return self.matches_ancestors(part_index + 1, parent.parent)
+
+        while is_element(parent):
+            if compound.matches(parent.name, parent.attrs) and self.matches_ancestors(part_index + 1, parent.parent):
+                return True
+            parent = parent.parent
+
+        return False
+
+
+class SelectorIndex:
+    """
+    Indexes a tree by tag name, id and class in a single pass, so that a list of simple
+    selectors can be evaluated without running soupsieve over the full tree once per selector.
+    Selectors that can't be compiled are passed to soupsieve instead.
+    """
+    def __init__(self, soup):
+        start = timeit.default_timer()
+
+        self.root = soup
+        self.tags = []
+        self.positions = {id(soup): -1}
+        self.ends = {}
+        self.by_name = {}
+        self.by_id = {}
+        self.by_class = {}
+
+        open_tags = []
+        for position, tag in enumerate(soup.find_all()):
+            while len(open_tags) > 0 and open_tags[-1] is not tag.parent:
+                self.ends[id(open_tags.pop())] = position - 1
+            open_tags.append(tag)
+
+            self.tags.append(tag)
+            self.positions[id(tag)] = position
+            self.by_name.setdefault(tag.name, []).append(tag)
+
+            element_id = tag.attrs.get('id')
+            if isinstance(element_id, str):
+                self.by_id.setdefault(element_id, []).append(tag)
+
+            class_list = tag.attrs.get('class')
+            if class_list is not None:
+                if isinstance(class_list, str):
+                    class_list = class_list.split()
+                for class_name in set(class_list):
+                    self.by_class.setdefault(class_name, []).append(tag)
+
+        for tag in open_tags:
+            self.ends[id(tag)] = len(self.tags) - 1
+        self.ends[id(soup)] = len(self.tags) - 1
+
+        logging.log(19, f"SelectorIndex > Index {len(self.tags)} tags {timeit.default_timer() - start:.3f}s")
+
+    def select_all(self, selectors):
+        """
+        Evaluate the selectors the index supports. Selectors passed to soupsieve are left out, because
+        structural ones like :first-child have to see the tree after the tags of earlier selectors are removed.
+        :return: Dict of selector: list of matching tags in document order, for the supported selectors
+        """
+        return {selector: self.select(selector) for selector in selectors if is_supported(selector)}
+
+    def select(self, selector, scope=None):
+        """
+        Equivalent to scope.select(selector), where scope defaults to the indexed root.
+        """
+        if scope is None:
+            scope = self.root
+
+        try:
+            compiled_selectors = compile_selector(selector)
+        except UnsupportedSelector:
+            return scope.select(selector)
+
+        if id(scope) not in self.positions:
+            return scope.select(selector)
+
+        first, last = self.get_range(scope)
+        if len(compiled_selectors) == 1:
+            return self.select_compiled(compiled_selectors[0], first, last)
+
+        found_tags = {}
+        for compiled_selector in compiled_selectors:
+            for tag in self.select_compiled(compiled_selector, first, last):
+                found_tags[id(tag)] = tag
+
+        return sorted(found_tags.values(), key=lambda found_tag: self.positions[id(found_tag)])
+
+    def select_compiled(self, compiled_selector, first, last):
+        candidates = self.get_candidates(compiled_selector.parts[0][0])
+        start_index = bisect_left(candidates, first, key=lambda tag: self.positions[id(tag)])
+        end_index = bisect_right(candidates, last, key=lambda tag: self.positions[id(tag)])
+
+        return [tag for tag in candidates[start_index:end_index] if compiled_selector.matches(tag)]
+
+    def get_candidates(self, compound):
+        """
+        :return: The smallest indexed list that contains all tags the compound selector could match
+        """
+        candidate_lists = []
+        if compound.element_id is not None:
+            candidate_lists.append(self.by_id.get(compound.element_id, []))
+        for class_name in compound.classes:
+            candidate_lists.append(self.by_class.get(class_name, []))
+        if compound.name is not None:
+            candidate_lists.append(self.by_name.get(compound.name, []))
+
+        if len(candidate_lists) == 0:
+            return self.tags
+
+        return min(candidate_lists, key=len)
+
+    def get_range(self, scope):
+        """
+        :return: First and last position of the scope's descendants
+        """
+        return self.positions[id(scope)] + 1, self.ends[id(scope)]
+
+    def is_attached(self, tag):
+        """
+        :return: True if the tag is still part of the indexed tree
+        """
+        while tag is not None:
+            if tag is self.root:
+                return True
+            tag = tag.parent
+        return False
+
+
+def is_element(tag):
+    return tag is not None and not isinstance(tag, NavigableString) and tag.name is not None \
+        and tag.name != '[document]'
+
+
+selector_cache = {}
+
+
+def compile_selector(selector):
+    """
+    Compile a selector list into CompiledSelectors. Only type, id, class and attribute
+    (presence or equality) selectors with descendant or child combinators are supported.
+    :raise UnsupportedSelector: If the selector uses anything else
+    """
+    if selector in selector_cache:
+        compiled_selectors = selector_cache[selector]
+    else:
+        try:
+            compiled_selectors = parse_selector_list(selector)
+        except UnsupportedSelector as e:
+            compiled_selectors = e
+        selector_cache[selector] = compiled_selectors
+
+    if isinstance(compiled_selectors, UnsupportedSelector):
+        raise compiled_selectors
+
+    return compiled_selectors
+
+
+def is_supported(selector):
+    try:
+        compile_selector(selector)
+        return True
+    except UnsupportedSelector:
+        return False
+
+
+def parse_selector_list(selector):
+    compiled_selectors = []
+    position = 0
+    selector = selector.strip()
+
+    while True:
+        parts, position = parse_complex_selector(selector, position)
+        compiled_selectors.append(CompiledSelector(selector, parts))
+
+        if position == len(selector):
+            return compiled_selectors
+
+        separator = separator_regex.match(selector, position)
+        if separator is None:
+            raise UnsupportedSelector(f"Unsupported selector: {selector}")
+        position = separator.end()
+
+
+def parse_complex_selector(selector, position):
+    parts = []
+    combinator = None
+
+    while True:
+        compound, position = parse_compound_selector(selector, position)
+        parts.append((compound, combinator))
+
+        found_combinator = combinator_regex.match(selector, position)
+        if found_combinator is None or found_combinator.end() == len(selector) \
+                or selector[found_combinator.end()] == ',':
+            break
+
+        combinator = '>' if '>' in found_combinator.group(0) else ' '
+        position = found_combinator.end()
+
+    # Store right-to-left with each combinator attached to the compound on its left
+    reversed_parts = []
+    for index in range(len(parts) - 1, -1, -1):
+        next_combinator = parts[index + 1][1] if index + 1 < len(parts) else None
+        reversed_parts.append((parts[index][0], next_combinator))
+
+    return reversed_parts, position
+
+
+def parse_compound_selector(selector, position):
+    compound = CompoundSelector()
+    start_position = position
+
+    found_type = type_regex.match(selector, position)
+    if found_type is not None:
+        if found_type.group(0) != '*':
+            compound.name = unescape(found_type.group(0)).lower()
+        position = found_type.end()
+
+    while position < len(selector):
+        found_id = id_regex.match(selector, position)
+        found_class = class_regex.match(selector, position)
+        found_attribute = attribute_regex.match(selector, position)
+
+        if found_id is not None:
+            if compound.element_id is not None:
+                raise UnsupportedSelector(f"Multiple ids in selector: {selector}")
+            compound.element_id = unescape(found_id.group(1))
+            position = found_id.end()
+        elif found_class is not None:
+            compound.classes.append(unescape(found_class.group(1)))
+            position = found_class.end()
+        elif found_attribute is not None:
+            value = found_attribute.group(2)
+            if value is not None:
+                if value[0] in '"\'':
+                    value = value[1:-1]
+                value = unescape(value)
+            compound.attributes.append((unescape(found_attribute.group(1)).lower(), value))
+            position = found_attribute.end()
+        else:
+            break
+
+    if position == start_position:
+        raise UnsupportedSelector(f"Unsupported selector: {selector}")
+    if position < len(selector) and selector[position] not in ' \t\n\r\f>,':
+        raise UnsupportedSelector(f"Unsupported selector: {selector}")
+
+    return compound, position
+
+
+def unescape(identifier):
+    return escape_regex.sub(unescape_match, identifier)
+
+
+def unescape_match(match):
+    if match.group(1) is not None:
+        code_point = int(match.group(1), 16)
+        if code_point == 0 or code_point > 0x10FFFF or 0xD800 <= code_point <= 0xDFFF:
+            return '\uFFFD'
+        return chr(code_point)
+    return match.group(2)
@@ -0,0 +1,244 @@
+import logging
+import timeit
+
+import regex
+from bs4 import BeautifulSoup, Comment, NavigableString
+
+from preprocessing import HtmlCleaner, SelectorIndex
+from scrapers.ScraperSettings import ScraperSettings
+from services import SettingsService
+
+settings_service = SettingsService.service
+
+whitespace_regex = regex.compile(r'[\s\n\r\t\v\f\0]+')
+
+
+class CleaningSoup(BeautifulSoup):
+    """
+    BeautifulSoup that applies the comment, invisible tag, excluded tag, attribute whitelist and
+    whitespace rules while the html.parser tokenizer emits events, so discarded subtrees are never built.
+    Only the contents of the body are cleaned, the same as HtmlCleaner.make_soup.
+    """
+    def __init__(self, source, remove_comments=False, invisible_regexes=None, check_hidden=False,
+                 excluded_selectors=None, whitelisted_attributes=None, inline_images=False, collapse_whitespace=False):
+        self.cleaning_remove_comments = remove_comments
+        self.cleaning_invisible_regexes = invisible_regexes or []
+        self.cleaning_check_hidden = check_hidden
+        self.cleaning_excluded_selectors = excluded_selectors or []
+        self.cleaning_whitelisted_attributes = whitelisted_attributes
+        self.cleaning_inline_images = inline_images
+        self.cleaning_collapse_whitespace = collapse_whitespace
+
+        self.cleaning_body = None
+        self.cleaning_body_open = False
+        self.cleaning_skipped_stack = []
+        self.cleaning_background_images = []
+        self.cleaning_skipped_count = 0
+
+        super().__init__(source, 'html.parser')
+
+    def handle_starttag(self, name, namespace, nsprefix, attrs, sourceline=None, sourcepos=None, namespaces=None):
+        if len(self.cleaning_skipped_stack) > 0:
+            if not self.builder.can_be_empty_element(name):
+                self.cleaning_skipped_stack.append(name)
+            return None
+
+        if self.cleaning_body is None and name == 'head':
+            self.skip_tag(name, False)
+            return None
+
+        if self.cleaning_body_open:
+            if self.is_invisible(attrs):
+                self.skip_tag(name, False)
+                return None
+            if self.is_excluded(name, attrs):
+                self.skip_tag(name, True)
+                return None
+
+        tag = super().handle_starttag(name, namespace, nsprefix, attrs, sourceline=sourceline,
+                                      sourcepos=sourcepos, namespaces=namespaces)
+
+        if self.cleaning_body is None and name == 'body':
+            self.cleaning_body = tag
+            self.cleaning_body_open = True
+
+        return tag
+
+    def handle_endtag(self, name, nsprefix=None):
+        if len(self.cleaning_skipped_stack) == 0:
+            return super().handle_endtag(name, nsprefix)
+
+        if name in self.cleaning_skipped_stack:
+            # Close the most recent matching tag, the same as BeautifulSoup._popToTag
+            while self.cleaning_skipped_stack.pop() != name:
+                pass
+            return None
+
+        if name in self.open_tag_counter and self.open_tag_counter[name] > 0:
+            # The end tag closes an ancestor, which implicitly closes the skipped tag as well
+            self.cleaning_skipped_stack = []
+            return super().handle_endtag(name, nsprefix)
+
+        return None
+
+    def handle_data(self, data):
+        if len(self.cleaning_skipped_stack) > 0:
+            return
+        super().handle_data(data)
+
+    def endData(self, containerClass=None):
+        if containerClass is Comment and self.cleaning_remove_comments and self.cleaning_body_open:
+            self.current_data = []
+            return
+
+        if (self.cleaning_collapse_whitespace and self.cleaning_body_open and len(self.current_data) > 0
+                and self.string_container(containerClass) is NavigableString):
+            collapsed_data = whitespace_regex.sub(' ', ''.join(self.current_data))
+            # Whitespace-only strings are already reduced to a single space or newline by BeautifulSoup
+            if collapsed_data != ' ':
+                self.current_data = [collapsed_data]
+
+        super().endData(containerClass)
+
+    def popTag(self):
+        tag = self.currentTag
+
+        if tag is self.cleaning_body:
+            self.cleaning_body_open = False
+        elif self.cleaning_body_open:
+            if self.cleaning_inline_images:
+                image_url = HtmlCleaner.get_background_image(tag)
+                if image_url is not None:
+                    self.cleaning_background_images.append((tag, image_url))
+
+            if self.cleaning_whitelisted_attributes is not None:
+                tag.attrs = filter_attributes(tag.attrs, self.cleaning_whitelisted_attributes)
+
+        return super().popTag()
+
+    def skip_tag(self, name, replace_with_newline):
+        self.cleaning_skipped_count += 1
+
+        if replace_with_newline:
+            self.endData()
+            self.handle_data('\n')
+            self.endData()
+
+        if not self.builder.can_be_empty_element(name):
+            self.cleaning_skipped_stack.append(name)
+
+    def is_invisible(self, attrs):
+        if self.cleaning_check_hidden and 'hidden' in attrs:
+            return True
+
+        style = attrs.get('style')
+        if style is None:
+            return False
+
+        for invisible_regex in self.cleaning_invisible_regexes:
+            if invisible_regex.search(style) is not None:
+                return True
+
+        return False
+
+    def is_excluded(self, name, attrs, parent=None):
+        """
+        :param parent: Parent of the element, the tag that is being parsed if None
+        """
+        if parent is None:
+            parent = self.currentTag
+
+        for excluded_selector in self.cleaning_excluded_selectors:
+            if excluded_selector.matches_element(name, attrs, parent):
+                return True
+
+        return False
+
+    def inline_background_images(self):
+        """
+        Append the collected background images to their tags, like HtmlCleaner.inline_images
+        """
+        for tag, image_url in self.cleaning_background_images:
+            image_tag = HtmlCleaner.make_image_tag(image_url)
+            tag.append(image_tag)
+
+            if self.is_excluded(image_tag.name, image_tag.attrs, tag):
+                image_tag.replace_with('\n')
+            elif self.cleaning_whitelisted_attributes is not None:
+                image_tag.attrs = filter_attributes(image_tag.attrs, self.cleaning_whitelisted_attributes)
+
+
+def make_clean_soup(source, scraper_settings: ScraperSettings):
+    """
+    Parse the page source, applying the cleaning steps that can be decided while parsing.
+    :return: Body of the cleaned soup and the names of the cleaning steps that were applied
+    """
+    start = timeit.default_timer()
+
+    ignored_cleaning_steps = scraper_settings.configuration.ignored_cleaning_steps
+    scraper_type = scraper_settings.scraper_type
+    streamed_steps = []
+
+    remove_comments = 'remove_comments' not in ignored_cleaning_steps
+    if remove_comments:
+        streamed_steps.append('remove_comments')
+
+    invisible_regexes = []
+    check_hidden = False
+    if 'remove_invisible_tags' not in ignored_cleaning_steps:
+        invisible_tag_regexes = settings_service.get_scraper_setting('invisible_tag_regex', scraper_type)
+        invisible_regexes = [regex.compile(invisible_tag) for invisible_tag in invisible_tag_regexes]
+        check_hidden = True
+        streamed_steps.append('remove_invisible_tags')
+
+    # Excluded tags are matched against the original attributes,
+    # so attributes can only be filtered while parsing if the excluded tags are removed while parsing as well
+    excluded_selectors = []
+    excluded_tags_streamed = False
+    if 'remove_excluded_tags' not in ignored_cleaning_steps:
+        excluded_tags = settings_service.get_scraper_setting('excluded_tags', scraper_type)
+        if all(SelectorIndex.is_supported(excluded_tag) for excluded_tag in excluded_tags):
+            for excluded_tag in excluded_tags:
+                excluded_selectors.extend(SelectorIndex.compile_selector(excluded_tag))
+            excluded_tags_streamed = True
+            streamed_steps.append('remove_excluded_tags')
+        else:
+            logging.log(19, f"StreamingCleaner > Unsupported excluded tag selector, removing after parsing")
+
+    whitelisted_attributes = None
+    if 'remove_non_whitelisted_attributes' not in ignored_cleaning_steps and (
+            excluded_tags_streamed or 'remove_excluded_tags' in ignored_cleaning_steps):
+        whitelisted_attributes = set(
+            settings_service.get_scraper_setting('whitelisted_attributes', scraper_type))
+        whitelisted_attributes.add('scraper-index')
+        streamed_steps.append('remove_non_whitelisted_attributes')
+
+    inline_images = 'inline_images' not in ignored_cleaning_steps
+    if inline_images:
+        streamed_steps.append('inline_images')
+
+    # Duplicate whitespace is collapsed while parsing, the step still runs after parsing for joined strings
+    collapse_whitespace = 'remove_duplicate_whitespace' not in ignored_cleaning_steps
+
+    soup = CleaningSoup(source,
+                        remove_comments=remove_comments,
+                        invisible_regexes=invisible_regexes,
+                        check_hidden=check_hidden,
+                        excluded_selectors=excluded_selectors,
+                        whitelisted_attributes=whitelisted_attributes,
+                        inline_images=inline_images,
+                        collapse_whitespace=collapse_whitespace)
+    soup.inline_background_images()
+
+    logging.log(19, f"StreamingCleaner > Make clean soup, skipped {soup.cleaning_skipped_count} subtrees "
+                    f"{timeit.default_timer() - start:.3f}s")
+
+    return soup.cleaning_body, streamed_steps
+
+
+def filter_attributes(attrs, whitelisted_attributes):
+    remaining_attrs = {}
+    for attr in attrs:
+        if attr in whitelisted_attributes:
+            remaining_attrs[attr] = attrs[attr]
+    return remaining_attrs
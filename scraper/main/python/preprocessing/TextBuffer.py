@@ -0,0 +1,152 @@
+import logging
+import timeit
+from bisect import bisect_right
+from itertools import accumulate
+
+import regex
+
+from preprocessing import TreeState
+
+# Not a word character, so word boundaries at the start and end of a string are the same as in the buffer
+SEPARATOR = '\x00'
+
+# Anchors and negative lookarounds can match a string on its own but not in the buffer, or the other way around
+unsafe_pattern_regex = regex.compile(r'\\[AZzG]|(?<!\\)(?:\\\\)*(?:\$|(?<!\[)\^)|\(\?<?!|\(\?\(')
+
+
+class TextBuffer:
+    """
+    All strings of a tree joined into one text with the start offset of each string, so that a rule's regex
+    runs once over the whole page instead of once per string. Matches are mapped back to their strings
+    with bisect. Strings touched by a match that crosses a string boundary are searched on their own,
+    so the strings found are the same as with soup.find_all(string=value_regex).
+    Strings replaced by the ValueTagger keep the position of the string they replace.
+    """
+    def __init__(self, root):
+        start = timeit.default_timer()
+
+        self.root = root
+        self.strings = root.find_all(string=True)
+        self.texts = [str(string) for string in self.strings]
+        self.positions = {id(string): position for position, string in enumerate(self.strings)}
+
+        self.text = None
+        self.starts = None
+
+        logging.log(19, f"TextBuffer > Index {len(self.strings)} strings {timeit.default_timer() - start:.3f}s")
+
+    def get_text(self):
+        if self.text is None:
+            self.text = SEPARATOR.join(self.texts)
+            self.starts = [0]
+            self.starts.extend(accumulate(len(text) + 1 for text in self.texts[:-1]))
+        return self.text
+
+    def get_position(self, offset):
+        """
+        :return: Position of the string at the offset of the text, a separator belongs to the string before it
+        """
+        return bisect_right(self.starts, offset) - 1
+
+    def get_positions(self, start, end):
+        """
+        :return: Positions of all strings that overlap the text from start to end
+        """
+        first = self.get_position(start)
+        last = self.get_position(max(start, end - 1))
+        return range(first, last + 1)
+
+    def find_matches(self, value_regex, match_memo=None):
+        """
+        Equivalent to soup.find_all(string=value_regex)
+        :param match_memo: MatchMemo for the searches of single strings
+        :return: List of (string, match of value_regex in the string) in document order
+        """
+        if not is_buffer_safe(value_regex):
+            return [(string, value_regex.search(string)) for string in self.root.find_all(string=value_regex)]
+
+        if len(self.strings) == 0:
+            return []
+
+        text = self.get_text()
+
+        candidates = []
+        for match in value_regex.finditer(text):
+            # Crossing matches can hide matches of the strings they touch, those are searched on their own
+            candidates.extend(self.get_positions(match.start(), match.end()))
+
+        found_matches = []
+        for position in sorted(set(candidates)):
+            string = self.strings[position]
+            if match_memo is not None:
+                found = match_memo.search(value_regex, string)
+            else:
+                found = value_regex.search(string)
+            if found is not None:
+                found_matches.append((string, found))
+
+        return found_matches
+
+    def find_examples(self, example_matcher, example_count):
+        """
+        :return: For each example, positions of the strings that may contain it
+        """
+        candidates = [[] for _ in range(example_count)]
+        if len(self.strings) == 0:
+            return candidates
+
+        text = self.get_text()
+        normalized_text = example_matcher.normalize(text)
+
+        if len(normalized_text) != len(text):
+            # Case folding changed the length of some strings, so offsets can't be mapped back
+            for position, string in enumerate(self.strings):
+                for example_index in example_matcher.find(string):
+                    candidates[example_index].append(position)
+            return candidates
+
+        lengths = example_matcher.lengths
+        for end, example_indexes in example_matcher.find_ends(normalized_text):
+            for example_index in example_indexes:
+                candidates[example_index].extend(self.get_positions(end + 1 - lengths[example_index], end + 1))
+
+        for example_index in example_matcher.always:
+            candidates[example_index].extend(range(len(self.strings)))
+
+        return candidates
+
+    def replace(self, string, new_string):
+        """
+        Give new_string the position of string, which it replaced in the tree
+        """
+        position = self.positions.get(id(string))
+        if position is None or self.strings[position] is not string:
+            return
+
+        self.strings[position] = new_string
+        self.texts[position] = str(new_string)
+        del self.positions[id(string)]
+        self.positions[id(new_string)] = position
+
+        self.text = None
+        self.starts = None
+
+
+def is_buffer_safe(value_regex):
+    return value_regex.flags & (regex.WORD | regex.MULTILINE) == 0 and \
+        unsafe_pattern_regex.search(value_regex.pattern) is None
+
+
+def get_buffer(tag, create=True):
+    """
+    :return: The text buffer attached to the root of the tree
+    :param create: Build a buffer that isn't kept if the tree has none, otherwise None is returned
+    """
+    return TreeState.get_state(tag, 'scraper_text_buffer', TextBuffer if create else None)
+
+
+def attach_buffer(root):
+    """
+    Keep a text buffer on the root of the tree, only valid while its strings are replaced through replace
+    """
+    return TreeState.attach_state(root, 'scraper_text_buffer', TextBuffer(root))
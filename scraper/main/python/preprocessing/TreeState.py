@@ -0,0 +1,27 @@
+def get_root(tag):
+    while tag.parent is not None:
+        tag = tag.parent
+    return tag
+
+
+def get_state(tag, name, create=None, keep=False):
+    """
+    :return: The object attached to the root of the tag's tree under name, e.g. an index of the tree
+    :param create: Function that builds the object from the root if the tree has none, otherwise None is returned
+    :param keep: Attach the built object to the root
+    """
+    root = get_root(tag)
+
+    # Tag.__getattr__ would search the tree for a tag with this name
+    state = root.__dict__.get(name)
+    if state is None and create is not None:
+        state = create(root)
+        if keep:
+            attach_state(root, name, state)
+
+    return state
+
+
+def attach_state(root, name, state):
+    setattr(root, name, state)
+    return state
@@ -1,27 +1,63 @@
-import json
 import logging
+import timeit
 import traceback
 from copy import copy
 
 import regex
 from bs4 import NavigableString
 
+from preprocessing import ExampleMatcher, AnnotationStore, PositionIndex, ParallelMatcher, TextBuffer, \
+    AttributeIndex, MatchMemo
 from scrapers.ScraperSettings import ScraperSettings
-from services import SettingsService, TableCacheService
+from services import SettingsService, TableCacheService, CompiledRuleService, RuleStatisticsService
 
 settings_service = SettingsService.service
 TableCacheService = TableCacheService.service
+CompiledRuleService = CompiledRuleService.service
 
+aggregate_label_regex = regex.compile('\\$[A-Z\\_]+\\$')
 
-def tag_values(soup, scraper_settings: ScraperSettings):
-    soup = copy(soup)
-    rules = settings_service.get_attribute_rules(scraper_settings.scraper_type)
 
-    for rule in rules:
+def tag_values(soup, scraper_settings: ScraperSettings, save_statistics=True):
+    """
+    :param save_statistics: Save the rule statistics of the page, not wanted when only part of the page is tagged
+    """
+    soup = copy(soup)
+    annotations = AnnotationStore.get_store(soup, create=True)
+    TextBuffer.attach_buffer(soup)
+    AttributeIndex.attach_index(soup)
+    match_memo = MatchMemo.attach_memo(soup, scraper_settings)
+    compiled_rules = CompiledRuleService.get_rules(scraper_settings.scraper_type)
+
+    # Rules that never find values on this domain are skipped, except on verification runs
+    rule_profile = RuleStatisticsService.get_profile(scraper_settings)
+
+    # Searches of regex driven rules run on a thread pool first, the rules are still applied in order below
+    match_prefetch = None
+    if settings_service.get_scraper_setting('parallel_tagging', scraper_settings.scraper_type,
+                                            default=False, optional=True):
+        thread_count = settings_service.get_scraper_setting('tagging_threads', scraper_settings.scraper_type,
+                                                            default=4, optional=True)
+        prefetched_rules = [compiled_rule for compiled_rule in compiled_rules
+                            if not rule_profile.should_skip(compiled_rule.statistics_key)]
+        match_prefetch = ParallelMatcher.prefetch_matches(soup, prefetched_rules, thread_count, match_memo)
+
+    for compiled_rule in compiled_rules:
+        rule = compiled_rule.rule
         tags = rule.get('tags')
 
+        rule_key = compiled_rule.statistics_key
+        if rule_profile.should_skip(rule_key):
+            rule_profile.skip(rule_key)
+            continue
+
+        start = timeit.default_timer()
+        value_count = annotations.value_count
+
+        # Labels are tagged as values too, but only the rule's own values count as matches
         if 'labeled' in rule.get('tags'):
             example_replace_labeled(soup, rule, scraper_settings)
+            value_count = annotations.value_count
 
         # Can be both text and attribute
         if 'example_driven' in tags:
@@ -31,15 +67,28 @@ def tag_values(soup, scraper_settings: ScraperSettings):
                 example_replace_attributes(soup, rule, scraper_settings)
         if 'regex_driven' in tags:
             if 'text' in tags:
-                regex_replace_text(soup, rule, scraper_settings)
+                regex_replace_text(soup, rule, scraper_settings, match_prefetch)
             if 'attribute' in tags:
-                regex_replace_attributes(soup, rule, scraper_settings)
+                regex_replace_attributes(soup, rule, scraper_settings, match_prefetch)
+
+        rule_profile.record(rule_key, annotations.value_count - value_count, timeit.default_timer() - start)
+
+    if save_statistics:
+        rule_profile.save()
+
+    if match_prefetch is not None:
+        match_prefetch.log_statistics()
+    match_memo.log_statistics()
+
+    annotations.aggregate_counts()
 
     return soup
 
 
 def example_replace_text(soup, rule, scraper_settings):
     label = rule.get('name')
+    compiled_rule = CompiledRuleService.get_rule(rule)
+    annotations = AnnotationStore.get_store(soup, create=True)
 
     if 'table_sourced' in rule.get('tags'):
         table_name = rule.get('source')
@@ -50,93 +99,100 @@ def example_replace_text(soup, rule, scraper_settings):
     if 'reorder_examples' in rule.get('tags'):
         examples = reorder_examples(examples)
 
-    for example in examples:
-        input_regex = f"\\b{regex.escape(str(example))}\\b"
-        example_regex = compile_regex(rule, input_regex)
-        found_tags = soup.find_all(string=example_regex)
+    example_matcher = get_example_matcher(rule, examples)
 
-        for tag in found_tags:
+    # Scan the text of the page once and only check the examples each string contains,
+    # strings are tracked by their document position as replacing them creates new strings
+    text_buffer = TextBuffer.get_buffer(soup)
+    strings = list(text_buffer.strings)
+    candidates = text_buffer.find_examples(example_matcher, len(examples))
+    match_memo = MatchMemo.get_memo(soup)
+
+    for example_index, example in enumerate(examples):
+        if len(candidates[example_index]) == 0:
+            continue
+
+        example_regex = compiled_rule.get_example_regex(example)
+        found_matches = []
+        for position in sorted(set(candidates[example_index])):
+            found = match_memo.search(example_regex, strings[position])
+            if found is not None:
+                found_matches.append((position, found))
+
+        for position, found in found_matches:
+            tag = strings[position]
             if 'labeled' in rule.get('tags') and not has_label(rule, tag, example_regex, scraper_settings):
                 continue
 
             if 'exclusive' in rule.get('tags'):
-                label_regex = compile_regex(rule, f"\\b{regex.escape(label)}\\b")
-                if regex.search(label_regex, tag):
+                if match_memo.search(compiled_rule.exclusive_regex, tag):
                     continue
 
             filter_regex = None
             if 'filtered' in rule.get('tags'):
-                filter_regex = compile_regex(rule, rule.get('filter_regex'))
+                filter_regex = compiled_rule.filter_regex
 
-            replace_text(example_regex, label, tag, filter_regex, rule)
+            parent = tag.parent
+            index = parent.index(tag)
+            if replace_text(example_regex, label, tag, filter_regex, rule, annotations, found) is None:
+                continue
+
+            # The replaced text can contain examples that come later, e.g. when they match the label
+            strings[position] = parent.contents[index]
+            for next_index in example_matcher.find(strings[position]):
+                if next_index > example_index:
+                    candidates[next_index].append(position)
 
     return soup
 
 
+def get_example_matcher(rule, examples):
+    ignore_case = 'ignore_case' in rule.get('tags')
+
+    # Matchers of table sourced examples are built once per table version and shared by all processes
+    if 'table_sourced' in rule.get('tags'):
+        return TableCacheService.get_table_matcher(rule.get('source'), examples, ignore_case)
+
+    return ExampleMatcher.get_matcher(examples, ignore_case)
+
+
 def has_label(rule, tag, value_regex, scraper_settings):
+    """
+    :return: True if the rule's label comes before the value in the tag's ancestor max_label_distance levels up
+    """
     max_label_distance = settings_service.get_scraper_setting('max_label_distance', scraper_settings.scraper_type)
+    label_regex = CompiledRuleService.get_rule(rule).label_regex
     label = format_label(f"{rule.get('name')}_label")
-    label_regex = regex.compile(".*" + regex.escape(label) + ".*")
 
-    distance = 0
     target = get_tag(tag)
-
-    while distance <= max_label_distance:
-        found_labels = target.find_all(string=label_regex)
-        for found_label in found_labels:
-            try:
-                if comes_after(target, found_label, label_regex, tag, value_regex):
-                    return True
-            except SystemExit or KeyboardInterrupt:
-                exit(-1)
-            except:
-                logging.log(19, f"Exception while checking label distance in"
-                                f"\n{tag.prettify()}"
-                                f"\n{traceback.format_exc()}")
-
-        if target.parent is None:
-            return False
-
+    distance = 0
+    while distance < max_label_distance and target.parent is not None:
         target = target.parent
         distance += 1
 
-    return False
-
+    position_index = PositionIndex.get_index(target, create=True)
+    position = position_index.get_position(tag)
+    if position is None:
+        position_index = PositionIndex.rebuild_index(position_index.root)
+        position = position_index.get_position(tag)
 
-def comes_after(parent, first_tag, first_regex, second_tag, second_regex):
-    if first_tag == second_tag:
-        first_pos = regex.search(first_regex, first_tag).start()
-        second_pos = regex.search(second_regex, second_tag).start()
+    if position_index.has_label_between(label, position_index.get_position(target), position):
+        return True
 
-        return first_pos < second_pos
-
-    tags = get_all_children(parent)
-    for tag in tags:
-        if tag == first_tag:
-            return True
-        if tag == second_tag:
-            return False
-
-        if isinstance(tag, NavigableString):
-            continue
-        tags.extend(list(tag.children))
+    # The label and the value are in the same string
+    if isinstance(tag, NavigableString) and label in tag:
+        try:
+            return regex.search(label_regex, tag).start() < regex.search(value_regex, tag).start()
+        except SystemExit or KeyboardInterrupt:
+            exit(-1)
+        except:
+            logging.log(19, f"Exception while checking label distance in"
+                            f"\n{tag}"
+                            f"\n{traceback.format_exc()}")
 
     return False
 
 
-def get_all_children(tag):
-    tag = get_tag(tag)
-    tags = [tag]
-    for child in tag.children:
-        if isinstance(child, NavigableString):
-            if len(child.strip()) == 0:
-                continue
-            tags.append(child)
-        else:
-            tags.extend(get_all_children(child))
-    return tags
-
-
 def get_tag(tag):
     if isinstance(tag, NavigableString):
         return tag.parent
@@ -170,23 +226,27 @@ def example_replace_labeled(soup, rule, scraper_settings):
         example_replace_attributes(soup, label_rule, scraper_settings)
 
 
-def regex_replace_text(soup, rule, scraper_settings):
+def regex_replace_text(soup, rule, scraper_settings, match_prefetch=None):
     label = rule.get('name')
+    compiled_rule = CompiledRuleService.get_rule(rule)
+    annotations = AnnotationStore.get_store(soup, create=True)
 
-    input_regex = rule.get('regex')
-    value_regex = compile_regex(rule, input_regex)
-    found_tags = soup.find_all(string=value_regex)
+    value_regex = compiled_rule.value_regex
+    if match_prefetch is not None:
+        found_matches = match_prefetch.find_matches(value_regex)
+    else:
+        found_matches = TextBuffer.get_buffer(soup).find_matches(value_regex, MatchMemo.get_memo(soup))
     similar_examples = []
 
-    for tag in found_tags:
+    for tag, found in found_matches:
         if 'labeled' in rule.get('tags') and not has_label(rule, tag, value_regex, scraper_settings):
             continue
 
         filter_regex = None
         if 'filtered' in rule.get('tags'):
-            filter_regex = compile_regex(rule, rule.get('filter_regex'))
+            filter_regex = compiled_rule.filter_regex
 
-        examples = replace_text(value_regex, label, tag, filter_regex, rule)
+        examples = replace_text(value_regex, label, tag, filter_regex, rule, annotations, found)
         if 'replace_similar' in rule.get('tags'):
             similar_examples.append(examples)
 
@@ -197,8 +257,9 @@ def regex_replace_text(soup, rule, scraper_settings):
     return soup
 
 
-def replace_text(target_regex, label, tag, filter_regex, rule):
-    found = regex.search(target_regex, tag)
+def replace_text(target_regex, label, tag, filter_regex, rule, annotations, found=None):
+    if found is None:
+        found = regex.search(target_regex, tag)
     found_text = found.group(0)
 
     if filter_regex is not None:
@@ -211,15 +272,28 @@ def replace_text(target_regex, label, tag, filter_regex, rule):
     tag_text = tag.string
     rez_text = "".join((tag_text[:found.start()], formatted_label, tag_text[found.start() + len(found_text):]))
 
-    add_data_attribute(tag, label, found_text, rule)
+    add_data_attribute(annotations, tag, label, found_text, rule)
+
+    parent = tag.parent
+    index = parent.index(tag)
     tag.replace_with(rez_text)
 
+    position_index = PositionIndex.get_index(annotations.root)
+    if position_index is not None:
+        position_index.replace(tag, parent.contents[index])
+
+    text_buffer = TextBuffer.get_buffer(annotations.root, create=False)
+    if text_buffer is not None:
+        text_buffer.replace(tag, parent.contents[index])
+
     return found_text
 
 
 def example_replace_attributes(soup, rule, scraper_settings):
     label = rule.get('name')
-    attribute_regex = regex.compile(rule.get('attribute_regex'))
+    compiled_rule = CompiledRuleService.get_rule(rule)
+    annotations = AnnotationStore.get_store(soup, create=True)
+    attribute_regex = compiled_rule.attribute_regex
 
     if 'table_sourced' in rule.get('tags'):
         table_name = rule.get('source')
@@ -230,32 +304,55 @@ def example_replace_attributes(soup, rule, scraper_settings):
     if 'reorder_examples' in rule.get('tags'):
         examples = reorder_examples(examples)
 
-    for example in examples:
-        input_regex = f"\\b{regex.escape(example)}\\b"
-        example_regex = compile_regex(rule, input_regex)
+    filter_regex = None
+    if 'filtered' in rule.get('tags'):
+        filter_regex = compiled_rule.filter_regex
 
-        filter_regex = None
-        if 'filtered' in rule.get('tags'):
-            filter_regex = compile_regex(rule, rule.get('filter_regex'))
+    example_matcher = get_example_matcher(rule, examples)
+
+    # Scan every matching attribute value once and only check the examples it contains
+    entries = AttributeIndex.get_index(soup).get_entries(attribute_regex)
+    candidates = [[] for _ in examples]
+    for entry_index, (tag, attr) in enumerate(entries):
+        for example_index in example_matcher.find(tag.attrs[attr]):
+            candidates[example_index].append(entry_index)
 
-        replace_attributes(soup, attribute_regex, example_regex, label, filter_regex, rule, scraper_settings)
+    for example_index, example in enumerate(examples):
+        if len(candidates[example_index]) == 0:
+            continue
+
+        example_regex = compiled_rule.get_example_regex(example)
+        entry_indexes = sorted(set(candidates[example_index]))
+        found_entries = [entries[entry_index] for entry_index in entry_indexes]
+        values = [tag.attrs[attr] for tag, attr in found_entries]
+
+        replace_attributes(soup, attribute_regex, example_regex, label, filter_regex, rule, scraper_settings,
+                           annotations, entries=found_entries)
+
+        # The replaced values can contain examples that come later, e.g. when they match the label
+        for entry_index, (tag, attr), value in zip(entry_indexes, found_entries, values):
+            if tag.attrs[attr] is value:
+                continue
+            for next_index in example_matcher.find(tag.attrs[attr]):
+                if next_index > example_index:
+                    candidates[next_index].append(entry_index)
 
     return soup
 
 
-def regex_replace_attributes(soup, rule, scraper_settings):
+def regex_replace_attributes(soup, rule, scraper_settings, match_prefetch=None):
     label = rule.get('name')
-    attribute_regex = regex.compile(rule.get('attribute_regex'))
-
-    input_regex = rule.get('regex')
-    value_regex = compile_regex(rule, input_regex)
+    compiled_rule = CompiledRuleService.get_rule(rule)
+    annotations = AnnotationStore.get_store(soup, create=True)
+    attribute_regex = compiled_rule.attribute_regex
+    value_regex = compiled_rule.value_regex
 
     filter_regex = None
     if 'filtered' in rule.get('tags'):
-        filter_regex = compile_regex(rule, rule.get('filter_regex'))
+        filter_regex = compiled_rule.filter_regex
 
     similar_examples = replace_attributes(soup, attribute_regex, value_regex, label, filter_regex, rule,
-                                          scraper_settings)
+                                          scraper_settings, annotations, match_prefetch)
 
     if 'replace_similar' in rule.get('tags'):
         similar_rule = format_similar_rule(rule, similar_examples)
@@ -283,39 +380,43 @@ def format_similar_rule(rule, similar_examples):
     return similar_rule
 
 
-def replace_attributes(soup, attribute_regex, target_regex, label, filter_regex, rule, scraper_settings):
+def replace_attributes(soup, attribute_regex, target_regex, label, filter_regex, rule, scraper_settings,
+                       annotations, match_prefetch=None, entries=None):
+    """
+    :param entries: (tag, attribute name) to search, by default all attributes matching attribute_regex
+    """
     similar_examples = []
 
-    for tag in soup.find_all():
-        try:
-            attributes = tag.attrs.copy()
-
-            for attr in attributes:
-                if not regex.search(attribute_regex, attr):
-                    continue
+    if entries is None:
+        entries = AttributeIndex.get_index(soup).get_entries(attribute_regex)
 
-                attr_value = tag.attrs[attr]
+    for tag, attr in entries:
+        try:
+            attr_value = tag.attrs[attr]
+            if match_prefetch is not None:
+                search_result = match_prefetch.search_attribute(tag, attr, attribute_regex, target_regex)
+            else:
                 search_result = regex.search(target_regex, attr_value)
 
-                if search_result is not None:
-                    if 'labeled' in rule.get('tags') and not has_label(rule, tag, target_regex, scraper_settings):
-                        continue
+            if search_result is not None:
+                if 'labeled' in rule.get('tags') and not has_label(rule, tag, target_regex, scraper_settings):
+                    continue
 
-                    found_text = search_result.group(0)
+                found_text = search_result.group(0)
 
-                    if filter_regex is not None:
-                        found_text = filter_result(found_text, filter_regex)
+                if filter_regex is not None:
+                    found_text = filter_result(found_text, filter_regex)
 
-                    if len(found_text) == 0:
-                        continue
+                if len(found_text) == 0:
+                    continue
 
-                    add_data_attribute(tag, label, found_text, rule)
+                add_data_attribute(annotations, tag, label, found_text, rule)
 
-                    formatted_label = format_label(label)
-                    tag.attrs[attr] = attr_value.replace(found_text, formatted_label).strip()
+                formatted_label = format_label(label)
+                tag.attrs[attr] = attr_value.replace(found_text, formatted_label).strip()
 
-                    if 'replace_similar' in rule.get('tags'):
-                        similar_examples.append(found_text)
+                if 'replace_similar' in rule.get('tags'):
+                    similar_examples.append(found_text)
         except AttributeError:
             logging.log(19, f"Exception while replacing attributes in {tag}\n{traceback.format_exc()}")
 
@@ -333,26 +434,17 @@ def filter_result(result, filter_regex):
     return filtered_result
 
 
-def add_data_attribute(tag, label, data, rule):
+def add_data_attribute(annotations, tag, label, data, rule):
     if isinstance(tag, NavigableString):
         tag = tag.parent
 
-    attr_name = 'scraper-data'
-    count_attribute = 'scraper-counts'
-
+    data_attribute = AnnotationStore.DATA
     if 'fallback' in rule.get('tags'):
-        attr_name = 'scraper-fallback'
-        count_attribute = 'scraper-fallback-counts'
-
-    if attr_name not in tag.attrs:
-        tag.attrs[attr_name] = '{}'
-
-    tag_data = json.loads(tag.attrs[attr_name])
+        data_attribute = AnnotationStore.FALLBACK
 
     if 'aggregate' in rule.get('tags'):
-        label_regex = regex.compile('\\$[A-Z\\_]+\\$')
-
-        found_labels = regex.findall(label_regex, data)
+        tag_data = annotations.get_data(tag, data_attribute)
+        found_labels = regex.findall(aggregate_label_regex, data)
 
         for found_label in found_labels:
             formatted_label = found_label[1:-1].lower()
@@ -364,29 +456,7 @@ def add_data_attribute(tag, label, data, rule):
     if 'prefix' in rule:
         data = rule['prefix'] + data
 
-    if label not in tag_data:
-        tag_data[label] = [data]
-    else:
-        tag_data[label].append(data)
-
-    tag.attrs[attr_name] = json.dumps(tag_data)
-    add_count_attribute(tag, label, count_attribute)
-
-
-def add_count_attribute(tag, label, count_attribute):
-    if count_attribute not in tag.attrs:
-        tag.attrs[count_attribute] = '{}'
-
-    tag_counts = json.loads(tag.attrs[count_attribute])
-
-    if label not in tag_counts:
-        tag_counts[label] = 1
-    else:
-        tag_counts[label] += 1
-
-    tag.attrs[count_attribute] = json.dumps(tag_counts)
-    if tag.parent is not None:
-        add_count_attribute(tag.parent, label, count_attribute)
+    annotations.add_data(tag, label, data, data_attribute)
 
 
 def format_label(label):
@@ -396,9 +466,4 @@ def format_label(label):
 def compile_regex(rule, input_regex):
     tags = rule.get('tags')
 
-    if 'ignore_case' in tags:
-        target_regex = regex.compile(input_regex, regex.IGNORECASE)
-    else:
-        target_regex = regex.compile(input_regex)
-
-    return target_regex
+    return CompiledRuleService.get_regex(input_regex, 'ignore_case' in tags)
@@ -13,7 +13,7 @@ from scrapers.ScraperSettings import ScraperSettings, ScraperType, StopException
 from scrapers.WebScraper import save_tree
 from services import SettingsService, ImageService, LoggingService
 from preprocessing import ValueTagger, HtmlCleaner
-from element_finder import BlockFinder, PaginationHandler
+from element_finder import BlockFinder, PaginationHandler, PaginationStrategy, RecordTemplate
 
 settings_service = SettingsService.service
 
@@ -42,22 +42,41 @@ def scrape(scraper_settings: ScraperSettings, run_timeout_event, process_timeout
 
     records_with_images = ImageService.get_records_with_images(scraper_settings)
     default_images = ImageService.get_default_images()
+    record_template = RecordTemplate.get_template(scraper_settings)
+    pagination_strategy = PaginationStrategy.get_strategy(scraper_settings)
 
     locale_configuration = scraper_settings.configuration
     if locale_configuration is not None and locale_configuration.preferred_pagination_handler is not None:
         pagination_handler = HandlerType[locale_configuration.preferred_pagination_handler.upper()]
+    elif pagination_strategy.handler is not None:
+        # Earlier runs found the handler of the locale, it is dropped below if it finds no pages
+        logging.info(f"Using the pagination handler of earlier runs: {pagination_strategy.handler}")
+        pagination_handler = HandlerType[pagination_strategy.handler]
 
     driver = WebScraper.open_page(scraper_settings)
     try:
         while current_page < max_page_count + 1:
             soup = WebScraper.get_indexed_soup(driver, scraper_settings)
 
-            cleaned_soup = clean_data(soup, scraper_settings)
-            tagged_soup = tag_values(cleaned_soup, scraper_settings)
+            # Pages of the locale are read through its record template, the full pipeline runs if it doesn't fit
+            new_blocks = None
+            template_failed = False
+            if record_template is not None:
+                new_blocks = find_template_blocks(soup, record_template, driver, scraper_settings,
+                                                  records_with_images, default_images, records)
+                template_failed = new_blocks is None
 
-            check_timeout(run_timeout_event, start, process_timeout)
+            if new_blocks is None:
+                cleaned_soup = clean_data(soup, scraper_settings)
+                tagged_soup = tag_values(cleaned_soup, scraper_settings)
+
+                check_timeout(run_timeout_event, start, process_timeout)
 
-            new_blocks = find_blocks(tagged_soup, driver, scraper_settings, records_with_images, default_images, records)
+                new_blocks = find_blocks(tagged_soup, driver, scraper_settings, records_with_images, default_images,
+                                         records)
+                # The template is only learned again when there is none yet or it didn't fit the page
+                if (record_template is None or template_failed) and len(new_blocks) >= min_record_count:
+                    record_template = learn_template(soup, cleaned_soup, new_blocks, scraper_settings)
 
             if len(new_blocks) < min_record_count:
                 # Wait for the page to load and press interaction buttons
@@ -81,6 +100,7 @@ def scrape(scraper_settings: ScraperSettings, run_timeout_event, process_timeout
                 logging.info(f"No new blocks found, trying different pagination handler...")
 
                 failed_handlers.append(pagination_handler)
+                pagination_strategy.forget(pagination_handler.name)
                 pagination_handler = None
                 current_page = 1
 
@@ -95,7 +115,7 @@ def scrape(scraper_settings: ScraperSettings, run_timeout_event, process_timeout
 
             pagination_handler = PaginationHandler.next_page(
                 driver, soup, last_blocks, current_page, pagination_handler,
-                locale_configuration.interaction_buttons, failed_handlers, scraper_settings)
+                locale_configuration.interaction_buttons, failed_handlers, scraper_settings, pagination_strategy)
 
             if pagination_handler is None and current_page > 1:
                 break
@@ -106,6 +126,7 @@ def scrape(scraper_settings: ScraperSettings, run_timeout_event, process_timeout
             check_timeout(run_timeout_event, start, process_timeout)
 
         logging.info(f"Final size: {len(records)} records. Found {current_page} pages")
+        pagination_strategy.save()
 
         if len(records) < record_count_warning or settings_service.is_stage():
             logging.warning(f"Saving screenshot for {scraper_settings.domain}({scraper_settings.locale})")
@@ -154,6 +175,42 @@ def find_blocks(soup, driver, scraper_settings, records_with_images, default_ima
     return blocks
 
 
+def find_template_blocks(soup, record_template, driver, scraper_settings, records_with_images, default_images,
+                         records):
+    start = timeit.default_timer()
+
+    container = record_template.find_container(HtmlCleaner.make_inlined_soup(soup, scraper_settings))
+    if container is None:
+        logging.info("Record template container not found")
+        return None
+
+    # Only the container is cleaned, the rest of the page isn't read through the template
+    container = HtmlCleaner.clean_container(container, scraper_settings)
+    if container is None:
+        logging.info("Record template container was removed by cleaning")
+        return None
+
+    # Only the container is tagged, the statistics of the rules are kept for full pages
+    tagged_container = ValueTagger.tag_values(container, scraper_settings, save_statistics=False)
+    blocks = BlockFinder.find_template_blocks(tagged_container, record_template, driver, scraper_settings,
+                                              records_with_images, default_images, records)
+    logging.info(f"Template Block Finder: {timeit.default_timer() - start:.3f}s")
+
+    return blocks
+
+
+def learn_template(soup, cleaned_soup, blocks, scraper_settings):
+    if not RecordTemplate.is_enabled(scraper_settings):
+        return None
+
+    start = timeit.default_timer()
+    source_soup = HtmlCleaner.make_inlined_soup(soup, scraper_settings)
+    record_template = RecordTemplate.learn_template(source_soup, cleaned_soup, blocks, scraper_settings)
+    logging.info(f"Record Template: {timeit.default_timer() - start:.3f}s")
+
+    return record_template
+
+
 def get_new_block_count(blocks, records):
     new_block_count = 0
 
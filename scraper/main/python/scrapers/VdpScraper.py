@@ -62,7 +62,7 @@ def scrape(scraper_settings: ScraperSettings, run_timeout_event, process_timeout
 
         logging.warning(f"Record block has too few filled fields, reading information from the body instead.")
         fuzzy_record_block = BlockFinder.parse_blocks([tagged_soup], None, scraper_settings,
-                                                       records_with_images=[],
+                                                       records_with_images=set(),
                                                        default_images=default_images,
                                                        record_alias=scraper_settings.configuration.record_alias)[0]
 
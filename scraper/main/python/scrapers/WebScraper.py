@@ -15,6 +15,7 @@ from seleniumrequests import Chrome
 from undetected_chromedriver import ChromeOptions
 from urllib3.exceptions import MaxRetryError
 
+from preprocessing import AnnotationStore
 from scrapers import ScraperSettings
 from scrapers.ScraperSettings import StopException
 from services import SettingsService, ProxyService
@@ -505,6 +506,8 @@ def save_tree(name, soup):
     """
 
     try:
+        AnnotationStore.serialize_annotations(soup)
+
         file_path = get_file_path('../../debug', name)
         with open(file_path, 'w', encoding='utf-8') as file:
             file.write(str(soup.prettify()))
@@ -0,0 +1,128 @@
+import logging
+
+from scrapers.ScraperSettings import ScraperSettings
+from services import SettingsService, PersistentCacheService
+
+settings_service = SettingsService.service
+
+CACHE_NAME = 'cleaning_statistics'
+
+
+class CleaningProfile:
+    """
+    Per-domain statistics of the HtmlCleaner steps. Steps that haven't changed anything
+    for the last step_skip_threshold runs are skipped, except on every step_verification_interval-th run,
+    which runs all steps to detect when a site starts needing them again.
+    """
+    cache_name = CACHE_NAME
+    log_name = 'CleaningProfile'
+    change_unit = 'nodes'
+
+    def __init__(self, key, statistics, skip_threshold, verification_interval):
+        self.key = key
+        self.statistics = statistics
+        self.skip_threshold = skip_threshold
+        self.verification_interval = verification_interval
+
+        # The run is only counted when the profile is saved
+        self.statistics.setdefault('steps', {})
+        run_number = self.statistics.get('runs', 0) + 1
+        self.is_verification_run = (verification_interval is not None and verification_interval > 0
+                                    and run_number % verification_interval == 0)
+
+        # Changes of this run, applied again to the latest statistics when saving,
+        # so runs of other processes that saved in the meantime aren't lost
+        self.changes = []
+        self.skipped_steps = []
+        self.saved_time = 0
+
+    def get_step(self, step_name, statistics=None):
+        if statistics is None:
+            statistics = self.statistics
+
+        return statistics['steps'].setdefault(step_name, {
+            'runs': 0,
+            'changed': 0,
+            'duration': 0,
+            'unchanged_streak': 0,
+            'skipped': 0,
+            'saved_time': 0
+        })
+
+    def should_skip(self, step_name):
+        if self.skip_threshold is None or self.is_verification_run:
+            return False
+
+        return self.get_step(step_name)['unchanged_streak'] >= self.skip_threshold
+
+    def record(self, step_name, changed, duration):
+        step = self.get_step(step_name)
+
+        if self.is_verification_run and changed > 0 and self.skip_threshold is not None \
+                and step['unchanged_streak'] >= self.skip_threshold:
+            logging.info(f"{self.log_name} > {step_name} changed {changed} {self.change_unit} on verification run "
+                         f"for {self.key}, no longer skipping")
+
+        record_step(step, changed, duration)
+        self.changes.append((step_name, changed, duration, None))
+
+    def skip(self, step_name):
+        step = self.get_step(step_name)
+        average_duration = step['duration'] / max(1, step['runs'])
+
+        skip_step(step, average_duration)
+        self.changes.append((step_name, None, None, average_duration))
+
+        self.skipped_steps.append(step_name)
+        self.saved_time += average_duration
+
+    def apply_changes(self, statistics):
+        statistics['runs'] = statistics.get('runs', 0) + 1
+        statistics.setdefault('steps', {})
+
+        for step_name, changed, duration, saved_time in self.changes:
+            step = self.get_step(step_name, statistics)
+            if saved_time is None:
+                record_step(step, changed, duration)
+            else:
+                skip_step(step, saved_time)
+
+        return statistics
+
+    def save(self):
+        statistics = PersistentCacheService.update(self.cache_name, self.key, self.apply_changes, default={})
+        if statistics is not None:
+            self.statistics = statistics
+        self.changes = []
+
+        if len(self.skipped_steps) > 0:
+            total_saved_time = sum(step['saved_time'] for step in self.statistics['steps'].values())
+            logging.info(f"{self.log_name} > Skipped {', '.join(self.skipped_steps)} for {self.key}, "
+                         f"saved ~{self.saved_time:.3f}s (~{total_saved_time:.3f}s over all runs)")
+        elif self.is_verification_run:
+            logging.log(19, f"{self.log_name} > Verification run for {self.key}, all steps were run")
+
+
+def record_step(step, changed, duration):
+    step['runs'] += 1
+    step['changed'] += changed
+    step['duration'] += duration
+    step['unchanged_streak'] = step['unchanged_streak'] + 1 if changed == 0 else 0
+
+
+def skip_step(step, saved_time):
+    step['skipped'] += 1
+    step['saved_time'] += saved_time
+
+
+def get_profile(scraper_settings: ScraperSettings):
+    key = f"{scraper_settings.scraper_type.value}_{scraper_settings.domain}"
+    statistics = PersistentCacheService.load(CACHE_NAME, key, default={})
+
+    skip_threshold = settings_service.get_scraper_setting('step_skip_threshold', scraper_settings.scraper_type,
+                                                          optional=True)
+    verification_interval = settings_service.get_scraper_setting('step_verification_interval',
+                                                                 scraper_settings.scraper_type, default=20,
+                                                                 optional=True)
+
+    return CleaningProfile(key, statistics, skip_threshold, verification_interval)
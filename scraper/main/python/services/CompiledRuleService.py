@@ -0,0 +1,133 @@
+import hashlib
+import json
+import logging
+import timeit
+
+import regex
+
+from scrapers.ScraperSettings import ScraperType
+from services import SettingsService
+
+settings_service = SettingsService.service
+
+MAX_CACHED_PATTERNS = 100000
+
+
+class CompiledRule:
+    """
+    Attribute rule with its regexes compiled once. The original rule dict is kept in rule,
+    so code that reads other fields of the rule doesn't have to change.
+    """
+    def __init__(self, rule, rule_service):
+        self.rule = rule
+        self.rule_service = rule_service
+
+        self.name = rule.get('name')
+        self.tags = rule.get('tags') or []
+        self.ignore_case = 'ignore_case' in self.tags
+        self.required = rule.get('required') is True
+        self.anti_attribute = 'anti_attribute' in self.tags
+
+        # Changes when the rule does, so statistics of an edited rule start over
+        rule_hash = hashlib.sha1(json.dumps(rule, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        self.statistics_key = f"{self.name}_{rule_hash[:8]}"
+
+        self.value_regex = self.compile(rule.get('regex'))
+        self.filter_regex = self.compile(rule.get('filter_regex'))
+        self.attribute_regex = self.compile(rule.get('attribute_regex'), False)
+
+        self.exclusive_regex = None
+        self.label_regex = None
+        if self.name is not None:
+            self.exclusive_regex = self.compile(f"\\b{regex.escape(self.name)}\\b")
+            label = f"${self.name.upper()}_LABEL$"
+            self.label_regex = self.compile(".*" + regex.escape(label) + ".*", False)
+
+        # Built by AttributeParser on first use, with the conversions and constraints of the rule
+        self.parsing_rule = None
+
+    def compile(self, pattern, ignore_case=None):
+        if pattern is None:
+            return None
+        if ignore_case is None:
+            ignore_case = self.ignore_case
+        return self.rule_service.get_regex(pattern, ignore_case)
+
+    def get_example_regex(self, example):
+        return self.compile(f"\\b{regex.escape(str(example))}\\b")
+
+
+class CompiledRuleService:
+    """
+    Service for compiling attribute rules once per settings version and sharing the compiled
+    regexes between ValueTagger, BlockFinder and AttributeParser.
+    """
+    def __init__(self):
+        self.compiled_rules = {}
+        self.patterns = {}
+
+        self.compile_count = 0
+        self.compile_time = 0
+        self.hit_count = 0
+
+    def get_regex(self, pattern, ignore_case=False):
+        key = (pattern, ignore_case)
+
+        compiled_regex = self.patterns.get(key)
+        if compiled_regex is not None:
+            self.hit_count += 1
+            return compiled_regex
+
+        start = timeit.default_timer()
+        if ignore_case:
+            compiled_regex = regex.compile(pattern, regex.IGNORECASE)
+        else:
+            compiled_regex = regex.compile(pattern)
+        self.compile_time += timeit.default_timer() - start
+        self.compile_count += 1
+
+        if len(self.patterns) >= MAX_CACHED_PATTERNS:
+            self.patterns = {}
+        self.patterns[key] = compiled_regex
+
+        return compiled_regex
+
+    def get_rules(self, scraper_type: ScraperType):
+        """
+        :return: Compiled attribute rules, recompiled when the settings are updated
+        """
+        rules = settings_service.get_attribute_rules(scraper_type)
+
+        cached_rules = self.compiled_rules.get(scraper_type)
+        if cached_rules is not None and cached_rules[0] is rules:
+            return cached_rules[1]
+
+        start = timeit.default_timer()
+        compiled_rules = [CompiledRule(rule, self) for rule in rules]
+        self.compiled_rules[scraper_type] = (rules, compiled_rules, {id(rule): compiled_rule for rule, compiled_rule
+                                                                     in zip(rules, compiled_rules)})
+
+        logging.log(19, f"CompiledRuleService > Compiled {len(compiled_rules)} {scraper_type.value} rules "
+                        f"{timeit.default_timer() - start:.3f}s")
+        self.log_statistics()
+
+        return compiled_rules
+
+    def get_rule(self, rule):
+        """
+        :return: The compiled rule of the current settings version, or a new compiled rule for rules
+                 that aren't part of the settings, e.g. label and similar value rules
+        """
+        for rules, compiled_rules, rules_by_id in self.compiled_rules.values():
+            compiled_rule = rules_by_id.get(id(rule))
+            if compiled_rule is not None and compiled_rule.rule is rule:
+                return compiled_rule
+
+        return CompiledRule(rule, self)
+
+    def log_statistics(self):
+        logging.log(19, f"CompiledRuleService > {len(self.patterns)} cached patterns, "
+                        f"{self.compile_count} compiled in {self.compile_time:.3f}s, {self.hit_count} cache hits")
+
+
+service = CompiledRuleService()
@@ -0,0 +1,106 @@
+import logging
+import threading
+import time
+
+from scrapers.ScraperSettings import ScraperSettings
+from services import SettingsService, PersistentCacheService
+
+settings_service = SettingsService.service
+
+CACHE_NAME = 'record_images'
+
+
+class ImageCache:
+    """
+    Per-domain validators and hashes of downloaded record images by link, kept across runs.
+    Images checked within max_age seconds are reused without a request, older images are revalidated
+    with a conditional request. The oldest images are dropped when max_size is reached.
+    """
+    def __init__(self, key, images, max_size, max_age):
+        self.key = key
+        self.images = images
+        self.max_size = max_size
+        self.max_age = max_age
+
+        self.lock = threading.Lock()
+        self.hit_count = 0
+        self.revalidated_count = 0
+        self.miss_count = 0
+        self.changed = False
+
+    def get(self, image_link):
+        """
+        :return: The cached image of the link, or None if it was never downloaded
+        """
+        return self.images.get(image_link)
+
+    def is_fresh(self, image):
+        return 0 < self.max_age and time.time() - image['checked'] < self.max_age
+
+    def get_headers(self, image):
+        """
+        :return: Headers of a conditional request for the cached image
+        """
+        headers = {}
+        if image.get('etag') is not None:
+            headers['if-none-match'] = image['etag']
+        if image.get('last_modified') is not None:
+            headers['if-modified-since'] = image['last_modified']
+        return headers
+
+    def count_hit(self):
+        with self.lock:
+            self.hit_count += 1
+
+    def count_revalidated(self):
+        with self.lock:
+            self.revalidated_count += 1
+
+    def count_miss(self):
+        with self.lock:
+            self.miss_count += 1
+
+    def put(self, image_link, image_hash, extension, etag=None, last_modified=None, content_length=None):
+        with self.lock:
+            self.images.pop(image_link, None)
+            if 0 < self.max_size <= len(self.images):
+                self.images.pop(next(iter(self.images)))
+
+            self.images[image_link] = {
+                'hash': image_hash,
+                'extension': extension,
+                'etag': etag,
+                'last_modified': last_modified,
+                'content_length': content_length,
+                'checked': time.time()
+            }
+            self.changed = True
+
+    def save(self):
+        with self.lock:
+            logging.log(19, f"ImageCache > {self.key}: {self.hit_count} images reused, "
+                            f"{self.revalidated_count} revalidated, {self.miss_count} downloaded, "
+                            f"{len(self.images)} kept")
+
+            if self.changed:
+                PersistentCacheService.save(CACHE_NAME, self.key, {'images': self.images})
+                self.changed = False
+
+
+def get_cache(scraper_settings: ScraperSettings):
+    """
+    :return: The image cache of the domain, or None if record_image_cache isn't set
+    """
+    if not settings_service.get_scraper_setting('record_image_cache', scraper_settings.scraper_type,
+                                                default=False, optional=True):
+        return None
+
+    max_size = settings_service.get_scraper_setting('record_image_cache_size', scraper_settings.scraper_type,
+                                                    default=20000, optional=True)
+    max_age = settings_service.get_scraper_setting('record_image_cache_max_age', scraper_settings.scraper_type,
+                                                   default=86400, optional=True)
+
+    key = f"{scraper_settings.scraper_type.value}_{scraper_settings.domain}"
+    cached = PersistentCacheService.load(CACHE_NAME, key, default={})
+
+    return ImageCache(key, cached.get('images', {}), max_size, max_age)
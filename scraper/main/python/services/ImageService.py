@@ -180,7 +180,7 @@ def get_records_with_images(scraper_settings: ScraperSettings):
         records_with_images = cursor.fetchall()
 
         logging.log(19, f"DB > Get records with images: {timeit.default_timer() - start:.3f}s")
-        return [record[0] for record in records_with_images]
+        return {record[0] for record in records_with_images}
 
 
 def get_default_images():
@@ -193,18 +193,22 @@ def get_default_images():
         default_images = cursor.fetchall()
         logging.log(19, f"DB > Get default images: {timeit.default_timer() - start:.3f}s")
 
-    return [image[0] for image in default_images]
+    return {image[0] for image in default_images}
 
 
 initialize_sharepoint()
 
 
 class RecordImage:
-    def __init__(self, link, extension, image):
+    def __init__(self, link, extension, image, image_hash=None):
+        """
+        :param image: The image, or None if only its hash is known
+        :param image_hash: The hash of the image if it was computed while downloading
+        """
         self.link = link
         self.extension = extension
         self.image = image
-        self.hash = self.get_hash()
+        self.hash = image_hash if image_hash is not None else self.get_hash()
 
     def save(self, image_name):
         """
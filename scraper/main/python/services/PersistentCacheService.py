@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+import traceback
+from contextlib import contextmanager
+from pathlib import Path
+
+import regex
+
+try:
+    import fcntl
+except ImportError:
+    # Without fcntl, e.g. on Windows, updates are still written atomically but not serialized
+    fcntl = None
+
+CACHE_FOLDER = Path(__file__).parent.joinpath('../../resources/cache').resolve()
+
+
+def get_file_path(cache_name, key):
+    safe_key = regex.sub(r'[^\w\-.]', '_', str(key))
+    return CACHE_FOLDER.joinpath(cache_name, f"{safe_key}.json")
+
+
+def load(cache_name, key, default=None):
+    """
+    Load a cached JSON document that persists across runs and processes.
+    :param cache_name: Name of the cache, used as the folder name
+    :param key: Key of the document within the cache, e.g. the domain
+    :param default: Returned if the document doesn't exist or can't be read
+    """
+    file_path = get_file_path(cache_name, key)
+
+    if not file_path.exists():
+        return default
+
+    try:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except SystemExit or KeyboardInterrupt:
+        exit(-1)
+    except:
+        logging.warning(f"Failed to load {cache_name} cache for {key}\n{traceback.format_exc()}")
+        return default
+
+
+def save(cache_name, key, data):
+    """
+    Save a JSON document to the cache. The file is replaced atomically,
+    so parallel workers never read a partially written document.
+    """
+    file_path = get_file_path(cache_name, key)
+    temp_path = file_path.with_suffix(f".{os.getpid()}.tmp")
+
+    try:
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(data, file)
+        os.replace(temp_path, file_path)
+    except SystemExit or KeyboardInterrupt:
+        exit(-1)
+    except:
+        logging.warning(f"Failed to save {cache_name} cache for {key}\n{traceback.format_exc()}")
+
+
+def update(cache_name, key, update_data, default=None):
+    """
+    Load, change and save a document while holding a lock on it, so parallel workers that update the same document
+    don't overwrite each other's changes.
+    :param update_data: Function that gets the latest document, or default, and returns the document to save
+    :return: The saved document, or None if it couldn't be updated
+    """
+    file_path = get_file_path(cache_name, key)
+
+    try:
+        with file_lock(file_path):
+            data = update_data(load(cache_name, key, default=default))
+            save(cache_name, key, data)
+            return data
+    except SystemExit or KeyboardInterrupt:
+        exit(-1)
+    except:
+        logging.warning(f"Failed to update {cache_name} cache for {key}\n{traceback.format_exc()}")
+        return None
+
+
+@contextmanager
+def file_lock(file_path):
+    """
+    Hold an exclusive lock on the .lock file next to file_path, so parallel workers change the file one at a time
+    """
+    lock_path = file_path.with_suffix('.lock')
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(lock_path, 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
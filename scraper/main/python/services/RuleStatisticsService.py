@@ -0,0 +1,31 @@
+from scrapers.ScraperSettings import ScraperSettings
+from services import SettingsService, PersistentCacheService
+from services.CleaningStatisticsService import CleaningProfile
+
+settings_service = SettingsService.service
+
+CACHE_NAME = 'rule_statistics'
+
+
+class RuleProfile(CleaningProfile):
+    """
+    Per-domain and locale statistics of the ValueTagger rules. Rules that haven't found any values
+    for the last rule_skip_threshold pages are skipped, except on every rule_verification_interval-th page,
+    which runs all rules to detect when a site starts matching them.
+    """
+    cache_name = CACHE_NAME
+    log_name = 'RuleProfile'
+    change_unit = 'values'
+
+
+def get_profile(scraper_settings: ScraperSettings):
+    key = f"{scraper_settings.scraper_type.value}_{scraper_settings.domain}_{scraper_settings.locale}"
+    statistics = PersistentCacheService.load(CACHE_NAME, key, default={})
+
+    skip_threshold = settings_service.get_scraper_setting('rule_skip_threshold', scraper_settings.scraper_type,
+                                                          optional=True)
+    verification_interval = settings_service.get_scraper_setting('rule_verification_interval',
+                                                                 scraper_settings.scraper_type, default=20,
+                                                                 optional=True)
+
+    return RuleProfile(key, statistics, skip_threshold, verification_interval)
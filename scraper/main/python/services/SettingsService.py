@@ -81,8 +81,8 @@ class SettingsService:
     def get_vdp_setting(self, name, default=None):
         return self.get_setting(name, 'vdp_scraper_settings', default=default)
 
-    def get_scraper_setting(self, name, scraper_type: ScraperType, default=None):
-        return self.get_setting(name, f'{scraper_type.value}_scraper_settings', default=default)
+    def get_scraper_setting(self, name, scraper_type: ScraperType, default=None, optional=False):
+        return self.get_setting(name, f'{scraper_type.value}_scraper_settings', default=default, optional=optional)
 
     def get_static_setting(self, setting_group, name, default=None):
         return self.get_setting(name, setting_group, default=default)
@@ -118,7 +118,11 @@ class SettingsService:
     def create_mock_settings(self, setting_type, mock_settings):
         self.set_settings({setting_type: mock_settings})
 
-    def get_setting(self, name, setting_group_name=None, default=None):
+    def get_setting(self, name, setting_group_name=None, default=None, optional=False):
+        """
+        :param optional: Settings that are expected to be missing, e.g. flags of optional features,
+                         aren't logged as missing
+        """
         setting_group = self.settings
         if setting_group_name is not None:
             setting_group = self.get_setting(setting_group_name, default={})
@@ -127,7 +131,7 @@ class SettingsService:
 
         if setting is not None:
             return setting
-        else:
+        elif not optional:
             logging.error(f"\n{(str(setting_group_name) + ' ') or ''}"
                           f"Missing requested field: {name}\nReturning {default}")
         return default
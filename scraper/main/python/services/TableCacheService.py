@@ -1,43 +1,324 @@
+import hashlib
+import json
 import logging
+import mmap
+import os
+import struct
+import timeit
+import traceback
+from datetime import date, datetime, time
+from decimal import Decimal
 
 import schedule
 
 from db import DatabaseConnector
+from preprocessing import ExampleMatcher
+from services import PersistentCacheService
+
+SNAPSHOT_CACHE = 'table_cache'
+SNAPSHOT_FILE = 'tables.snapshot'
+SNAPSHOT_MAGIC = b'TBLSNAP3'
+SNAPSHOT_HEADER = struct.Struct('<8sQQ')
+
+# datetime before date, as datetimes are dates too
+VALUE_TYPES = {'decimal': Decimal, 'datetime': datetime, 'date': date, 'time': time}
+
+
+class TableSnapshot:
+    """
+    Read-only memory map of a snapshot file, shared by all processes through the page cache.
+    Entries are stored as JSON rather than pickles, so a tampered cache file can't run code when it is loaded.
+    An entry is only decoded when it is first requested and then kept for the life of the snapshot.
+    The encoded tables are shared, but each process still holds its own decoded copy of the tables and matchers
+    it uses: the matchers are dicts of python objects that can't be read from the map in place, and decoding
+    once per process is still far cheaper than querying the database and building the matchers in every worker.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        magic, index_offset, index_length = SNAPSHOT_HEADER.unpack_from(self.buffer)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a table snapshot")
+
+        index = json.loads(self.buffer[index_offset:index_offset + index_length])
+        self.version = index['version']
+        self.entries = {tuple(key): (offset, length) for key, offset, length in index['entries']}
+        self.values = {}
+
+    def get_raw(self, key):
+        offset, length = self.entries[key]
+        return self.buffer[offset:offset + length]
+
+    def get(self, key):
+        if key not in self.entries:
+            return None
+
+        value = self.values.get(key)
+        if value is None:
+            value = decode_entry(key, self.get_raw(key))
+            self.values[key] = value
+        return value
+
+    def close(self):
+        self.values = {}
+        self.buffer.close()
 
 
 class TableCacheService:
     """
     Service for caching tables that aren't expected to change often.
+    Tables and the example matchers built from them are kept in a versioned snapshot file,
+    so that worker processes don't have to query the database or build the matchers again.
     """
     def __init__(self):
         self.table_cache = {}
+        self.matcher_cache = {}
+        self.snapshot = None
         schedule.every(15).minutes.do(self.update_table_cache)
 
     def get_table_values(self, table_name):
+        self.check_snapshot()
+
         if table_name in self.table_cache:
             return self.table_cache[table_name]
 
-        with DatabaseConnector.connect() as connection:
-            cursor = connection.cursor()
-            cursor.execute(f"SELECT * FROM {table_name} order by id;")
-            data = cursor.fetchall()
+        unpacked_data = None
+        if self.snapshot is not None:
+            unpacked_data = self.snapshot.get(('table', table_name))
 
-        unpacked_data = []
-        for row in data:
-            # ignore id column
-            if len(row) == 2:
-                unpacked_data.append(row[1])
-            else:
-                unpacked_data.append(row[1:])
+        if unpacked_data is None:
+            unpacked_data = load_table(table_name)
+            self.save_snapshot({('table', table_name): unpacked_data})
 
         self.table_cache[table_name] = unpacked_data
 
         return unpacked_data
 
+    def get_table_matcher(self, table_name, examples, ignore_case=False):
+        """
+        :param examples: Values of the table, in the order the matcher should index them
+        :return: ExampleMatcher for the examples, loaded from the snapshot if it was built before
+        """
+        key = ('matcher', table_name, ignore_case, get_fingerprint(examples))
+
+        matcher = self.matcher_cache.get(key)
+        if matcher is not None:
+            return matcher
+
+        state = None
+        if self.snapshot is not None:
+            state = self.snapshot.get(key)
+
+        if state is not None:
+            matcher = ExampleMatcher.from_state(state)
+        else:
+            matcher = ExampleMatcher.ExampleMatcher(examples, ignore_case)
+            self.save_snapshot({key: matcher.get_state()})
+
+        self.matcher_cache[key] = matcher
+        return matcher
+
+    def check_snapshot(self):
+        """
+        Open the snapshot file, or the newer one if it was swapped by another process
+        """
+        snapshot_path = get_snapshot_path()
+
+        try:
+            stat = os.stat(snapshot_path)
+        except FileNotFoundError:
+            return
+
+        if self.snapshot is not None and self.snapshot.file_id == (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+            return
+
+        try:
+            snapshot = TableSnapshot(snapshot_path)
+        except SystemExit or KeyboardInterrupt:
+            exit(-1)
+        except:
+            logging.warning(f"Failed to open table snapshot\n{traceback.format_exc()}")
+            return
+
+        if self.snapshot is not None:
+            self.snapshot.close()
+            logging.info(f"Table snapshot changed to version {snapshot.version}")
+
+        self.snapshot = snapshot
+        self.table_cache = {}
+        self.matcher_cache = {}
+
+    def save_snapshot(self, new_entries, keep_matchers=True):
+        """
+        Write a new snapshot with the entries of the current one and new_entries, replacing the file atomically.
+        Processes that mapped the old file keep reading it until they check the snapshot again.
+        Writers hold a lock on the snapshot, so entries saved by parallel workers are merged instead of lost,
+        and the file isn't written again if another worker already saved the same entries.
+        :param keep_matchers: Keep the matchers of the current snapshot, only those of unchanged tables otherwise
+        """
+        start = timeit.default_timer()
+        snapshot_path = get_snapshot_path()
+
+        try:
+            with PersistentCacheService.file_lock(snapshot_path):
+                # Another process may have added entries since this one opened the snapshot
+                self.check_snapshot()
+                entries = {key: encode_entry(key, value) for key, value in new_entries.items()}
+                if self.snapshot is not None:
+                    if all(key in self.snapshot.entries and data == self.snapshot.get_raw(key)
+                           for key, data in entries.items()):
+                        return
+
+                    for key in self.snapshot.entries:
+                        if key in entries:
+                            continue
+                        if key[0] == 'matcher' and not keep_matchers:
+                            table_key = ('table', key[1])
+                            if table_key in entries and entries[table_key] != self.snapshot.get_raw(table_key):
+                                continue
+                        entries[key] = self.snapshot.get_raw(key)
+
+                version = get_version(entries)
+                temp_path = snapshot_path.with_suffix(f".{os.getpid()}.tmp")
+                write_snapshot(temp_path, entries, version)
+                os.replace(temp_path, snapshot_path)
+        except SystemExit or KeyboardInterrupt:
+            exit(-1)
+        except:
+            logging.warning(f"Failed to save table snapshot\n{traceback.format_exc()}")
+            return
+
+        logging.log(19, f"TableCacheService > Saved snapshot version {version} with {len(entries)} entries "
+                        f"{timeit.default_timer() - start:.3f}s")
+
+        self.check_snapshot()
+
     def update_table_cache(self):
         logging.info("Updating table cache...")
-        for table in self.table_cache:
-            self.table_cache[table] = self.get_table_values(table)
+
+        self.check_snapshot()
+        table_names = set(self.table_cache)
+        if self.snapshot is not None:
+            table_names.update(key[1] for key in self.snapshot.entries if key[0] == 'table')
+
+        if len(table_names) == 0:
+            return
+
+        try:
+            tables = {('table', table_name): load_table(table_name) for table_name in table_names}
+        except SystemExit or KeyboardInterrupt:
+            exit(-1)
+        except:
+            logging.error(f"Failed to update table cache: {traceback.format_exc()}")
+            return
+
+        new_version = get_version({key: encode_entry(key, value) for key, value in tables.items()})
+        if self.snapshot is not None and new_version == self.snapshot.version:
+            logging.info("Table cache is up to date")
+            return
+
+        self.save_snapshot(tables, keep_matchers=False)
+
+        # The snapshot can't be saved, e.g. on a read-only file system
+        for key, unpacked_data in tables.items():
+            self.table_cache[key[1]] = unpacked_data
+        self.matcher_cache = {}
+
+
+def load_table(table_name):
+    with DatabaseConnector.connect() as connection:
+        cursor = connection.cursor()
+        cursor.execute(f"SELECT * FROM {table_name} order by id;")
+        data = cursor.fetchall()
+
+    unpacked_data = []
+    for row in data:
+        # ignore id column
+        if len(row) == 2:
+            unpacked_data.append(row[1])
+        else:
+            unpacked_data.append(row[1:])
+
+    return unpacked_data
+
+
+def get_snapshot_path():
+    return PersistentCacheService.CACHE_FOLDER.joinpath(SNAPSHOT_CACHE, SNAPSHOT_FILE)
+
+
+def get_fingerprint(examples):
+    return hashlib.sha1('\x00'.join(str(example) for example in examples).encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def encode_entry(key, value):
+    """
+    Tables are lists of values or rows, matchers the state of ExampleMatcher.get_state.
+    """
+    return json.dumps(value, default=encode_value, separators=(',', ':')).encode('utf-8')
+
+
+def encode_value(value):
+    """
+    Database values JSON can't represent are stored as an object of their type and text, so they are loaded
+    with the same type. Other types are stored as text.
+    """
+    for type_name, value_type in VALUE_TYPES.items():
+        if isinstance(value, value_type):
+            return {'__type__': type_name, 'value': value.isoformat() if type_name != 'decimal' else str(value)}
+    return str(value)
+
+
+def decode_value(obj):
+    type_name = obj.get('__type__')
+    if type_name == 'decimal':
+        return Decimal(obj['value'])
+    if type_name in VALUE_TYPES:
+        return VALUE_TYPES[type_name].fromisoformat(obj['value'])
+    return obj
+
+
+def decode_entry(key, data):
+    value = json.loads(data, object_hook=decode_value)
+    if key[0] == 'table':
+        return [tuple(row) if isinstance(row, list) else row for row in value]
+    return tuple(value)
+
+
+def get_version(entries):
+    """
+    :return: Hash of the table entries, which changes when any table in the database does
+    """
+    version_hash = hashlib.sha1()
+    for key in sorted(key for key in entries if key[0] == 'table'):
+        version_hash.update(key[1].encode('utf-8'))
+        version_hash.update(entries[key])
+    return version_hash.hexdigest()[:16]
+
+
+def write_snapshot(path, entries, version):
+    """
+    Snapshot layout: header of magic, index offset and index length, JSON encoded entries, JSON index of
+    {'version': version, 'entries': [[key, offset, length]]}
+    """
+    index_entries = []
+    with open(path, 'wb') as file:
+        file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, 0, 0))
+
+        offset = SNAPSHOT_HEADER.size
+        for key, data in entries.items():
+            file.write(data)
+            index_entries.append((key, offset, len(data)))
+            offset += len(data)
+
+        index = json.dumps({'version': version, 'entries': index_entries}).encode('utf-8')
+        file.write(index)
+
+        file.seek(0)
+        file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, offset, len(index)))
 
 
 service = TableCacheService()
@@ -1,6 +1,11 @@
 import unittest
 
 from element_finder import AttributeParser
+from scrapers.ScraperSettings import ScraperType
+from services import SettingsService, CompiledRuleService
+
+settings_service = SettingsService.service
+CompiledRuleService = CompiledRuleService.service
 
 input_strings = ['3,950 €', '2,470€', '12 700 €', '€26,950.00', '€1,250,950.00', '€23 500', '137 km', '100,7 km',
                  '2132km', '12thd', '120 thd', '15.6thd']
@@ -85,3 +90,34 @@ class RecordParserTest(unittest.TestCase):
             self.assertEqual(expected_text_results[i],
                              AttributeParser.parse_attribute(attributes['attribute_rules'][2], input_values),
                              f"Text was not parsed correctly for input string: {input_values}")
+
+    def test_parse_translated(self):
+        attribute = {
+            'type': 'text',
+            'tags': ['translated', 'ignore_case'],
+            'translations': {'Diesel': 'diesel', 'PETROL': 'petrol'}
+        }
+
+        self.assertEqual('diesel', AttributeParser.parse_attribute(attribute, ['DIESEL']),
+                         'Translation should ignore case')
+        self.assertEqual('petrol', AttributeParser.parse_attribute(attribute, ['Petrol', 'Diesel']),
+                         'First value should be translated')
+        self.assertEqual('electric', AttributeParser.parse_attribute(attribute, ['Electric']),
+                         'Untranslated values should be lowercased when case is ignored')
+
+    def test_get_rule(self):
+        attribute = {
+            'name': 'price',
+            'type': 'float',
+            'tags': ['ignore_case'],
+            'conversions': [{'regex': 'k', 'multiplier': 1000}]
+        }
+        settings_service.mock_attribute_settings([attribute])
+        CompiledRuleService.get_rules(ScraperType.TEST)
+
+        parsing_rule = AttributeParser.get_rule(attribute)
+        self.assertIs(parsing_rule, AttributeParser.get_rule(attribute), 'Rule should be built once')
+        self.assertIs(parsing_rule, CompiledRuleService.get_rule(attribute).parsing_rule,
+                      'Rule should be kept with the compiled rule')
+        self.assertEqual(10000.0, AttributeParser.parse_attribute(attribute, ['10K']),
+                         'Conversion should ignore case')
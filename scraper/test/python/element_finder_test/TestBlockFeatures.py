@@ -0,0 +1,67 @@
+import unittest
+
+from bs4 import BeautifulSoup
+
+from element_finder import BlockFinder
+from element_finder.BlockFeatures import BlockFeatures
+from preprocessing import AnnotationStore
+
+input_html = ('<html><body>'
+              '<div id="block1"><p>1</p></div>'
+              '<div id="block2"><p>2</p></div>'
+              '<section><div><div id="block3"><p>3</p></div></div></section>'
+              '</body></html>')
+
+
+class BlockFeaturesTest(unittest.TestCase):
+    def test_get_distances(self):
+        soup = BeautifulSoup(input_html, 'html.parser')
+        tags = [soup.find(id='block1'), soup.find(id='block2'), soup.find(id='block3'), soup.body, soup]
+        block_features = BlockFeatures(tags)
+
+        for block_index, tag in enumerate(tags):
+            expected_distances = [BlockFinder.get_distance(tag, other_tag) for other_tag in tags]
+            self.assertEqual(expected_distances, block_features.get_distances(block_index).tolist(),
+                             'distances differ from get_distance')
+
+    def test_get_groups(self):
+        soup = BeautifulSoup(input_html, 'html.parser')
+        tags = [soup.find(id='block1'), soup.find(id='block2'), soup.find(id='block3')]
+
+        groups, group_ids = BlockFeatures(tags).get_groups(1)
+        self.assertEqual([[0, 1], [2]], [group.tolist() for group in groups], 'wrong groups')
+        self.assertEqual([0, 0, 1], group_ids.tolist(), 'wrong group ids')
+
+    def test_has_any_label(self):
+        soup = BeautifulSoup(input_html, 'html.parser')
+        annotations = AnnotationStore.get_store(soup, create=True)
+        annotations.add_data(soup.find(id='block2').p, 'sold', 'sold')
+        annotations.add_data(soup.find(id='block3').p, 'price', '3')
+
+        tags = [soup.find(id='block1'), soup.find(id='block2'), soup.find(id='block3')]
+        block_features = BlockFeatures(tags, annotations, ['sold'])
+
+        self.assertEqual([[0], [1], [0]], block_features.get_label_counts().tolist(), 'wrong label counts')
+        self.assertEqual([False, True, False], block_features.has_any_label().tolist(), 'wrong anti blocks')
+        self.assertEqual([False] * 3, BlockFeatures(tags, annotations).has_any_label().tolist(),
+                         'no labels should match no blocks')
+
+    def test_block_columns(self):
+        soup = BeautifulSoup(input_html, 'html.parser')
+        for index, tag in enumerate(soup.find_all()):
+            tag.attrs['scraper-index'] = index
+
+        tags = [soup.find(id='block1'), soup.find(id='block2'), soup.find(id='block3'), soup.find(id='block1')]
+        block_features = BlockFeatures(tags)
+
+        self.assertEqual([2, 4, 8, 2], block_features.get_scraper_indexes().tolist(), 'wrong scraper indexes')
+        self.assertEqual([False, False, False, True], block_features.is_repeated().tolist(),
+                         'only later blocks of the same tag should be repeated')
+
+        unindexed_tag = BeautifulSoup('<p>1</p>', 'html.parser').p
+        self.assertEqual([False, False], BlockFeatures([unindexed_tag, unindexed_tag]).is_repeated().tolist(),
+                         'tags without a scraper-index should not be repeated')
+
+
+if __name__ == '__main__':
+    unittest.main()
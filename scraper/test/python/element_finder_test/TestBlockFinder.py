@@ -1,8 +1,15 @@
+import tempfile
 import unittest
+from pathlib import Path
 
 from bs4 import BeautifulSoup
 
 from element_finder import BlockFinder
+from preprocessing import ValueTagger, AnnotationStore
+from scrapers.ScraperSettings import ScraperSettings
+from services import SettingsService, PersistentCacheService
+
+settings_service = SettingsService.service
 
 
 input_html = """
@@ -39,6 +46,27 @@ input_html = """
     </body>
 """
 
+record_html = ('<html><body>'
+               '<div scraper-index="1"><a href="/car/1" scraper-index="2">1 000 EUR</a></div>'
+               '<div scraper-index="3"><a href="/car/2" scraper-index="4">2 000 EUR</a></div>'
+               '</body></html>')
+
+record_rules = [
+    {
+        "name": "alias",
+        "regex": "/car/\\d+",
+        "type": "text",
+        "tags": ["attribute", "regex_driven"],
+        "attribute_regex": "href"
+    },
+    {
+        "name": "price",
+        "regex": "\\d+ \\d+ EUR",
+        "type": "float",
+        "tags": ["text", "regex_driven"]
+    }
+]
+
 
 class BlockFinderTest(unittest.TestCase):
     def test_get_distance(self):
@@ -56,3 +84,67 @@ class BlockFinderTest(unittest.TestCase):
 
         distance = BlockFinder.get_distance(blocks[2], blocks[0])
         self.assertEqual(3, distance, "Block order should not matter")
+
+    def test_get_largest_group(self):
+        settings_service.set_settings({'test_scraper_settings': {'max_tag_distance': 2}})
+
+        soup = BeautifulSoup(input_html, 'html.parser')
+        for index, tag in enumerate(soup.find_all()):
+            tag['scraper-index'] = str(index)
+
+        blocks = [{'tag': tag} for tag in soup.find_all('div', class_='block')]
+        group = BlockFinder.get_largest_group(blocks, ScraperSettings())
+
+        self.assertEqual(['block1', 'block2', 'block4', 'block5'], [block['tag']['id'] for block in group],
+                         'wrong largest group')
+        # Blocks close to a later group move to it, but stay in the group they were found in first
+        self.assertEqual([0, 0, 1, 1, 1], [block['group_id'] for block in blocks], 'wrong group ids')
+        self.assertEqual([soup.body['scraper-index']] * 4, [block['parent'] for block in group], 'wrong parent')
+
+    def test_find_parent_block_of_equal_tags(self):
+        soup = BeautifulSoup('<div><ul><li>a</li></ul><ul><li>a</li></ul></div>', 'html.parser')
+        items = soup.find_all('li')
+
+        # The second item is under a tag equal to the parent of the first one
+        parent_block = BlockFinder.find_parent_block([{'tag': items[0]}, {'tag': items[1]}])
+        self.assertIs(soup.find('ul'), parent_block, 'equal ancestors should count as parents')
+
+    def test_collect_values(self):
+        soup = BeautifulSoup('<div><p><b></b></p><i></i></div>', 'html.parser')
+        annotations = AnnotationStore.get_store(soup, create=True)
+        annotations.add_data(soup.i, 'price', '2')
+        annotations.add_data(soup.b, 'price', '1')
+        annotations.add_data(soup.p, 'alias', 'a', AnnotationStore.FALLBACK)
+
+        block_values, fallback_values = BlockFinder.collect_values(soup.div, annotations)
+
+        self.assertEqual({'price': ['1', '2']}, block_values, 'values should be in document order')
+        self.assertEqual({'alias': ['a']}, fallback_values, 'wrong fallback values')
+
+    def test_parse_blocks(self):
+        cache_folder = tempfile.TemporaryDirectory()
+        original_cache_folder = PersistentCacheService.CACHE_FOLDER
+        PersistentCacheService.CACHE_FOLDER = Path(cache_folder.name)
+
+        try:
+            settings_service.set_settings({
+                'test_scraper_settings': {},
+                'test_attribute_rules': record_rules
+            })
+
+            soup = ValueTagger.tag_values(BeautifulSoup(record_html, 'html.parser'), ScraperSettings())
+            blocks = soup.find_all('div')
+            parsed_blocks = BlockFinder.parse_blocks(blocks, None, ScraperSettings(), [], [], None)
+
+            self.assertEqual([{'alias': '/car/1', 'price': 1000.0}, {'alias': '/car/2', 'price': 2000.0}],
+                             [{'alias': block['alias'], 'price': block['price']} for block in parsed_blocks],
+                             'records were not parsed')
+            self.assertEqual([block.attrs['scraper-index'] for block in blocks],
+                             [block['index'] for block in parsed_blocks], 'index was not taken from the block')
+        finally:
+            PersistentCacheService.CACHE_FOLDER = original_cache_folder
+            cache_folder.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import threading
+import time
+import timeit
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from element_finder import ImageFetcher
+from scrapers.ScraperSettings import ScraperSettings, ScraperType
+from services import ImageCacheService, SettingsService
+from services.ImageService import RecordImage
+
+settings_service = SettingsService.service
+
+IMAGE_DELAY = 0.2
+IMAGE_ETAG = '"v1"'
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        ImageHandler.requests.append((self.path, self.headers.get('User-Agent'), self.headers.get('Cookie')))
+
+        if self.path.startswith('/cached/'):
+            if self.headers.get('If-None-Match') == IMAGE_ETAG:
+                self.send_response(304)
+                self.end_headers()
+                return
+        elif not self.path.startswith('/images/'):
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        time.sleep(IMAGE_DELAY)
+        image = self.path.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        if self.path.startswith('/cached/'):
+            self.send_header('ETag', IMAGE_ETAG)
+        self.send_header('Content-Length', str(len(image)))
+        self.end_headers()
+        self.wfile.write(image)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockDriver:
+    def execute_script(self, script):
+        return 'test-agent'
+
+    def get_cookies(self):
+        return [{'name': 'session', 'value': '123', 'domain': '127.0.0.1'}]
+
+
+class ImageFetcherTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), ImageHandler)
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        ImageHandler.requests = []
+
+    def test_fetch_images(self):
+        image_fetcher = ImageFetcher.ImageFetcher(MockDriver())
+        default_image = RecordImage(None, None, b'/images/default.png')
+
+        block_links = [
+            [f"{self.url}/images/1.png"],
+            [f"{self.url}/missing.png", f"{self.url}/images/2.png"],
+            [None, f"{self.url}/images/1.png"],
+            [f"{self.url}/images/default.png", f"{self.url}/images/3.png"],
+            ['/relative.png'],
+            []
+        ]
+        record_images = image_fetcher.fetch_images(block_links, {default_image.hash})
+
+        self.assertEqual([b'/images/1.png', b'/images/2.png', b'/images/1.png', None, None, None],
+                         [record_image.image if record_image is not None else None for record_image in record_images],
+                         'wrong images')
+        self.assertEqual('png', record_images[0].extension, 'extension should be taken from the content type')
+
+        requested_paths = [path for path, user_agent, cookie in ImageHandler.requests]
+        self.assertEqual(1, requested_paths.count('/images/1.png'), 'images should be downloaded once per page')
+        self.assertNotIn('/images/3.png', requested_paths, 'links after the first image should not be downloaded')
+        self.assertTrue(all(user_agent == 'test-agent' and cookie == 'session=123'
+                            for path, user_agent, cookie in ImageHandler.requests), 'driver headers were not sent')
+
+    def test_concurrent_downloads(self):
+        image_fetcher = ImageFetcher.ImageFetcher(MockDriver(), thread_count=8)
+        block_links = [[f"{self.url}/images/concurrent_{index}.png"] for index in range(8)]
+
+        start = timeit.default_timer()
+        record_images = image_fetcher.fetch_images(block_links, set())
+        duration = timeit.default_timer() - start
+
+        self.assertTrue(all(record_image is not None for record_image in record_images), 'images were not fetched')
+        self.assertLess(duration, IMAGE_DELAY * 4, 'images were not downloaded concurrently')
+
+    def test_streaming_hash(self):
+        image_link = f"{self.url}/images/streamed.png"
+
+        kept_image = ImageFetcher.ImageFetcher(MockDriver()).download(image_link)
+        hashed_image = ImageFetcher.ImageFetcher(MockDriver(), keep_images=False).download(image_link)
+
+        self.assertEqual(b'/images/streamed.png', kept_image.image, 'image was not kept')
+        self.assertIsNone(hashed_image.image, 'image should only be kept if it is needed')
+        self.assertEqual(RecordImage(None, None, b'/images/streamed.png').hash, hashed_image.hash,
+                         'streamed hash differs from the hash of the image')
+        self.assertEqual(kept_image.hash, hashed_image.hash, 'hashes differ')
+
+    def test_image_cache(self):
+        image_link = f"{self.url}/cached/1.png"
+        expected_hash = RecordImage(None, None, b'/cached/1.png').hash
+
+        image_cache = ImageCacheService.ImageCache('test', {}, 0, 0)
+        downloaded_image = ImageFetcher.ImageFetcher(MockDriver(), keep_images=False,
+                                                     image_cache=image_cache).download(image_link)
+        self.assertEqual(expected_hash, downloaded_image.hash, 'wrong hash of the downloaded image')
+        self.assertEqual(IMAGE_ETAG, image_cache.get(image_link)['etag'], 'ETag was not cached')
+
+        revalidated_image = ImageFetcher.ImageFetcher(MockDriver(), keep_images=False,
+                                                      image_cache=image_cache).download(image_link)
+        self.assertEqual(expected_hash, revalidated_image.hash, 'cached hash was not reused')
+        self.assertEqual('png', revalidated_image.extension, 'cached extension was not reused')
+        self.assertEqual(1, image_cache.revalidated_count, 'image was not revalidated')
+
+        ImageHandler.requests = []
+        image_cache.max_age = 60
+        fresh_image = ImageFetcher.ImageFetcher(MockDriver(), keep_images=False,
+                                                image_cache=image_cache).download(image_link)
+        self.assertEqual(expected_hash, fresh_image.hash, 'cached hash was not reused')
+        self.assertEqual([], ImageHandler.requests, 'fresh images should not be requested')
+
+        kept_image = ImageFetcher.ImageFetcher(MockDriver(), image_cache=image_cache).download(image_link)
+        self.assertEqual(b'/cached/1.png', kept_image.image, 'images that are kept should be downloaded')
+
+        ImageHandler.requests = []
+        default_image = ImageFetcher.ImageFetcher(MockDriver(), image_cache=image_cache).download(image_link,
+                                                                                                  {expected_hash})
+        self.assertEqual(expected_hash, default_image.hash, 'cached default image was not reused')
+        self.assertEqual([], ImageHandler.requests, 'cached default images should not be downloaded to be kept')
+        self.assertEqual(2, image_cache.hit_count, 'reused images were not counted')
+
+    def test_keep_images_setting(self):
+        vdp_settings = ScraperSettings(scraper_type=ScraperType.VDP)
+
+        settings_service.set_settings({'vdp_scraper_settings': {}})
+        self.assertTrue(ImageFetcher.get_fetcher(MockDriver(), vdp_settings).keep_images,
+                        'images should be kept when uploading is not disabled, the same as RecordImage.save')
+
+        settings_service.set_settings({'catalog_scraper_settings': {'upload_record_images': True},
+                                       'vdp_scraper_settings': {'upload_record_images': False}})
+        self.assertFalse(ImageFetcher.get_fetcher(MockDriver(), vdp_settings).keep_images,
+                         'images should only be hashed when uploading is disabled for the scraper type')
+
+
+if __name__ == '__main__':
+    unittest.main()
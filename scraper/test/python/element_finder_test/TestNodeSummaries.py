@@ -0,0 +1,62 @@
+import unittest
+
+from bs4 import BeautifulSoup
+
+from element_finder import BlockFinder
+from element_finder.NodeSummaries import NodeSummaries
+from preprocessing import AnnotationStore
+
+input_html = ('<html><body><div id="list">'
+              '<p>ad</p>'
+              '<div id="card1"><a>1</a><span>1 000 EUR</span></div>'
+              '<div id="card2"><a>2</a><span>2 000 EUR</span></div>'
+              '</div></body></html>')
+
+
+def get_annotated_soup():
+    soup = BeautifulSoup(input_html, 'html.parser')
+    annotations = AnnotationStore.get_store(soup, create=True)
+
+    for index, card in enumerate(soup.find_all('div', id=['card1', 'card2'])):
+        annotations.add_data(card.a, 'alias', f"/car/{index + 1}")
+        annotations.add_data(card.a, 'alias', 'second alias')
+        annotations.add_data(card.span, 'price', card.span.text)
+    annotations.add_data(soup.p, 'alias', '/ad', AnnotationStore.FALLBACK)
+
+    return soup, annotations
+
+
+class NodeSummariesTest(unittest.TestCase):
+    def test_summaries(self):
+        soup, annotations = get_annotated_soup()
+        node_summaries = NodeSummaries(soup, ['price'], annotations)
+
+        card = soup.find('div', id='card1')
+        self.assertTrue(node_summaries.has_required_attributes(card), 'card has a price')
+        self.assertFalse(node_summaries.has_required_attributes(soup.p), 'ad has no price')
+        self.assertFalse(node_summaries.has_required_attributes(card.a.string), 'strings are never required')
+
+        self.assertEqual('/car/1', node_summaries.get_alias(card), 'alias should be the first in the subtree')
+        self.assertEqual('/car/1', node_summaries.get_alias(soup.body), 'alias should be the first in the subtree')
+        self.assertEqual('/ad', node_summaries.get_alias(soup.p), 'fallback alias should be used')
+        self.assertIsNone(node_summaries.get_alias(card.span), 'span has no alias')
+
+        list_tag = soup.find('div', id='list')
+        self.assertEqual(['/car/1', '/car/2'], list(node_summaries.get_child_aliases(list_tag)),
+                         'only children with the required attributes should be grouped')
+        self.assertTrue(node_summaries.has_other_alias(card), 'the other card has a different alias')
+
+    def test_move_up_blocks(self):
+        soup, annotations = get_annotated_soup()
+        node_summaries = NodeSummaries(soup, ['price'], annotations)
+
+        blocks = BlockFinder.soup_to_blocks(soup, node_summaries)
+        self.assertEqual([soup.span, soup.find_all('span')[1]], blocks, 'blocks should be the price tags')
+
+        moved_blocks = BlockFinder.move_up_blocks(blocks, node_summaries)
+        self.assertEqual(['card1', 'card2'], [block['id'] for block in moved_blocks],
+                         'blocks should be moved up to the cards')
+
+
+if __name__ == '__main__':
+    unittest.main()
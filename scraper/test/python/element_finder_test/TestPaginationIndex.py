@@ -0,0 +1,42 @@
+import unittest
+
+from bs4 import BeautifulSoup
+
+from element_finder.PaginationIndex import PaginationIndex
+
+input_html = ('<html><body>'
+              '<div class="cars"><p>2 doors</p><p>3</p></div>'
+              '<ul class="pagination">'
+              '<li><a href="?page=1"><span>1</span></a></li>'
+              '<li><a href="?page=2"> 2 </a></li>'
+              '<li><span>twenty one</span></li>'
+              '</ul>'
+              '<button><span>Load more</span> cars or show more</button>'
+              '</body></html>')
+
+
+class PaginationIndexTest(unittest.TestCase):
+    def test_page_buttons(self):
+        soup = BeautifulSoup(input_html, 'html.parser')
+        pagination_index = PaginationIndex(soup.body, [1, 2, 3, 21], [], ['a', 'button'])
+
+        links = soup.find_all('a')
+        self.assertEqual([links[0]], pagination_index.get_page_buttons(1), 'number should find its link')
+        self.assertEqual([links[1]], pagination_index.get_page_buttons(2), 'only exact numbers should match')
+        self.assertEqual([soup.find_all('p')[1]], pagination_index.get_page_buttons(3),
+                         'strings without a pagination tag should be their own button')
+        self.assertEqual([soup.find_all('span')[1]], pagination_index.get_page_buttons(21),
+                         'numbers in words should match')
+        self.assertEqual([], pagination_index.get_page_buttons(4), 'numbers that are not indexed have no buttons')
+
+    def test_view_more_buttons(self):
+        soup = BeautifulSoup(input_html, 'html.parser')
+        pagination_index = PaginationIndex(soup.body, [], ['show more', 'load more'], ['a', 'button'])
+
+        button = soup.find('button')
+        self.assertEqual([button, button], pagination_index.get_view_more_buttons(),
+                         'buttons should be kept per alias in the order of the aliases')
+
+
+if __name__ == '__main__':
+    unittest.main()
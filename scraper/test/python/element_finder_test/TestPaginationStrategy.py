@@ -0,0 +1,65 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from element_finder import PaginationStrategy
+from scrapers.ScraperSettings import ScraperSettings
+from services import SettingsService, PersistentCacheService
+
+settings_service = SettingsService.service
+
+
+class PaginationStrategyTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_folder = tempfile.TemporaryDirectory()
+        self.original_cache_folder = PersistentCacheService.CACHE_FOLDER
+        PersistentCacheService.CACHE_FOLDER = Path(self.cache_folder.name)
+
+        settings_service.set_settings({'test_scraper_settings': {'pagination_strategies': True}})
+
+    def tearDown(self):
+        PersistentCacheService.CACHE_FOLDER = self.original_cache_folder
+        self.cache_folder.cleanup()
+
+    def test_url_pattern(self):
+        pagination_strategy = PaginationStrategy.get_strategy(ScraperSettings())
+        pagination_strategy.remember('PAGINATOR', 'ul.pages>li>a', '/cars?page=2&size=20', 2)
+
+        self.assertEqual('/cars?page={page}&size=20', pagination_strategy.url_pattern, 'wrong url pattern')
+        self.assertTrue(pagination_strategy.is_known_button('PAGINATOR', 'div>a', '/cars?page=3&size=20', 3),
+                        'link of the next page should be known by its url')
+        self.assertFalse(pagination_strategy.is_known_button('PAGINATOR', 'ul.pages>li>a', '/cars?page=4&size=20', 3),
+                         'link of another page should not be known')
+        self.assertFalse(pagination_strategy.is_known_button('VIEW_MORE', 'ul.pages>li>a', '/cars?page=3&size=20', 3),
+                         'buttons of other handlers should not be known')
+
+    def test_button_selector(self):
+        pagination_strategy = PaginationStrategy.get_strategy(ScraperSettings())
+        pagination_strategy.remember('VIEW_MORE', 'div.list>button.more')
+
+        self.assertIsNone(pagination_strategy.url_pattern, 'buttons without links have no url pattern')
+        self.assertTrue(pagination_strategy.is_known_button('VIEW_MORE', 'div.list>button.more'),
+                        'button should be known by its selector')
+        self.assertFalse(pagination_strategy.is_known_button('VIEW_MORE', 'div.list>button'),
+                         'other buttons should not be known')
+
+    def test_save(self):
+        pagination_strategy = PaginationStrategy.get_strategy(ScraperSettings())
+        pagination_strategy.remember('PAGINATOR', 'ul.pages>li>a', '/cars/page/2', 2)
+        pagination_strategy.save()
+
+        saved_strategy = PaginationStrategy.get_strategy(ScraperSettings())
+        self.assertEqual('PAGINATOR', saved_strategy.handler, 'handler was not saved')
+        self.assertEqual('/cars/page/{page}', saved_strategy.url_pattern, 'url pattern was not saved')
+
+        saved_strategy.forget('PAGINATOR')
+        saved_strategy.save()
+        self.assertIsNone(PaginationStrategy.get_strategy(ScraperSettings()).handler, 'failed handler was kept')
+
+        settings_service.set_settings({'test_scraper_settings': {}})
+        self.assertIsNone(PaginationStrategy.get_strategy(ScraperSettings()).handler,
+                          'strategies should only be loaded if they are enabled')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import tempfile
+import unittest
+from copy import copy
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from element_finder import BlockFinder, RecordTemplate
+from preprocessing import ValueTagger, HtmlCleaner
+from scrapers.ScraperSettings import ScraperSettings
+from services import SettingsService, PersistentCacheService
+
+settings_service = SettingsService.service
+
+card_html = ('<div class="card new"><a href="/car/{index}">Car {index}</a>'
+             '<p><span>{price} EUR</span></p></div>')
+
+template_rules = [
+    {
+        "name": "alias",
+        "regex": "/car/\\d+",
+        "type": "text",
+        "tags": ["attribute", "regex_driven"],
+        "attribute_regex": "href",
+        "required": True
+    },
+    {
+        "name": "price",
+        "regex": "\\d+ EUR",
+        "type": "float",
+        "tags": ["text", "regex_driven"],
+        "required": True
+    }
+]
+
+
+cleaning_settings = {
+    'excluded_tags': ['script'],
+    'invisible_tag_regex': ['display:\\s*none'],
+    'whitelisted_attributes': ['href', 'class'],
+    'flattened_tags': ['b'],
+    'flattened_special_strings': [],
+    'punctuation_marks': [],
+    'redundant_punctuation_marks': [],
+    'empty_tags': []
+}
+
+
+def get_page(first_index, card_count, card=card_html, header='<div><h1>Cars</h1></div>'):
+    cards = ''.join(card.format(index=index, price=index * 100) for index in range(first_index,
+                                                                                    first_index + card_count))
+    html = f"<html><body>{header}<div class=\"list\">{cards}</div></body></html>"
+    soup = BeautifulSoup(html, 'html.parser')
+    for index, tag in enumerate(soup.find_all()):
+        tag.attrs['scraper-index'] = index
+    return soup
+
+
+def get_records(blocks):
+    return [{'alias': block['alias'], 'price': block['price'], 'parent': block['parent']} for block in blocks]
+
+
+class RecordTemplateTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_folder = tempfile.TemporaryDirectory()
+        self.original_cache_folder = PersistentCacheService.CACHE_FOLDER
+        PersistentCacheService.CACHE_FOLDER = Path(self.cache_folder.name)
+
+        settings_service.set_settings({
+            'test_scraper_settings': {'record_templates': True, 'max_tag_distance': 2},
+            'test_attribute_rules': template_rules
+        })
+
+    def tearDown(self):
+        PersistentCacheService.CACHE_FOLDER = self.original_cache_folder
+        self.cache_folder.cleanup()
+
+    def find_blocks(self, soup):
+        tagged_soup = ValueTagger.tag_values(soup, ScraperSettings())
+        return BlockFinder.find_new_blocks(tagged_soup, None, ScraperSettings())
+
+    def find_template_blocks(self, soup, record_template):
+        container = record_template.find_container(soup)
+        tagged_container = ValueTagger.tag_values(container, ScraperSettings(), save_statistics=False)
+        return BlockFinder.find_template_blocks(tagged_container, record_template, None, ScraperSettings())
+
+    def test_learn_template(self):
+        soup = get_page(1, 5)
+        record_template = RecordTemplate.learn_template(soup, soup, self.find_blocks(soup), ScraperSettings())
+
+        self.assertIsNotNone(record_template, 'template was not learned')
+        self.assertEqual([['html', 0], ['body', 0], ['div', 1]], record_template.container_path,
+                         'wrong container path')
+        self.assertEqual('div', record_template.card_name, 'wrong card name')
+        self.assertEqual(['card', 'new'], record_template.card_classes, 'wrong card classes')
+        self.assertEqual({'alias': [['a', 0]], 'price': [['p', 0], ['span', 0]]}, record_template.fields,
+                         'wrong fields')
+        self.assertEqual(5, record_template.record_count, 'wrong record count')
+
+        self.assertIsNotNone(RecordTemplate.get_template(ScraperSettings()), 'template was not saved')
+
+    def test_find_template_blocks(self):
+        soup = get_page(1, 5)
+        record_template = RecordTemplate.learn_template(soup, soup, self.find_blocks(soup), ScraperSettings())
+
+        next_soup = get_page(6, 5)
+        template_blocks = self.find_template_blocks(next_soup, record_template)
+        self.assertEqual(get_records(self.find_blocks(next_soup)), get_records(template_blocks),
+                         'template records differ from the full pipeline')
+
+        changed_soup = get_page(11, 5, card='<div class="card new"><a href="/car/{index}">{price} EUR</a></div>')
+        self.assertIsNone(self.find_template_blocks(changed_soup, record_template),
+                          'cards with a different structure should not be read through the template')
+
+        few_records_soup = get_page(16, 2)
+        self.assertIsNone(self.find_template_blocks(few_records_soup, record_template),
+                          'too few records should not be read through the template')
+
+    def test_clean_container(self):
+        settings_service.set_settings({
+            'test_scraper_settings': {'record_templates': True, 'max_tag_distance': 2, **cleaning_settings},
+            'test_attribute_rules': template_rules
+        })
+        header = '<script>var cars = 1;</script><div style="display: none">Menu</div><div><h1>Cars</h1></div>'
+
+        soup = get_page(1, 5, header=header)
+        cleaned_soup = HtmlCleaner.clean_data(soup, ScraperSettings())
+        source_soup = HtmlCleaner.make_inlined_soup(soup, ScraperSettings())
+        blocks = self.find_blocks(copy(cleaned_soup))
+        record_template = RecordTemplate.learn_template(source_soup, cleaned_soup, blocks, ScraperSettings())
+        self.assertEqual([['div', 2]], record_template.container_path,
+                         'container path should be learned in the page before cleaning')
+
+        next_soup = get_page(6, 5, header=header)
+        container = record_template.find_container(HtmlCleaner.make_inlined_soup(next_soup, ScraperSettings()))
+        HtmlCleaner.clean_container(container, ScraperSettings())
+        tagged_container = ValueTagger.tag_values(container, ScraperSettings(), save_statistics=False)
+        template_blocks = BlockFinder.find_template_blocks(tagged_container, record_template, None, ScraperSettings())
+
+        full_blocks = self.find_blocks(HtmlCleaner.clean_data(next_soup, ScraperSettings()))
+        self.assertEqual(get_records(full_blocks), get_records(template_blocks),
+                         'records of the cleaned container differ from the full pipeline')
+
+        settings_service.set_settings({
+            'test_scraper_settings': {**cleaning_settings, 'flattened_special_strings': ['Sold']},
+            'test_attribute_rules': template_rules
+        })
+        flattened_soup = BeautifulSoup('<html><body><div>Sold<p>Car</p></div></body></html>', 'html.parser')
+        self.assertIsNone(HtmlCleaner.clean_container(flattened_soup.div, ScraperSettings()),
+                          'container flattened by cleaning was returned')
+
+    def test_rules_changed(self):
+        soup = get_page(1, 5)
+        RecordTemplate.learn_template(soup, soup, self.find_blocks(soup), ScraperSettings())
+
+        settings_service.set_settings({
+            'test_scraper_settings': {'record_templates': True, 'max_tag_distance': 2},
+            'test_attribute_rules': template_rules[:1]
+        })
+        self.assertIsNone(RecordTemplate.get_template(ScraperSettings()), 'template was kept after the rules changed')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import json
+import unittest
+
+from bs4 import BeautifulSoup
+
+from preprocessing import AnnotationStore
+
+input_html = ('<html><body><div id="list">'
+              '<div id="card1"><a id="make1">BMW</a><p id="price1">1 000 EUR</p></div>'
+              '<div id="card2"><a id="make2">Audi</a><p id="year2">2019</p></div>'
+              '</div></body></html>')
+
+
+class AnnotationStoreTest(unittest.TestCase):
+    def create_store(self):
+        soup = BeautifulSoup(input_html, 'html.parser')
+        annotations = AnnotationStore.get_store(soup, create=True)
+
+        annotations.add_data(soup.find(id='make1'), 'make', 'BMW')
+        annotations.add_data(soup.find(id='price1'), 'price', '1 000')
+        annotations.add_data(soup.find(id='make2'), 'make', 'Audi')
+        annotations.add_data(soup.find(id='year2'), 'year', '2019', AnnotationStore.FALLBACK)
+
+        return soup, annotations
+
+    def test_aggregate_counts(self):
+        soup, annotations = self.create_store()
+
+        self.assertEqual({'make': 2, 'price': 1}, annotations.get_counts(soup.find(id='list')),
+                         'counts were not aggregated')
+        self.assertEqual({'make': 1}, annotations.get_counts(soup.find(id='card2')), 'counts were not aggregated')
+        self.assertEqual({'year': 1}, annotations.get_counts(soup.find(id='card2'), AnnotationStore.FALLBACK),
+                         'fallback counts were not aggregated')
+        self.assertEqual({'make': 2, 'price': 1}, annotations.get_counts(soup), 'root counts were not aggregated')
+        self.assertTrue(annotations.has_counts(soup.find(id='year2')), 'fallback counts were not found')
+        self.assertIs(annotations, AnnotationStore.get_store(soup.find(id='make1')), 'store was not shared')
+
+    def test_merge_counts(self):
+        soup, annotations = self.create_store()
+        card1 = soup.find(id='card1')
+        card2 = soup.find(id='card2')
+
+        # Counts are aggregated after tagging, before BlockFinder moves any tags
+        annotations.aggregate_counts()
+        card1.append(card2)
+        annotations.merge_counts(card2, card1)
+
+        self.assertEqual({'make': 2, 'price': 1}, annotations.get_counts(card1), 'counts were not merged')
+        self.assertEqual({'year': 1}, annotations.get_counts(card1, AnnotationStore.FALLBACK),
+                         'fallback counts were not merged')
+
+    def test_serialize_annotations(self):
+        soup, annotations = self.create_store()
+
+        AnnotationStore.serialize_annotations(soup)
+        self.assertEqual('{"make": ["BMW"]}', soup.find(id='make1').attrs['scraper-data'], 'data was not written')
+        self.assertEqual({'make': 1, 'price': 1}, json.loads(soup.find(id='card1').attrs['scraper-counts']),
+                         'counts were not written')
+
+        saved_soup = BeautifulSoup(str(soup), 'html.parser')
+        saved_annotations = AnnotationStore.get_store(saved_soup)
+        self.assertEqual(['Audi'], saved_annotations.get_values(saved_soup.find(id='make2'), 'make'),
+                         'data was not read from attributes')
+        self.assertEqual({'make': 2, 'price': 1}, saved_annotations.get_counts(saved_soup.find(id='list')),
+                         'counts were not read from attributes')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+
+import regex
+from bs4 import BeautifulSoup
+
+from preprocessing import AttributeIndex
+
+input_html = ('<html><body>'
+              '<a href="/car/1" title="BMW X5"><img alt="BMW" src="1.jpg"></a>'
+              '<a href="/car/2" data-title="Audi A4"></a>'
+              '</body></html>')
+
+
+class AttributeIndexTest(unittest.TestCase):
+    def test_get_entries(self):
+        soup = BeautifulSoup(input_html, 'html.parser')
+        attribute_index = AttributeIndex.get_index(soup)
+        links = soup.find_all('a')
+        image = soup.find('img')
+
+        self.assertEqual([(links[0], 'title'), (links[1], 'data-title')],
+                         attribute_index.get_entries(regex.compile('title')), 'entries are not the matching names')
+        self.assertEqual([(links[0], 'href'), (image, 'alt'), (links[1], 'href')],
+                         attribute_index.get_entries(regex.compile('^(?:href|alt)$')),
+                         'entries are not in document order')
+        self.assertEqual([], attribute_index.get_entries(regex.compile('class')), 'missing name has entries')
+
+    def test_attach_index(self):
+        soup = BeautifulSoup(input_html, 'html.parser')
+
+        self.assertIsNone(AttributeIndex.get_index(soup, create=False), 'index was attached without attach_index')
+
+        attribute_index = AttributeIndex.attach_index(soup)
+        self.assertIs(attribute_index, AttributeIndex.get_index(soup.find('img')), 'index was not attached to the root')
+
+
+if __name__ == '__main__':
+    unittest.main()
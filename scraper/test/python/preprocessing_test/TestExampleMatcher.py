@@ -0,0 +1,28 @@
+import unittest
+
+from preprocessing import ExampleMatcher
+
+
+class ExampleMatcherTest(unittest.TestCase):
+    def test_find(self):
+        matcher = ExampleMatcher.ExampleMatcher(['he', 'she', 'his', 'hers', 'she'])
+
+        self.assertEqual({0, 1, 3, 4}, matcher.find('ushers'), 'overlapping examples were not found')
+        self.assertEqual({2}, matcher.find('this'), 'example was not found')
+        self.assertEqual(set(), matcher.find('HERS'), 'example was found with different case')
+
+    def test_find_ignore_case(self):
+        matcher = ExampleMatcher.ExampleMatcher(['Straße', 'BMW X5', 5], ignore_case=True)
+
+        self.assertEqual({0}, matcher.find('STRASSE'), 'case-folded example was not found')
+        self.assertEqual({1, 2}, matcher.find('bmw x5 xDrive'), 'example was not found ignoring case')
+
+    def test_get_matcher(self):
+        matcher = ExampleMatcher.get_matcher(['a', 'b'])
+
+        self.assertIs(matcher, ExampleMatcher.get_matcher(['a', 'b']), 'matcher was not cached')
+        self.assertIsNot(matcher, ExampleMatcher.get_matcher(['a', 'b'], True), 'ignore_case matcher was shared')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,13 @@
-import regex
+import tempfile
 import unittest
+from pathlib import Path
+
+import regex
 
 from scrapers.ScraperSettings import ScraperSettings
-from services import SettingsService
+from services import SettingsService, PersistentCacheService
 from services import StopwordService
-from preprocessing import HtmlCleaner
+from preprocessing import HtmlCleaner, StreamingCleaner
 
 from bs4 import BeautifulSoup
 
@@ -12,7 +15,43 @@ settings_service = SettingsService.service
 StopwordService = StopwordService.service
 
 
+streaming_settings = {
+    'excluded_tags': ['script', 'svg', 'noscript', 'div.ad'],
+    'invisible_tag_regex': ['display:\\s?none', 'visibility:\\s?hidden'],
+    'whitelisted_attributes': ['class', 'href', 'src', 'id'],
+    'flattened_tags': ['b', 'i'],
+    'flattened_special_strings': ['EUR'],
+    'punctuation_marks': [','],
+    'redundant_punctuation_marks': ['|'],
+    'empty_tags': ['img'],
+}
+
+
+def clean_with_streaming(input_html, settings, configuration=None):
+    """
+    :return: The soup cleaned by HtmlCleaner.clean_data without and with streaming cleaning
+    """
+    settings_service.mock_catalog_settings(dict(settings, streaming_cleaning=False))
+    cleaned_soup = HtmlCleaner.clean_data(BeautifulSoup(input_html, 'html.parser'),
+                                          ScraperSettings(configuration=configuration))
+
+    settings_service.mock_catalog_settings(dict(settings, streaming_cleaning=True))
+    streamed_soup = HtmlCleaner.clean_data(BeautifulSoup(input_html, 'html.parser'),
+                                           ScraperSettings(configuration=configuration))
+
+    return cleaned_soup, streamed_soup
+
+
 class HtmlCleanerTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_folder = tempfile.TemporaryDirectory()
+        self.original_cache_folder = PersistentCacheService.CACHE_FOLDER
+        PersistentCacheService.CACHE_FOLDER = Path(self.cache_folder.name)
+
+    def tearDown(self):
+        PersistentCacheService.CACHE_FOLDER = self.original_cache_folder
+        self.cache_folder.cleanup()
+
     def test_remove_comments(self):
         input_html = ('<html><body><div>'
                       '<a>TEST</a>'
@@ -77,6 +116,21 @@ class HtmlCleanerTest(unittest.TestCase):
 
         self.assertIsNotNone(soup.find(string='I STAY'), 'span tag should not be removed')
 
+    def test_remove_excluded_structural_tags(self):
+        input_html = ('<html><body><div>'
+                      '<span>REMOVE ME</span><p>AND ME</p><p>I STAY</p>'
+                      '</div></body></html>')
+
+        soup = BeautifulSoup(input_html, 'html.parser')
+        settings = {'excluded_tags': ['span', 'div > p:first-child']}
+        settings_service.mock_catalog_settings(settings)
+
+        HtmlCleaner.remove_excluded_tags(soup, ScraperSettings())
+
+        self.assertIsNone(soup.find(string='REMOVE ME'), 'span tag not removed')
+        self.assertIsNone(soup.find(string='AND ME'), 'tag that became the first child was not removed')
+        self.assertIsNotNone(soup.find(string='I STAY'), 'second paragraph should not be removed')
+
     def test_remove_invisible_tags(self):
         input_html = ('<html><body><div>'
                       '<a class="v-card-item" style="display:none"><span>REMOVE ME</span></a>'
@@ -234,6 +288,70 @@ class HtmlCleanerTest(unittest.TestCase):
         self.assertIsNotNone(soup.find(name='img', src='image2.jpg'), 'Relative image was not inlined')
         self.assertIsNotNone(soup.find(name='img', src='example.com/image3.jpg'), 'Image tag was removed')
 
+    def test_streaming_clean_data(self):
+        input_html = ('<!DOCTYPE html><html><head><title>TITLE</title><style>.gone {display: none}</style></head>'
+                      '<body class="page"><!-- REMOVE ME -->'
+                      '<div id="list" class="cards" data-id="5">'
+                      '<div class="card" style="background-image: url(\'car1.jpg\')">'
+                      '<a href="/1" onclick="open()">CAR   <b>1</b></a>'
+                      '<p>PRICE:  1 000 € , <i>incl.</i> VAT</p>'
+                      '<script>let html = "<div>REMOVE ME</div>";</script>'
+                      '<svg><g><br></g></svg>'
+                      '</div>'
+                      '<div class="card gone"><a href="/2">REMOVE ME</a></div>'
+                      '<div class="card" hidden><a href="/3">REMOVE ME</a></div>'
+                      '<div class="card"><a href="/4">CAR 4<img src="4.jpg"></a>'
+                      '<div class="ad"><p>REMOVE <br/> ME<p>UNCLOSED</div>'
+                      '<span class="x">I STAY</span><!-- REMOVE ME --></div>'
+                      '</div>'
+                      '<noscript>REMOVE ME</noscript>'
+                      '<p>Special string: <b>EUR</b> is included in this text.</p>'
+                      '</body></html>')
+        cleaned_soup, streamed_soup = clean_with_streaming(input_html, streaming_settings)
+
+        self.assertEqual(str(cleaned_soup), str(streamed_soup), 'streamed soup differs from cleaned soup')
+        self.assertIsNone(streamed_soup.find(string=regex.compile('REMOVE ME')), 'removed content was parsed')
+        self.assertIsNotNone(streamed_soup.find(string='I STAY'), 'content after excluded tag was removed')
+        self.assertIsNotNone(streamed_soup.find(name='img', src='car1.jpg'), 'background image was not inlined')
+
+    def test_streaming_excluded_background_images(self):
+        input_html = ('<html><body>'
+                      '<div class="card" style="background-image: url(\'car1.jpg\')"><a>CAR 1</a></div>'
+                      '</body></html>')
+        settings = dict(streaming_settings, excluded_tags=['.card img'])
+
+        cleaned_soup, streamed_soup = clean_with_streaming(input_html, settings)
+
+        self.assertEqual(str(cleaned_soup), str(streamed_soup), 'streamed soup differs from cleaned soup')
+        self.assertIsNone(streamed_soup.find('img'), 'excluded background image was inlined')
+
+    def test_streaming_ignored_duplicate_whitespace(self):
+        input_html = '<html><body><div><a>CAR  1</a><pre>a   b</pre></div></body></html>'
+        configuration = {'ignored_cleaning_steps': ['remove_duplicate_whitespace']}
+
+        cleaned_soup, streamed_soup = clean_with_streaming(input_html, streaming_settings, configuration)
+
+        self.assertEqual(str(cleaned_soup), str(streamed_soup), 'streamed soup differs from cleaned soup')
+        self.assertIsNotNone(streamed_soup.find(string='CAR  1'), 'ignored whitespace step collapsed whitespace')
+
+    def test_streaming_unsupported_excluded_tags(self):
+        input_html = ('<html><body><div>'
+                      '<a class="v-card-item"><span>REMOVE ME</span><span>I STAY</span></a>'
+                      '</div></body></html>')
+        settings = {
+            'excluded_tags': ['span:first-child'],
+            'invisible_tag_regex': [],
+            'whitelisted_attributes': [],
+        }
+        settings_service.mock_catalog_settings(settings)
+
+        soup, streamed_steps = StreamingCleaner.make_clean_soup(input_html, ScraperSettings())
+
+        self.assertNotIn('remove_excluded_tags', streamed_steps, 'unsupported selector was streamed')
+        self.assertNotIn('remove_non_whitelisted_attributes', streamed_steps,
+                         'attributes were filtered before excluded tags were removed')
+        self.assertIsNotNone(soup.find(class_='v-card-item'), 'attributes were filtered')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+import regex
+from bs4 import BeautifulSoup
+
+from preprocessing import MatchMemo
+from scrapers.ScraperSettings import ScraperSettings
+from services import SettingsService
+
+settings_service = SettingsService.service
+
+
+class MatchMemoTest(unittest.TestCase):
+    def test_search(self):
+        soup = BeautifulSoup('<div><p>12 000 km</p><p>12 000 km</p></div>', 'html.parser')
+        strings = soup.find_all(string=True)
+        value_regex = regex.compile('\\d+ km')
+        match_memo = MatchMemo.MatchMemo('test', 10)
+
+        first_match = match_memo.search(value_regex, strings[0])
+        second_match = match_memo.search(value_regex, strings[1])
+
+        self.assertIs(first_match, second_match, 'match of the same text was not cached')
+        self.assertEqual((3, 9), second_match.span(), 'cached span is not the span of the text')
+        self.assertIsNone(match_memo.search(value_regex, 'no match'), 'missing match was found')
+        self.assertEqual((1, 2), (match_memo.hit_count, match_memo.miss_count), 'searches were not counted')
+        self.assertNotIsInstance(next(iter(match_memo.matches))[1], type(strings[0]), 'memo keeps the tree alive')
+
+    def test_max_size(self):
+        value_regex = regex.compile('a')
+        match_memo = MatchMemo.MatchMemo('test', 2)
+
+        match_memo.search(value_regex, 'a')
+        match_memo.search(value_regex, 'b')
+        match_memo.search(value_regex, 'a')
+        match_memo.search(value_regex, 'c')
+
+        self.assertEqual([(value_regex, 'a'), (value_regex, 'c')], list(match_memo.matches),
+                         'least recently used match was not dropped')
+
+    def test_domain_memo(self):
+        settings_service.mock_catalog_settings({'domain_match_memo': True})
+        first_soup = BeautifulSoup('<p>a</p>', 'html.parser')
+        second_soup = BeautifulSoup('<p>b</p>', 'html.parser')
+
+        match_memo = MatchMemo.attach_memo(first_soup, ScraperSettings(domain='test.com'))
+
+        self.assertIs(match_memo, MatchMemo.get_memo(first_soup.p), 'memo was not attached to the root')
+        self.assertIs(match_memo, MatchMemo.attach_memo(second_soup, ScraperSettings(domain='test.com')),
+                      'memo was not shared by the pages of the domain')
+        self.assertIsNot(match_memo, MatchMemo.attach_memo(second_soup, ScraperSettings(domain='other.com')),
+                         'memo was shared by different domains')
+
+
+if __name__ == '__main__':
+    unittest.main()
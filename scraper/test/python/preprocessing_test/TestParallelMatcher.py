@@ -0,0 +1,40 @@
+import unittest
+
+from bs4 import BeautifulSoup
+
+from preprocessing import ParallelMatcher, TextBuffer, MatchMemo
+from services import CompiledRuleService
+
+CompiledRuleService = CompiledRuleService.service
+
+input_html = '<div><p>12 000 km</p><p>12 000 km</p><p>Diesel</p><p>5 km</p></div>'
+
+
+class ParallelMatcherTest(unittest.TestCase):
+    def test_find_matches(self):
+        soup = BeautifulSoup(input_html, 'html.parser')
+        TextBuffer.attach_buffer(soup)
+        match_memo = MatchMemo.MatchMemo('test', 10)
+        rule = {'name': 'km', 'regex': '\\d+ km', 'tags': ['text', 'regex_driven']}
+        compiled_rule = CompiledRuleService.get_rule(rule)
+        value_regex = compiled_rule.value_regex
+        match_memo.search(value_regex, '5 km')
+
+        match_prefetch = ParallelMatcher.prefetch_matches(soup, [compiled_rule], 2, match_memo)
+
+        self.assertEqual(['12 000 km', 'Diesel'], list(match_prefetch.text_matches[value_regex]),
+                         'texts were not searched once or memoized texts were searched again')
+        found_matches = match_prefetch.find_matches(value_regex)
+        expected_matches = [(string, value_regex.search(string)) for string in soup.find_all(string=value_regex)]
+        self.assertEqual([(string, found.span()) for string, found in expected_matches],
+                         [(string, found.span()) for string, found in found_matches], 'wrong matches')
+        self.assertTrue(match_memo.contains(value_regex, 'Diesel'), 'prefetched matches were not memoized')
+
+        new_string = soup.p.string.replace_with('7 km')
+        TextBuffer.get_buffer(soup).replace(new_string, soup.p.string)
+        found_strings = [string for string, _ in match_prefetch.find_matches(value_regex)]
+        self.assertEqual(['7 km', '12 000 km', '5 km'], found_strings, 'replaced string was not searched')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+from bs4 import BeautifulSoup
+
+from preprocessing import PositionIndex
+
+input_html = ('<html><body>'
+              '<div id="first"><span>$PRICE_LABEL$</span><p>1 000 EUR</p></div>'
+              '<div id="second"><p>2 000 EUR</p></div>'
+              '</body></html>')
+
+
+class PositionIndexTest(unittest.TestCase):
+    def test_positions(self):
+        soup = BeautifulSoup(input_html, 'html.parser')
+        position_index = PositionIndex.get_index(soup, create=True)
+
+        nodes = [soup]
+        nodes.extend(soup.descendants)
+        for position, node in enumerate(nodes):
+            self.assertEqual(position, position_index.get_position(node), 'position is not in document order')
+
+        first = soup.find(id='first')
+        first_position = position_index.get_position(first)
+        self.assertIs(soup.find(string='1 000 EUR'), position_index.nodes[position_index.get_end(first_position)],
+                      'subtree end is not the last descendant')
+        self.assertIs(position_index, PositionIndex.get_index(first), 'index was not attached to the root')
+
+    def test_has_label_between(self):
+        soup = BeautifulSoup(input_html, 'html.parser')
+        position_index = PositionIndex.get_index(soup, create=True)
+
+        first_price = position_index.get_position(soup.find(string='1 000 EUR'))
+        second = position_index.get_position(soup.find(id='second'))
+        second_price = position_index.get_position(soup.find(string='2 000 EUR'))
+
+        self.assertTrue(position_index.has_label_between('$PRICE_LABEL$', 0, first_price), 'label was not found')
+        self.assertFalse(position_index.has_label_between('$PRICE_LABEL$', second, second_price),
+                         'label outside of range was found')
+
+    def test_replace(self):
+        soup = BeautifulSoup(input_html, 'html.parser')
+        position_index = PositionIndex.get_index(soup, create=True)
+        label = soup.find(string='$PRICE_LABEL$')
+        price = soup.find(string='2 000 EUR')
+        price_position = position_index.get_position(price)
+
+        self.assertTrue(position_index.has_label_between('$PRICE_LABEL$', 0, price_position), 'label was not found')
+
+        parent = price.parent
+        price.replace_with('$PRICE_LABEL$ $PRICE$')
+        position_index.replace(price, parent.contents[0])
+        label.replace_with('Price')
+        position_index.replace(label, soup.find(string='Price'))
+
+        self.assertEqual(price_position, position_index.get_position(parent.contents[0]), 'position was not kept')
+        self.assertIsNone(position_index.get_position(price), 'replaced string still has a position')
+        self.assertEqual([price_position], position_index.get_label_positions('$PRICE_LABEL$'),
+                         'label positions were not updated')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+
+from bs4 import BeautifulSoup
+
+from preprocessing import SelectorIndex
+
+input_html = ('<html><body>'
+              '<div id="list" class="cards wide">'
+              '<div class="card"><a class="link" href="/1"><span>Car 1</span></a><p type="Text">1 000 €</p></div>'
+              '<div class="card"><a class="link active" href="/2"><span>Car 2</span></a><p>2 000 €</p></div>'
+              '<div class="card md:flex"><a href="/3"><span>Car 3</span></a><svg><g></g></svg></div>'
+              '<script>var cards = 3;</script>'
+              '</div>'
+              '<ul class="paginator"><li><a class="page 1st">1</a></li><li><a class="page">2</a></li></ul>'
+              '</body></html>')
+
+selectors = ['div', 'a', 'span', '.card', '.link.active', '#list', '#list a', 'div > a', 'div a > span',
+             '.cards .card > p', 'ul.paginator li a.page', '[href]', '[href="/2"]', '[type=text]', 'svg, script',
+             'div, a, div', '*', '.md\\:flex', 'A', 'a:first-child', 'li + li', 'div.missing span']
+
+
+class SelectorIndexTest(unittest.TestCase):
+    def test_select_matches_soupsieve(self):
+        soup = BeautifulSoup(input_html, 'html.parser')
+        selector_index = SelectorIndex.SelectorIndex(soup)
+
+        for selector in selectors:
+            self.assertEqual([id(tag) for tag in soup.select(selector)],
+                             [id(tag) for tag in selector_index.select(selector)],
+                             f"Selector index does not match soupsieve for {selector}")
+
+    def test_select_in_scope_matches_soupsieve(self):
+        soup = BeautifulSoup(input_html, 'html.parser')
+        selector_index = SelectorIndex.SelectorIndex(soup)
+
+        for scope in soup.find_all():
+            for selector in selectors:
+                self.assertEqual([id(tag) for tag in scope.select(selector)],
+                                 [id(tag) for tag in selector_index.select(selector, scope)],
+                                 f"Selector index does not match soupsieve for {selector} in {scope.name}")
+
+    def test_select_all(self):
+        soup = BeautifulSoup(input_html, 'html.parser')
+        selector_index = SelectorIndex.SelectorIndex(soup)
+
+        found_tags = selector_index.select_all(['script', 'svg'])
+
+        self.assertEqual(soup.select('script'), found_tags['script'], 'script tags not found')
+        self.assertEqual(soup.select('svg'), found_tags['svg'], 'svg tags not found')
+
+    def test_is_attached(self):
+        soup = BeautifulSoup(input_html, 'html.parser')
+        selector_index = SelectorIndex.SelectorIndex(soup)
+
+        svg = selector_index.select('svg')[0]
+        g = selector_index.select('g')[0]
+        svg.replace_with('\n')
+
+        self.assertFalse(selector_index.is_attached(svg), 'removed tag is still attached')
+        self.assertFalse(selector_index.is_attached(g), 'child of removed tag is still attached')
+        self.assertTrue(selector_index.is_attached(selector_index.select('script')[0]), 'tag was detached')
+
+    def test_unsupported_selectors(self):
+        self.assertTrue(SelectorIndex.is_supported('div.card > a[href] span, #list'))
+        self.assertFalse(SelectorIndex.is_supported('a:first-child'))
+        self.assertFalse(SelectorIndex.is_supported('li + li'))
+        self.assertFalse(SelectorIndex.is_supported('[href^="/"]'))
+
+
+if __name__ == '__main__':
+    unittest.main()
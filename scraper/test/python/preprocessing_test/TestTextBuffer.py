@@ -0,0 +1,69 @@
+import unittest
+
+import regex
+from bs4 import BeautifulSoup
+
+from preprocessing import TextBuffer, ExampleMatcher
+
+input_html = ('<html><body>'
+              '<div><span>Price</span><p>1 000 EUR</p></div>'
+              '<div><p>2 000</p><p>EUR 3</p><p>Audi A4</p></div>'
+              '</body></html>')
+
+
+class TextBufferTest(unittest.TestCase):
+    def assert_same_strings(self, soup, pattern):
+        value_regex = regex.compile(pattern)
+        text_buffer = TextBuffer.TextBuffer(soup)
+
+        found_strings = [string for string, found in text_buffer.find_matches(value_regex)]
+        expected_strings = soup.find_all(string=value_regex)
+
+        self.assertEqual(len(expected_strings), len(found_strings), f'different strings found for {pattern}')
+        for expected_string, found_string in zip(expected_strings, found_strings):
+            self.assertIs(expected_string, found_string, f'different strings found for {pattern}')
+
+    def test_find_matches(self):
+        soup = BeautifulSoup(input_html, 'html.parser')
+
+        self.assert_same_strings(soup, '\\d+ \\d+ EUR')
+        # Matches can't cross strings, '2 000' and 'EUR 3' don't contain '\\d+ EUR'
+        self.assert_same_strings(soup, '\\d+\\W+EUR')
+        # The crossing match '000\x00EUR 3' hides the match '3' of the second string
+        self.assert_same_strings(soup, '\\d+\\W+EUR \\d|3')
+        self.assert_same_strings(soup, '(?<!\\S)\\d+')
+        self.assert_same_strings(soup, '\\bA\\w+')
+
+        found = TextBuffer.TextBuffer(soup).find_matches(regex.compile('\\d+ EUR'))
+        self.assertEqual(['1 000 EUR'], [str(string) for string, _ in found], 'string was not found')
+        self.assertEqual('000 EUR', found[0][1].group(0), 'match is not of the string')
+
+    def test_find_examples(self):
+        soup = BeautifulSoup(input_html, 'html.parser')
+        text_buffer = TextBuffer.TextBuffer(soup)
+        example_matcher = ExampleMatcher.ExampleMatcher(['eur', 'audi', '000\x00eur'], ignore_case=True)
+
+        candidates = text_buffer.find_examples(example_matcher, 3)
+
+        self.assertEqual([1, 3], candidates[0], 'example was not found')
+        self.assertEqual([4], candidates[1], 'example was not found ignoring case')
+        self.assertEqual([2, 3], candidates[2], 'crossing example was not a candidate of both strings')
+
+    def test_replace(self):
+        soup = BeautifulSoup(input_html, 'html.parser')
+        text_buffer = TextBuffer.TextBuffer(soup)
+        price = soup.find(string='1 000 EUR')
+        value_regex = regex.compile('\\d+ EUR')
+
+        self.assertEqual(1, len(text_buffer.find_matches(value_regex)), 'string was not found')
+
+        parent = price.parent
+        price.replace_with('$PRICE$')
+        text_buffer.replace(price, parent.contents[0])
+
+        self.assertEqual(0, len(text_buffer.find_matches(value_regex)), 'replaced string was found')
+        self.assertIs(parent.contents[0], text_buffer.strings[1], 'position was not kept')
+
+
+if __name__ == '__main__':
+    unittest.main()
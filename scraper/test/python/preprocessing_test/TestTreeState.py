@@ -0,0 +1,28 @@
+import unittest
+
+from bs4 import BeautifulSoup
+
+from preprocessing import TreeState
+
+input_html = '<html><body><div><p>1</p></div></body></html>'
+
+
+class TreeStateTest(unittest.TestCase):
+    def test_get_state(self):
+        soup = BeautifulSoup(input_html, 'html.parser')
+        paragraph = soup.find('p')
+
+        self.assertIs(soup, TreeState.get_root(paragraph.string), 'wrong root')
+        self.assertIsNone(TreeState.get_state(paragraph, 'scraper_state'), 'trees should start without state')
+        self.assertIsNone(TreeState.get_state(paragraph, 'p'), 'tags of the tree should not be returned as state')
+
+        state = TreeState.get_state(paragraph, 'scraper_state', lambda root: [root])
+        self.assertEqual([soup], state, 'state was not built from the root')
+        self.assertIsNone(TreeState.get_state(paragraph, 'scraper_state'), 'state was kept without keep')
+
+        kept_state = TreeState.get_state(paragraph, 'scraper_state', lambda root: [root], keep=True)
+        self.assertIs(kept_state, TreeState.get_state(soup.find('div'), 'scraper_state'), 'state was not kept')
+
+
+if __name__ == '__main__':
+    unittest.main()
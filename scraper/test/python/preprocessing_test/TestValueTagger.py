@@ -1,11 +1,13 @@
+import tempfile
 import unittest
+from pathlib import Path
 
 import regex
 from bs4 import BeautifulSoup
 
 from scrapers.ScraperSettings import ScraperSettings
-from services import SettingsService
-from preprocessing import ValueTagger
+from services import SettingsService, PersistentCacheService
+from preprocessing import ValueTagger, AnnotationStore
 
 settings_service = SettingsService.service
 input_html = ('<html><body><div>'
@@ -17,6 +19,14 @@ input_html = ('<html><body><div>'
 
 
 class ValueTaggerTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_folder = tempfile.TemporaryDirectory()
+        self.original_cache_folder = PersistentCacheService.CACHE_FOLDER
+        PersistentCacheService.CACHE_FOLDER = Path(self.cache_folder.name)
+
+    def tearDown(self):
+        PersistentCacheService.CACHE_FOLDER = self.original_cache_folder
+        self.cache_folder.cleanup()
 
     def test_example_replace_text_strict(self):
         soup = BeautifulSoup(input_html, 'html.parser')
@@ -305,9 +315,120 @@ class ValueTaggerTest(unittest.TestCase):
         self.assertEqual([], soup.findAll(string=regex.compile(".*ME.*")),
                          f'Regex strict text value was not replaced {soup.prettify()}')
 
-        self.assertEqual('{"test": ["REPLACE", "ME"]}', soup.find('span').attrs['scraper-data'],
+        annotations = AnnotationStore.get_store(soup)
+        self.assertEqual({"test": ["REPLACE", "ME"]}, annotations.get_data(soup.find('span')),
                          f'Attribute was not replaced {soup.prettify()}')
 
+        AnnotationStore.serialize_annotations(soup)
+        self.assertEqual('{"test": ["REPLACE", "ME"]}', soup.find('span').attrs['scraper-data'],
+                         f'Attribute was not serialized {soup.prettify()}')
+
+    def test_example_replace_text_longest_first(self):
+        soup = BeautifulSoup('<html><body><div>'
+                             '<span>BMW X5 xDrive</span>'
+                             '<span>bmw X5M</span>'
+                             '<span>BMWX5</span>'
+                             '</div></body></html>', 'html.parser')
+        rule = {
+            "name": "model",
+            "tags": [
+                "text",
+                "example_driven",
+                "ignore_case",
+                "reorder_examples"
+            ],
+            "examples": [
+                "BMW",
+                "BMW X5"
+            ]
+        }
+
+        ValueTagger.example_replace_text(soup, rule, ScraperSettings())
+
+        self.assertIsNotNone(soup.find(string='$MODEL$ xDrive'), f'Longest example was not replaced first {soup}')
+        self.assertIsNotNone(soup.find(string='$MODEL$ X5M'), f'Example was not replaced {soup}')
+        self.assertIsNotNone(soup.find(string='BMWX5'), f'Example was replaced without word boundary {soup}')
+
+    def test_labeled_text(self):
+        soup = BeautifulSoup('<html><body>'
+                             '<div><span>1 000 EUR</span></div>'
+                             '<div><span>Price</span><p><b>1 000 EUR</b></p></div>'
+                             '<div><p>Price: 2 000 EUR</p><p>3 000 EUR</p></div>'
+                             '<div><span>Price</span><p><i><b>4 000 EUR</b></i></p></div>'
+                             '</body></html>', 'html.parser')
+        settings_service.set_settings({
+            'test_scraper_settings': {'max_label_distance': 2},
+            'test_attribute_rules': [{
+                "name": "price",
+                "regex": "\\d[\\d ]* EUR",
+                "tags": [
+                    "text",
+                    "regex_driven",
+                    "labeled"
+                ],
+                "labels": [
+                    "Price"
+                ]
+            }]
+        })
+
+        soup = ValueTagger.tag_values(soup, ScraperSettings())
+
+        self.assertEqual('1 000 EUR', soup.find('span').string, f'Value before label was replaced {soup}')
+        self.assertEqual('$PRICE$', soup.find('b').string,
+                         f'Value after label with the same text as an unlabeled value was not replaced {soup}')
+        self.assertIsNotNone(soup.find(string='$PRICE_LABEL$: $PRICE$'), f'Value in label string was not replaced')
+        self.assertIsNotNone(soup.find(string='$PRICE$'), f'Value after label was not replaced {soup}')
+        self.assertIsNotNone(soup.find(string='4 000 EUR'), f'Value too far from label was replaced {soup}')
+
+    def test_parallel_tagging(self):
+        rules = [
+            {
+                "name": "test",
+                "regex": "REPLACE ME",
+                "tags": [
+                    "text",
+                    "regex_driven",
+                    "ignore_case",
+                    "labeled"
+                ],
+                "labels": [
+                    "Label"
+                ]
+            },
+            {
+                "name": "link",
+                "regex": "\\S*\\.com",
+                "tags": [
+                    "attribute",
+                    "regex_driven",
+                    "replace_similar"
+                ],
+                "attribute_regex": "\\bhref$"
+            },
+            {
+                "name": "test2",
+                "regex": "(?<=\\$TEST\\$\\s)goes",
+                "tags": [
+                    "text",
+                    "regex_driven"
+                ]
+            }
+        ]
+
+        tagged_soups = []
+        for parallel_tagging in [False, True]:
+            settings_service.set_settings({
+                'test_scraper_settings': {'max_label_distance': 2, 'parallel_tagging': parallel_tagging},
+                'test_attribute_rules': rules
+            })
+            soup = ValueTagger.tag_values(BeautifulSoup(input_html, 'html.parser'), ScraperSettings())
+            AnnotationStore.serialize_annotations(soup)
+            tagged_soups.append(str(soup))
+
+        self.assertEqual(tagged_soups[0], tagged_soups[1], 'parallel tagging differs from serial tagging')
+        self.assertIn('$TEST$ $TEST2$', tagged_soups[1], f'chained rule was not applied {tagged_soups[1]}')
+
     def check_text_strict(self, soup):
         self.assertEqual([], soup.findAll(string=regex.compile(".*REPLACE ME.*")),
                          f'Value was not replaced {soup.prettify()}')
@@ -0,0 +1,127 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from preprocessing import HtmlCleaner
+from scrapers.ScraperSettings import ScraperSettings
+from services import SettingsService, PersistentCacheService, CleaningStatisticsService
+
+settings_service = SettingsService.service
+
+
+class CleaningStatisticsServiceTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_folder = tempfile.TemporaryDirectory()
+        self.original_cache_folder = PersistentCacheService.CACHE_FOLDER
+        PersistentCacheService.CACHE_FOLDER = Path(self.cache_folder.name)
+
+    def tearDown(self):
+        PersistentCacheService.CACHE_FOLDER = self.original_cache_folder
+        self.cache_folder.cleanup()
+
+    def test_statistics_are_persisted(self):
+        settings_service.mock_catalog_settings({})
+
+        profile = CleaningStatisticsService.get_profile(ScraperSettings())
+        profile.record('remove_comments', 3, 0.5)
+        profile.save()
+
+        profile = CleaningStatisticsService.get_profile(ScraperSettings())
+        step = profile.get_step('remove_comments')
+
+        self.assertEqual(1, profile.statistics['runs'], 'run count was not persisted')
+        self.assertEqual(1, step['runs'], 'step run count was not persisted')
+        self.assertEqual(3, step['changed'], 'changed node count was not persisted')
+
+    def test_parallel_runs_are_merged(self):
+        settings_service.mock_catalog_settings({})
+
+        first_profile = CleaningStatisticsService.get_profile(ScraperSettings())
+        second_profile = CleaningStatisticsService.get_profile(ScraperSettings())
+        first_profile.record('remove_comments', 3, 0.5)
+        second_profile.record('remove_comments', 2, 0.5)
+        first_profile.save()
+        second_profile.save()
+
+        # Profiles that are only used to decide which steps to skip don't count as runs
+        CleaningStatisticsService.get_profile(ScraperSettings())
+
+        statistics = CleaningStatisticsService.get_profile(ScraperSettings()).statistics
+        self.assertEqual(2, statistics['runs'], 'run of the other process was lost')
+        self.assertEqual(2, statistics['steps']['remove_comments']['runs'], 'step run of the other process was lost')
+        self.assertEqual(5, statistics['steps']['remove_comments']['changed'], 'changed nodes were lost')
+
+    def test_skip_unchanged_steps(self):
+        settings_service.mock_catalog_settings({'step_skip_threshold': 2, 'step_verification_interval': 4})
+
+        skipped = []
+        for run in range(1, 6):
+            profile = CleaningStatisticsService.get_profile(ScraperSettings())
+            if profile.should_skip('remove_comments'):
+                profile.skip('remove_comments')
+                skipped.append(run)
+            else:
+                profile.record('remove_comments', 0, 0.1)
+            profile.save()
+
+        # Runs 1 and 2 build the streak, run 4 is a verification run
+        self.assertEqual([3, 5], skipped, 'unchanged step was not skipped')
+
+        step = profile.get_step('remove_comments')
+        self.assertEqual(2, step['skipped'], 'skipped runs were not counted')
+        self.assertAlmostEqual(0.2, step['saved_time'], msg='saved time was not estimated')
+
+    def test_verification_run_resets_streak(self):
+        settings_service.mock_catalog_settings({'step_skip_threshold': 1, 'step_verification_interval': 2})
+
+        profile = CleaningStatisticsService.get_profile(ScraperSettings())
+        profile.record('remove_comments', 0, 0.1)
+        profile.save()
+
+        profile = CleaningStatisticsService.get_profile(ScraperSettings())
+        self.assertTrue(profile.is_verification_run, 'second run was not a verification run')
+        self.assertFalse(profile.should_skip('remove_comments'), 'step was skipped on verification run')
+        profile.record('remove_comments', 1, 0.1)
+        profile.save()
+
+        profile = CleaningStatisticsService.get_profile(ScraperSettings())
+        self.assertFalse(profile.should_skip('remove_comments'), 'step that changed nodes was skipped')
+
+    def test_verification_run_without_threshold(self):
+        settings_service.mock_catalog_settings({'step_verification_interval': 1})
+
+        profile = CleaningStatisticsService.get_profile(ScraperSettings())
+        profile.record('remove_comments', 1, 0.1)
+
+        self.assertTrue(profile.is_verification_run, 'run was not a verification run')
+        self.assertFalse(profile.should_skip('remove_comments'), 'step was skipped without a threshold')
+
+    def test_clean_data_skips_unchanged_steps(self):
+        input_html = ('<html><body><div>'
+                      '<a>TEST</a>'
+                      '</div><!-- REMOVE ME --></body></html>')
+        settings_service.mock_catalog_settings({
+            'excluded_tags': [],
+            'invisible_tag_regex': [],
+            'whitelisted_attributes': [],
+            'flattened_tags': [],
+            'flattened_special_strings': [],
+            'punctuation_marks': [],
+            'redundant_punctuation_marks': [],
+            'empty_tags': [],
+            'step_skip_threshold': 1,
+        })
+
+        HtmlCleaner.clean_data(BeautifulSoup(input_html, 'html.parser'), ScraperSettings())
+        soup = HtmlCleaner.clean_data(BeautifulSoup(input_html, 'html.parser'), ScraperSettings())
+
+        statistics = CleaningStatisticsService.get_profile(ScraperSettings()).statistics
+        self.assertEqual(1, statistics['steps']['remove_empty_tags']['skipped'], 'unchanged step was not skipped')
+        self.assertEqual(0, statistics['steps']['remove_comments']['skipped'], 'changing step was skipped')
+        self.assertIsNotNone(soup.find(string='TEST'), 'content was removed')
+
+
+if __name__ == '__main__':
+    unittest.main()
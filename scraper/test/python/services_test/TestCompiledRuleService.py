@@ -0,0 +1,60 @@
+import unittest
+
+from scrapers.ScraperSettings import ScraperType
+from services import SettingsService, CompiledRuleService
+
+settings_service = SettingsService.service
+CompiledRuleService = CompiledRuleService.service
+
+attribute_rules = [
+    {
+        "name": "price",
+        "regex": "\\d+ eur",
+        "tags": ["text", "regex_driven", "ignore_case", "filtered"],
+        "filter_regex": "eur",
+        "required": True,
+        "conversions": [{"regex": "k", "multiplier": 1000}]
+    },
+    {
+        "name": "ad",
+        "regex": "sponsored",
+        "tags": ["text", "regex_driven", "anti_attribute"]
+    }
+]
+
+
+class CompiledRuleServiceTest(unittest.TestCase):
+    def test_rules_are_compiled_once_per_settings_version(self):
+        settings_service.mock_attribute_settings(attribute_rules)
+
+        compiled_rules = CompiledRuleService.get_rules(ScraperType.TEST)
+        self.assertIs(compiled_rules, CompiledRuleService.get_rules(ScraperType.TEST), 'rules were recompiled')
+        self.assertIs(compiled_rules[0], CompiledRuleService.get_rule(attribute_rules[0]),
+                      'compiled rule was not shared')
+
+        settings_service.mock_attribute_settings(list(attribute_rules))
+        self.assertIsNot(compiled_rules, CompiledRuleService.get_rules(ScraperType.TEST),
+                         'rules were not recompiled after settings update')
+
+    def test_compiled_rule(self):
+        settings_service.mock_attribute_settings(attribute_rules)
+        price_rule, ad_rule = CompiledRuleService.get_rules(ScraperType.TEST)
+
+        self.assertTrue(price_rule.required, 'required flag was not set')
+        self.assertTrue(ad_rule.anti_attribute, 'anti_attribute flag was not set')
+        self.assertIsNotNone(price_rule.value_regex.search('100 EUR'), 'ignore_case was not applied')
+        self.assertIsNone(ad_rule.value_regex.search('SPONSORED'), 'case sensitive rule ignored case')
+        self.assertIsNotNone(price_rule.label_regex.search('Price: $PRICE_LABEL$'), 'label regex did not match')
+
+    def test_regex_cache(self):
+        hit_count = CompiledRuleService.hit_count
+
+        pattern = CompiledRuleService.get_regex('test_regex_cache')
+        self.assertIs(pattern, CompiledRuleService.get_regex('test_regex_cache'), 'pattern was compiled again')
+        self.assertIsNot(pattern, CompiledRuleService.get_regex('test_regex_cache', True),
+                         'ignore_case pattern was shared')
+        self.assertEqual(hit_count + 1, CompiledRuleService.hit_count, 'cache hit was not counted')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from preprocessing import ValueTagger, AnnotationStore
+from scrapers.ScraperSettings import ScraperSettings
+from services import SettingsService, PersistentCacheService, RuleStatisticsService, CompiledRuleService
+
+settings_service = SettingsService.service
+CompiledRuleService = CompiledRuleService.service
+
+input_html = '<html><body><div><span>Price</span><p>1 000 EUR</p></div></body></html>'
+
+rules = [
+    {
+        "name": "price",
+        "regex": "\\d+ \\d+ EUR",
+        "tags": ["text", "regex_driven"]
+    },
+    {
+        "name": "mileage",
+        "regex": "\\d+ km",
+        "tags": ["text", "regex_driven"]
+    },
+    {
+        "name": "power",
+        "regex": "\\d+ kW",
+        "tags": ["text", "regex_driven", "labeled"],
+        "labels": ["Price"]
+    }
+]
+
+
+class RuleStatisticsServiceTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_folder = tempfile.TemporaryDirectory()
+        self.original_cache_folder = PersistentCacheService.CACHE_FOLDER
+        PersistentCacheService.CACHE_FOLDER = Path(self.cache_folder.name)
+
+    def tearDown(self):
+        PersistentCacheService.CACHE_FOLDER = self.original_cache_folder
+        self.cache_folder.cleanup()
+
+    def test_skip_unmatched_rules(self):
+        settings_service.set_settings({
+            'test_scraper_settings': {'rule_skip_threshold': 2, 'rule_verification_interval': 4},
+            'test_attribute_rules': rules
+        })
+        price_key, mileage_key, power_key = [compiled_rule.statistics_key for compiled_rule
+                                  in CompiledRuleService.get_rules(ScraperSettings().scraper_type)]
+
+        for run in range(5):
+            soup = ValueTagger.tag_values(BeautifulSoup(input_html, 'html.parser'), ScraperSettings())
+            annotations = AnnotationStore.get_store(soup)
+            self.assertEqual(['1 000 EUR'], annotations.get_values(soup.find('p'), 'price'), 'value was not tagged')
+
+        statistics = RuleStatisticsService.get_profile(ScraperSettings()).statistics
+        # Runs 1 and 2 build the streak, run 4 is a verification run
+        self.assertEqual(2, statistics['steps'][mileage_key]['skipped'], 'unmatched rule was not skipped')
+        self.assertEqual(3, statistics['steps'][mileage_key]['runs'], 'unmatched rule was not verified')
+        self.assertEqual(2, statistics['steps'][power_key]['skipped'], 'labels were counted as matches')
+        self.assertEqual(0, statistics['steps'][price_key]['skipped'], 'matched rule was skipped')
+        self.assertEqual(5, statistics['steps'][price_key]['changed'], 'matched values were not counted')
+
+    def test_rule_key_changes_with_rule(self):
+        first_rule = CompiledRuleService.get_rule({"name": "price", "regex": "\\d+", "tags": ["text"]})
+        second_rule = CompiledRuleService.get_rule({"name": "price", "regex": "\\d+ EUR", "tags": ["text"]})
+
+        self.assertNotEqual(first_rule.statistics_key, second_rule.statistics_key, 'edited rule kept its statistics')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+
+from services import PersistentCacheService, TableCacheService
+
+
+class TableCacheServiceTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_folder = tempfile.TemporaryDirectory()
+        self.original_cache_folder = PersistentCacheService.CACHE_FOLDER
+        PersistentCacheService.CACHE_FOLDER = Path(self.cache_folder.name)
+
+        self.tables = {'makes': ['BMW', 'Audi'], 'models': [('BMW', 'X5'), ('Audi', 'A4')],
+                       'prices': [('X5', Decimal('1.5'), date(2020, 1, 2))]}
+        self.loaded_tables = []
+        self.original_load_table = TableCacheService.load_table
+        TableCacheService.load_table = self.load_table
+
+    def tearDown(self):
+        TableCacheService.load_table = self.original_load_table
+        PersistentCacheService.CACHE_FOLDER = self.original_cache_folder
+        self.cache_folder.cleanup()
+
+    def load_table(self, table_name):
+        self.loaded_tables.append(table_name)
+        return list(self.tables[table_name])
+
+    def test_snapshot_is_shared(self):
+        service = TableCacheService.TableCacheService()
+        self.assertEqual(['BMW', 'Audi'], service.get_table_values('makes'), 'table values were not loaded')
+        self.assertEqual([('BMW', 'X5'), ('Audi', 'A4')], service.get_table_values('models'),
+                         'rows were not kept as tuples')
+        service.get_table_values('makes')
+
+        # A new process reads the snapshot instead of the database
+        worker_service = TableCacheService.TableCacheService()
+        self.assertEqual(['BMW', 'Audi'], worker_service.get_table_values('makes'), 'snapshot values differ')
+        self.assertEqual([('BMW', 'X5'), ('Audi', 'A4')], worker_service.get_table_values('models'),
+                         'snapshot values differ')
+        self.assertEqual(['makes', 'models'], self.loaded_tables, 'tables were loaded more than once')
+        self.assertIs(worker_service.snapshot.get(('table', 'makes')), worker_service.snapshot.get(('table', 'makes')),
+                      'snapshot entries were decoded more than once')
+
+    def test_value_types(self):
+        service = TableCacheService.TableCacheService()
+        service.get_table_values('prices')
+
+        worker_service = TableCacheService.TableCacheService()
+        self.assertEqual([('X5', Decimal('1.5'), date(2020, 1, 2))], worker_service.get_table_values('prices'),
+                         'database types were not preserved')
+
+    def test_snapshot_is_merged(self):
+        service = TableCacheService.TableCacheService()
+        worker_service = TableCacheService.TableCacheService()
+        service.get_table_values('makes')
+        worker_service.get_table_values('models')
+
+        snapshot_file_id = os.stat(TableCacheService.get_snapshot_path()).st_ino
+        service.save_snapshot({('table', 'makes'): ['BMW', 'Audi']})
+        self.assertEqual(snapshot_file_id, os.stat(TableCacheService.get_snapshot_path()).st_ino,
+                         'snapshot was written again without new entries')
+
+        other_service = TableCacheService.TableCacheService()
+        self.assertEqual([('BMW', 'X5'), ('Audi', 'A4')], other_service.get_table_values('models'),
+                         'entries of another process were lost')
+        self.assertEqual(['BMW', 'Audi'], other_service.get_table_values('makes'),
+                         'entries of another process were lost')
+        self.assertEqual(['makes', 'models'], self.loaded_tables, 'tables were loaded more than once')
+
+    def test_update_table_cache(self):
+        service = TableCacheService.TableCacheService()
+        worker_service = TableCacheService.TableCacheService()
+        service.get_table_values('makes')
+        worker_service.get_table_values('makes')
+        version = service.snapshot.version
+
+        service.update_table_cache()
+        self.assertEqual(version, service.snapshot.version, 'unchanged tables changed the version')
+
+        self.tables['makes'] = ['BMW', 'Audi', 'Skoda']
+        service.update_table_cache()
+
+        self.assertNotEqual(version, service.snapshot.version, 'version did not change')
+        self.assertEqual(['BMW', 'Audi', 'Skoda'], service.get_table_values('makes'), 'table was not refreshed')
+        self.assertEqual(['BMW', 'Audi', 'Skoda'], worker_service.get_table_values('makes'),
+                         'other process did not switch to the new snapshot')
+
+    def test_get_table_matcher(self):
+        service = TableCacheService.TableCacheService()
+        examples = service.get_table_values('makes')
+        matcher = service.get_table_matcher('makes', examples, ignore_case=True)
+        self.assertIs(matcher, service.get_table_matcher('makes', examples, ignore_case=True), 'matcher was not cached')
+
+        worker_service = TableCacheService.TableCacheService()
+        worker_service.check_snapshot()
+        key = ('matcher', 'makes', True, TableCacheService.get_fingerprint(examples))
+        self.assertIn(key, worker_service.snapshot.entries, 'matcher was not saved to the snapshot')
+
+        worker_matcher = worker_service.get_table_matcher('makes', worker_service.get_table_values('makes'), True)
+        self.assertEqual({1}, worker_matcher.find('audi a4'), 'matcher from the snapshot differs')
+
+
+if __name__ == '__main__':
+    unittest.main()